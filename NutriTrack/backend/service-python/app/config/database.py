@@ -1,7 +1,11 @@
-from pymongo import MongoClient
-from motor.motor_asyncio import AsyncIOMotorClient
+from typing import Dict, Optional
+import asyncio
 import os
+import threading
 from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient, monitoring
+from app.config.slow_queries import SlowQueryLog
 
 load_dotenv()
 
@@ -9,18 +13,201 @@ load_dotenv()
 MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017')
 MONGO_DB = os.getenv('MONGO_DB', 'nutrition_db')
 
-# Cliente síncrono para ETL
-sync_client = MongoClient(MONGO_URI)
-sync_db = sync_client[MONGO_DB]
-foods_collection = sync_db['foods']
 
-# Cliente asíncrono para API
-async_client = AsyncIOMotorClient(MONGO_URI)
-async_db = async_client[MONGO_DB]
-async_foods_collection = async_db['foods']
+def _env_int(name: str, default: Optional[int] = None) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+# Pool de conexiones (por cliente): mínimo abierto, máximo y espera por una conexión libre
+MONGO_MIN_POOL_SIZE = _env_int('MONGO_MIN_POOL_SIZE', 0)
+MONGO_MAX_POOL_SIZE = _env_int('MONGO_MAX_POOL_SIZE', 100)
+MONGO_WAIT_QUEUE_TIMEOUT_MS = _env_int('MONGO_WAIT_QUEUE_TIMEOUT_MS', 5000)
+MONGO_MAX_IDLE_TIME_MS = _env_int('MONGO_MAX_IDLE_TIME_MS')
+
+# Tiempo para encontrar un servidor disponible y para abrir una conexión
+MONGO_SERVER_SELECTION_TIMEOUT_MS = _env_int('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)
+MONGO_CONNECT_TIMEOUT_MS = _env_int('MONGO_CONNECT_TIMEOUT_MS', 5000)
+
+# Límite por operación (el driver lo envía al servidor como maxTimeMS); sin límite si no se define
+MONGO_TIMEOUT_MS = _env_int('MONGO_TIMEOUT_MS')
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """
+    Ocupación del pool de conexiones a partir de los eventos CMAP del driver
+
+    pymongo no expone el estado del pool, así que se cuentan las conexiones
+    abiertas, las prestadas a una operación y las peticiones esperando una
+    conexión libre. Los eventos llegan desde varios hilos (Motor usa un pool
+    de hilos), de ahí el candado.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.in_use = 0
+        self.waiting = 0
+        self.wait_timeouts = 0
+
+    def _add(self, field: str, delta: int) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + delta)
+
+    def connection_created(self, event):
+        self._add("open", 1)
+
+    def connection_closed(self, event):
+        self._add("open", -1)
+
+    def connection_check_out_started(self, event):
+        self._add("waiting", 1)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.waiting -= 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.wait_timeouts += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.waiting -= 1
+            self.in_use += 1
+
+    def connection_checked_in(self, event):
+        self._add("in_use", -1)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            open_, in_use, waiting, timeouts = self.open, self.in_use, self.waiting, self.wait_timeouts
+        return {
+            "min_pool_size": MONGO_MIN_POOL_SIZE,
+            "max_pool_size": MONGO_MAX_POOL_SIZE,
+            "open": open_,
+            "in_use": in_use,
+            "idle": max(open_ - in_use, 0),
+            "waiting": waiting,
+            "wait_queue_timeouts": timeouts,
+            "utilization": round(in_use / MONGO_MAX_POOL_SIZE, 3) if MONGO_MAX_POOL_SIZE else None
+        }
+
+
+async_pool_monitor = PoolMonitor()
+sync_pool_monitor = PoolMonitor()
+
+
+# Espera máxima (segundos) por un `explain` de la muestra de consultas lentas
+EXPLAIN_TIMEOUT = 10
+
+
+def _explain(database_name: str, command: dict) -> dict:
+    """
+    Plan de un comando (sin ejecutarlo), desde el hilo de SlowQueryLog
+
+    Se usa el cliente que ya esté abierto: en la API, el asíncrono (la
+    corrutina se envía a su bucle de eventos); en el ETL, el síncrono. Así
+    no se abre un segundo pool de conexiones solo para los `explain`.
+    """
+    explain = {"explain": command, "verbosity": "queryPlanner"}
+    with _lock:
+        async_client, loop, sync_client = _async_client, _async_loop, _sync_client
+    if async_client is not None and loop is not None and loop.is_running():
+        future = asyncio.run_coroutine_threadsafe(async_client[database_name].command(explain), loop)
+        try:
+            return future.result(timeout=EXPLAIN_TIMEOUT)
+        finally:
+            future.cancel()
+    if sync_client is not None:
+        return sync_client[database_name].command(explain)
+    raise RuntimeError("No hay ningún cliente abierto para pedir el plan")
+
+
+# Duración de todos los comandos y registro de las consultas lentas (ambos clientes)
+slow_query_log = SlowQueryLog(_explain)
+
+# Clientes creados bajo demanda: la API solo abre el asíncrono y el ETL solo el síncrono
+_sync_client: Optional[MongoClient] = None
+_async_client: Optional[AsyncIOMotorClient] = None
+# Bucle de eventos que usa el cliente asíncrono (para los `explain` desde otro hilo)
+_async_loop: Optional[asyncio.AbstractEventLoop] = None
+_lock = threading.Lock()
+
+
+def client_options() -> dict:
+    """Opciones comunes de los clientes (las no definidas quedan con el valor del driver)"""
+    options = {
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "timeoutMS": MONGO_TIMEOUT_MS
+    }
+    return {key: value for key, value in options.items() if value is not None}
+
+
+def get_sync_client() -> MongoClient:
+    """Cliente síncrono (ETL), creado en la primera llamada"""
+    global _sync_client
+    with _lock:
+        if _sync_client is None:
+            _sync_client = MongoClient(MONGO_URI, event_listeners=[sync_pool_monitor, slow_query_log], **client_options())
+        return _sync_client
+
+
+def get_async_client() -> AsyncIOMotorClient:
+    """Cliente asíncrono (API), creado en la primera llamada"""
+    global _async_client, _async_loop
+    with _lock:
+        if _async_client is None:
+            _async_client = AsyncIOMotorClient(MONGO_URI, event_listeners=[async_pool_monitor, slow_query_log], **client_options())
+        if _async_loop is None:
+            try:
+                _async_loop = asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+        return _async_client
+
 
 def get_database():
-    return sync_db
+    return get_sync_client()[MONGO_DB]
+
 
 def get_async_database():
-    return async_db
\ No newline at end of file
+    return get_async_client()[MONGO_DB]
+
+
+def get_foods_collection():
+    """Colección `foods` con el cliente síncrono"""
+    return get_database()['foods']
+
+
+def get_async_foods_collection():
+    """Colección `foods` con el cliente asíncrono"""
+    return get_async_database()['foods']
+
+
+def close_clients() -> None:
+    """Cerrar los clientes abiertos (al parar la API o al terminar el ETL)"""
+    global _sync_client, _async_client, _async_loop
+    with _lock:
+        for client in (_sync_client, _async_client):
+            if client is not None:
+                client.close()
+        _sync_client = _async_client = _async_loop = None
@@ -0,0 +1,272 @@
+"""
+Índices de la colección `foods` y comprobación de los planes de consulta
+
+Los índices se declaran en FOOD_INDEXES y se aplican al arrancar la API o
+desde la línea de comandos:
+
+    python -m app.config.indexes                # crear los que falten
+    python -m app.config.indexes --replace      # recrear los que tengan otra definición
+    python -m app.config.indexes --check        # además, explain() de cada consulta
+
+La comprobación ejecuta `explain` (sin ejecutar la consulta) para cada forma
+de consulta de `query_shapes()` y falla si el plan ganador recorre la colección
+entera (COLLSCAN).
+"""
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import PyMongoError
+from app.config.database import close_clients, get_async_foods_collection
+from app.config.slow_queries import winning_stages
+from app.models.food import NutrientFilter
+from app.services.food_service import FoodService
+from app.services.nutrition import NUTRIENT_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Comprobación de planes al arrancar: "off", "warn" (registrar los COLLSCAN) o "strict" (no arrancar)
+INDEX_PLAN_CHECK = os.getenv("INDEX_PLAN_CHECK", "warn").lower()
+
+# Índices de la colección `foods`
+FOOD_INDEXES: List[IndexModel] = [
+    # Único solo entre documentos con código no vacío (muchos productos no tienen)
+    IndexModel(
+        [("barcode", ASCENDING)],
+        name="barcode_unique",
+        unique=True,
+        partialFilterExpression={"barcode": {"$gt": ""}}
+    ),
+    # Productos de una fuente (importación incremental, borrado y marcado de desaparecidos)
+    IndexModel([("source", ASCENDING), ("barcode", ASCENDING)], name="source_barcode"),
+    # Cambios desde una fecha, en orden estable (sincronización del catálogo y exportación)
+    IndexModel([("updated_at", ASCENDING), ("_id", ASCENDING)], name="updated_at_id"),
+] + [
+    # Filtros por categoría con rango u orden por nutriente (igualdad, después rango)
+    IndexModel(
+        [("category", ASCENDING), (f"nutritional_info_per_100g.{field}", ASCENDING)],
+        name=f"category_{field}"
+    )
+    for field in NUTRIENT_FIELDS
+]
+
+# Opciones que forman parte de la definición de un índice
+_INDEX_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds", "collation")
+
+
+def _definition(spec: dict) -> Tuple:
+    """Claves y opciones de un índice, comparables entre IndexModel e index_information()"""
+    # El servidor puede devolver las direcciones como 1.0 si el índice se creó desde la shell
+    keys = tuple(
+        (field, int(direction) if isinstance(direction, float) else direction)
+        for field, direction in dict(spec["key"]).items()
+    )
+    options = tuple((option, spec[option]) for option in _INDEX_OPTIONS if spec.get(option))
+    return keys, options
+
+
+def plan_indexes(existing: Dict[str, dict]) -> Tuple[List[IndexModel], List[IndexModel]]:
+    """
+    Índices que faltan y los que existen con otra definición
+
+    `existing` es el resultado de `index_information()`. Un índice declarado
+    entra en conflicto si hay otro con su nombre pero con otras claves u
+    opciones, o con sus claves pero con otro nombre.
+    """
+    by_keys = {_definition(spec)[0]: name for name, spec in existing.items()}
+    missing, conflicting = [], []
+    for index in FOOD_INDEXES:
+        name = index.document["name"]
+        definition = _definition(index.document)
+        if name in existing:
+            if _definition(existing[name]) != definition:
+                conflicting.append(index)
+        elif definition[0] in by_keys:
+            conflicting.append(index)
+        else:
+            missing.append(index)
+    return missing, conflicting
+
+
+async def ensure_indexes(collection, replace: bool = False) -> None:
+    """
+    Crear los índices que falten (idempotente)
+
+    Los índices con otra definición solo se recrean con `replace`, porque
+    borrarlos deja las consultas sin índice mientras se construye el nuevo;
+    si no, se avisa. Un índice que no se puede crear no detiene el servicio.
+    """
+    try:
+        existing = await collection.index_information()
+    except PyMongoError as error:
+        logger.warning("No se pudieron leer los índices: %s", error)
+        return
+    missing, conflicting = plan_indexes(existing)
+
+    for index in conflicting:
+        name = index.document["name"]
+        if not replace:
+            logger.warning("El índice %s existe con otra definición (recrear con --replace)", name)
+            continue
+        keys = _definition(index.document)[0]
+        old = next((n for n, spec in existing.items() if n == name or _definition(spec)[0] == keys), name)
+        try:
+            await collection.drop_index(old)
+        except PyMongoError as error:
+            logger.warning("No se pudo borrar el índice %s: %s", old, error)
+            continue
+        missing.append(index)
+
+    for index in missing:
+        try:
+            await collection.create_indexes([index])
+            logger.info("Índice %s creado", index.document["name"])
+        except PyMongoError as error:
+            logger.warning("No se pudo crear el índice %s: %s", index.document["name"], error)
+
+
+def query_shapes(collection_name: str) -> List[Tuple[str, dict, Optional[str]]]:
+    """
+    Formas de consulta de FoodService (y del ETL) como comandos para `explain`
+
+    Cada entrada es (consulta, comando, motivo): las que tienen motivo leen
+    toda la colección a propósito y no cuentan como fallo. Los valores son
+    representativos; el plan depende de la forma, no de los valores. Los
+    filtros por nutriente sin categoría no aparecen: solo se resuelven en
+    memoria (mientras el índice se carga, la API responde 503).
+    """
+    object_id = ObjectId()
+    now = datetime.now()
+    category = "Lácteos"
+    with_category = NutrientFilter(category=category, min_protein=10, max_calories=120)
+    without_category = NutrientFilter(min_protein=10, max_calories=120)
+    text_match = FoodService._text_match("leche")
+    # Subcadena sin anclar y sin distinguir mayúsculas: ningún índice la acota
+    regex_scan = "búsqueda por subcadena (solo mientras se carga el índice en memoria)"
+
+    def find(filter: dict, sort: Optional[dict] = None) -> dict:
+        command = {"find": collection_name, "filter": filter}
+        if sort:
+            command["sort"] = sort
+        return command
+
+    def aggregate(pipeline: List[dict]) -> dict:
+        return {"aggregate": collection_name, "pipeline": pipeline, "cursor": {}}
+
+    return [
+        ("search_foods (MongoDB)", find(text_match), regex_scan),
+        ("search_foods (MongoDB, categoría y nutrientes)", aggregate(
+            [{"$match": text_match}] + FoodService._nutrient_pipeline(with_category, "-protein")
+        ), regex_scan),
+        ("search_foods (MongoDB, nutrientes)", aggregate(
+            [{"$match": text_match}] + FoodService._nutrient_pipeline(without_category, None)
+        ), regex_scan),
+        ("get_food_by_id", find({"_id": object_id}), None),
+        ("get_foods_by_ids / compute_nutrition", find({"_id": {"$in": [object_id]}}), None),
+        ("get_food_by_barcode", find({"barcode": "8480000000000"}), None),
+        ("get_foods_by_barcodes", find({"barcode": {"$in": ["8480000000000", "8410000000000"]}}), None),
+        ("get_foods (cursor)", find({"_id": {"$gt": object_id}}, {"_id": 1}), None),
+        ("get_foods (página) / export_foods", find({}, {"_id": 1}), None),
+        ("get_foods (categoría y nutrientes)", aggregate(
+            FoodService._nutrient_pipeline(with_category, "calories")
+        ), None),
+        ("get_foods (categoría)", aggregate(
+            FoodService._nutrient_pipeline(NutrientFilter(category=category), None)
+        ), None),
+        ("export_foods (since)", find({"updated_at": {"$gte": now}}, {"updated_at": 1, "_id": 1}), None),
+        ("get_categories", aggregate(
+            [{"$group": {"_id": "$category", "count": {"$sum": 1}}}]
+        ), "recuento de toda la colección (sin tabla de facetas)"),
+        ("catalog_sync.refresh", find({"updated_at": {"$gte": now}}), None),
+        ("catalog_sync.reload", find({}), "carga completa del catálogo"),
+        ("etl: cargar huellas", find({"source": "openfoodfacts", "barcode": {"$gt": ""}}), None),
+        ("etl: upsert por código", {"update": collection_name, "updates": [{
+            "q": {"barcode": "8480000000000", "source": "openfoodfacts"},
+            "u": {"$set": {"updated_at": now}},
+            "upsert": True
+        }]}, None),
+        ("etl: marcar desaparecidos", {"update": collection_name, "updates": [{
+            "q": {"source": "openfoodfacts", "barcode": {"$in": ["8480000000000"]}},
+            "u": {"$set": {"stale": True}},
+            "multi": True
+        }]}, None),
+        ("etl: borrar la fuente", {"delete": collection_name, "deletes": [{
+            "q": {"source": "openfoodfacts"}, "limit": 0
+        }]}, None)
+    ]
+
+
+async def verify_query_plans(collection) -> List[dict]:
+    """Plan ganador de cada forma de consulta (`collscan` indica un recorrido no esperado)"""
+    results = []
+    for name, command, full_scan in query_shapes(collection.name):
+        explain = await collection.database.command({"explain": command, "verbosity": "queryPlanner"})
+        stages = winning_stages(explain)
+        results.append({
+            "query": name,
+            "stages": stages,
+            "expected_full_scan": full_scan,
+            "collscan": "COLLSCAN" in stages and full_scan is None
+        })
+    return results
+
+
+async def check_query_plans(collection, strict: bool = False) -> List[dict]:
+    """
+    Comprobar los planes al arrancar
+
+    Cada COLLSCAN no esperado se registra como error; con `strict` además se
+    lanza RuntimeError para que el servicio no arranque.
+    """
+    try:
+        results = await verify_query_plans(collection)
+    except PyMongoError as error:
+        logger.warning("No se pudieron comprobar los planes de consulta: %s", error)
+        return []
+    failures = [result["query"] for result in results if result["collscan"]]
+    for name in failures:
+        logger.error("La consulta '%s' recorre toda la colección (COLLSCAN): falta un índice", name)
+    if failures and strict:
+        raise RuntimeError(f"Consultas sin índice: {', '.join(failures)}")
+    return results
+
+
+async def main(check: bool, replace: bool) -> int:
+    collection = get_async_foods_collection()
+    try:
+        await ensure_indexes(collection, replace)
+        for name, spec in sorted((await collection.index_information()).items()):
+            keys = ", ".join(f"{field} {direction}" for field, direction in spec["key"])
+            print(f"   • {name}: {keys}")
+        if not check:
+            return 0
+
+        print("\nPlanes de consulta")
+        results = await verify_query_plans(collection)
+        for result in results:
+            plan = " > ".join(reversed(result["stages"]))
+            mark = "❌" if result["collscan"] else "✅"
+            note = f"   ({result['expected_full_scan']})" if result["expected_full_scan"] else ""
+            print(f"   {mark} {result['query']:<48} {plan}{note}")
+        failures = sum(1 for result in results if result["collscan"])
+        if failures:
+            print(f"\n❌ {failures} consultas recorren toda la colección (COLLSCAN)")
+            return 1
+        print("\n✅ Ninguna consulta recorre toda la colección")
+        return 0
+    finally:
+        close_clients()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crear los índices de `foods` y comprobar los planes")
+    parser.add_argument("--check", action="store_true", help="Comprobar con explain() que ninguna consulta hace COLLSCAN")
+    parser.add_argument("--replace", action="store_true", help="Recrear los índices con otra definición")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    sys.exit(asyncio.run(main(args.check, args.replace)))
@@ -0,0 +1,349 @@
+"""
+Registro de consultas lentas a partir de los eventos de comandos del driver
+
+Cada comando enviado a MongoDB pasa por SlowQueryLog (un CommandListener de
+pymongo, registrado en los dos clientes de `app.config.database`). Se
+acumula la duración por tipo de comando y los que superan SLOW_QUERY_MS se
+guardan en memoria (los últimos SLOW_QUERY_LOG_SIZE) y se escriben en el
+logger `slow_queries` como una línea JSON, con la forma del filtro (sin
+valores), el método que hizo la consulta y, para una muestra, el plan de
+`explain`.
+"""
+from typing import Callable, Dict, List, Optional
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from datetime import datetime
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from pymongo import monitoring
+
+logger = logging.getLogger("slow_queries")
+
+# Umbral (ms) a partir del cual un comando se registra como lento
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+
+# Entradas que se conservan en memoria para /debug/slow-queries
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "200"))
+
+# Fracción de consultas lentas de las que se pide el plan, y espera mínima
+# (segundos) entre dos `explain` de la misma forma de consulta
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", "0.1"))
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "60"))
+
+# Formas de consulta cuyo último `explain` se recuerda (las menos recientes se olvidan)
+SLOW_QUERY_EXPLAIN_SHAPES = int(os.getenv("SLOW_QUERY_EXPLAIN_SHAPES", "1000"))
+
+# Comandos que admiten `explain`
+EXPLAINABLE = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+
+# Campos de sesión, transacción y lectura que no forman parte de la consulta
+_SESSION_FIELDS = {
+    "lsid", "txnNumber", "autocommit", "startTransaction", "readConcern",
+    "writeConcern", "apiVersion", "apiStrict", "apiDeprecationErrors"
+}
+
+# Claves cuyo valor es estructura (campos y dirección), no datos
+_STRUCTURAL = {"sort", "$sort", "projection", "$project"}
+
+# Método que está consultando MongoDB (lo fija record_caller; Motor copia el
+# contexto al hilo que ejecuta la operación)
+query_caller: ContextVar[Optional[str]] = ContextVar("query_caller", default=None)
+
+# Ficheros propios del servicio, para buscar el origen en la pila (cliente síncrono)
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_OWN_DIRS = tuple(os.path.join(_ROOT, name) + os.sep for name in ("app", "etl"))
+_CONFIG_DIR = os.path.join(_ROOT, "app", "config") + os.sep
+
+
+def redact(value, key: Optional[str] = None):
+    """
+    Forma de un filtro o etapa de agregación con los valores sustituidos por "?"
+
+    Se conservan los nombres de campo, los operadores y las rutas (`$campo`);
+    una lista de valores (`$in`) queda como ["?"] sea cual sea su longitud.
+    """
+    if key in _STRUCTURAL:
+        return value
+    if isinstance(value, dict):
+        return {k: redact(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        if all(not isinstance(item, (dict, list, tuple)) for item in value):
+            return ["?"] if value else []
+        return [redact(item) for item in value]
+    if isinstance(value, str) and value.startswith("$"):
+        return value
+    return "?"
+
+
+def command_shape(command_name: str, command: dict) -> dict:
+    """Forma del comando: colección y filtro o pipeline sin valores"""
+    shape = {"command": command_name, "collection": command.get(command_name)}
+    if command_name == "find":
+        shape["filter"] = redact(command.get("filter", {}))
+        if "sort" in command:
+            shape["sort"] = dict(command["sort"])
+    elif command_name == "aggregate":
+        shape["pipeline"] = [redact(stage) for stage in command.get("pipeline", [])]
+    elif command_name in ("count", "distinct", "findAndModify"):
+        shape["filter"] = redact(command.get("query", {}))
+    elif command_name in ("update", "delete"):
+        statements = command.get("updates" if command_name == "update" else "deletes") or [{}]
+        shape["filter"] = redact(statements[0].get("q", {}))
+        shape["statements"] = len(statements)
+    elif command_name == "insert":
+        shape["documents"] = len(command.get("documents", []))
+    elif command_name == "getMore":
+        shape["collection"] = command.get("collection")
+    return shape
+
+
+def winning_stages(explain: dict) -> List[str]:
+    """
+    Etapas de los planes ganadores de una respuesta de `explain`
+
+    Los planes aparecen en `queryPlanner.winningPlan` (find), dentro de
+    `$cursor` (agregaciones) o por shard; con el motor SBE el árbol está en
+    `winningPlan.queryPlan`. Se recorre todo buscando `winningPlan`.
+    """
+    stages = []
+
+    def collect(node) -> None:
+        if isinstance(node, dict):
+            if "stage" in node:
+                stages.append(node["stage"])
+            for value in node.values():
+                collect(value)
+        elif isinstance(node, list):
+            for value in node:
+                collect(value)
+
+    def find_plans(node) -> None:
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key == "winningPlan":
+                    collect(value)
+                else:
+                    find_plans(value)
+        elif isinstance(node, list):
+            for value in node:
+                find_plans(value)
+
+    find_plans(explain)
+    return stages
+
+
+def _index_names(node) -> List[str]:
+    """Índices usados por un plan"""
+    if isinstance(node, dict):
+        names = [node["indexName"]] if "indexName" in node else []
+        for value in node.values():
+            names += [name for name in _index_names(value) if name not in names]
+        return names
+    if isinstance(node, list):
+        return [name for value in node for name in _index_names(value)]
+    return []
+
+
+def summarize_explain(explain: dict) -> dict:
+    """Etapas e índices del plan ganador (sin los límites de índice, que llevan valores)"""
+    return {"stages": winning_stages(explain), "indexes": _index_names(explain)}
+
+
+def record_caller(cls):
+    """
+    Decorador de clase: anota el método público que consulta MongoDB
+
+    Envuelve los métodos asíncronos (corrutinas y generadores) para fijar
+    `query_caller` a `Clase.método` mientras se ejecutan.
+    """
+    for name, attribute in list(vars(cls).items()):
+        if name.startswith("_"):
+            continue
+        static = isinstance(attribute, staticmethod)
+        function = attribute.__func__ if static else attribute
+        label = f"{cls.__name__}.{name}"
+        if inspect.iscoroutinefunction(function):
+            wrapper = _coroutine_wrapper(function, label)
+        elif inspect.isasyncgenfunction(function):
+            wrapper = _generator_wrapper(function, label)
+        else:
+            continue
+        setattr(cls, name, staticmethod(wrapper) if static else wrapper)
+    return cls
+
+
+def _coroutine_wrapper(function, label: str):
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        token = query_caller.set(label)
+        try:
+            return await function(*args, **kwargs)
+        finally:
+            query_caller.reset(token)
+    return wrapper
+
+
+def _generator_wrapper(function, label: str):
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        token = query_caller.set(label)
+        try:
+            async for item in function(*args, **kwargs):
+                yield item
+        finally:
+            try:
+                query_caller.reset(token)
+            except ValueError:
+                # El generador se cerró desde otro contexto (recolector de basura)
+                pass
+    return wrapper
+
+
+def _caller_from_stack() -> Optional[str]:
+    """Primera función del servicio en la pila (solo sirve con el cliente síncrono)"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_OWN_DIRS) and not filename.startswith(_CONFIG_DIR):
+            module = os.path.relpath(filename, _ROOT)
+            return f"{module}:{frame.f_code.co_qualname}"
+        frame = frame.f_back
+    return None
+
+
+class SlowQueryLog(monitoring.CommandListener):
+    """
+    Duración de cada comando y registro de los que superan SLOW_QUERY_MS
+
+    Los eventos llegan desde los hilos que ejecutan las operaciones, así que
+    el trabajo aquí es mínimo: guardar el comando al empezar y, si resulta
+    lento, su forma. Los `explain` de la muestra se piden desde un hilo
+    aparte con `explain(database, command)`, para no retrasar la consulta.
+    """
+
+    def __init__(self, explain: Callable[[str, dict], dict]):
+        self.explain = explain
+        self._lock = threading.Lock()
+        self._started: Dict[tuple, tuple] = {}
+        self._entries: deque = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+        self._commands: Dict[str, Dict[str, float]] = {}
+        # Forma -> último `explain`, en orden de uso (LRU de SLOW_QUERY_EXPLAIN_SHAPES)
+        self._explained: "OrderedDict[str, float]" = OrderedDict()
+        self._explain_queue: queue.Queue = queue.Queue(maxsize=16)
+        self._worker: Optional[threading.Thread] = None
+
+    def started(self, event):
+        if event.command_name == "explain":
+            return
+        self._started[(event.connection_id, event.request_id)] = (
+            event.command, event.database_name, query_caller.get()
+        )
+
+    def succeeded(self, event):
+        self._finished(event, None)
+
+    def failed(self, event):
+        self._finished(event, str(event.failure.get("errmsg", event.failure)))
+
+    def _finished(self, event, error: Optional[str]) -> None:
+        started = self._started.pop((event.connection_id, event.request_id), None)
+        if started is None:
+            return
+        duration_ms = event.duration_micros / 1000
+        slow = duration_ms >= SLOW_QUERY_MS
+        with self._lock:
+            counters = self._commands.setdefault(
+                event.command_name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "slow": 0}
+            )
+            counters["count"] += 1
+            counters["total_ms"] += duration_ms
+            counters["max_ms"] = max(counters["max_ms"], duration_ms)
+            counters["slow"] += slow
+        if not slow:
+            return
+
+        command, database_name, caller = started
+        entry = {
+            "time": datetime.now().isoformat(timespec="milliseconds"),
+            "duration_ms": round(duration_ms, 2),
+            "caller": caller or _caller_from_stack(),
+            **command_shape(event.command_name, command)
+        }
+        if error:
+            entry["error"] = error
+        with self._lock:
+            self._entries.append(entry)
+        if not (event.command_name in EXPLAINABLE and self._sample(entry)):
+            logger.warning(json.dumps(entry, ensure_ascii=False, default=str))
+            return
+        explainable = {key: value for key, value in command.items()
+                       if key not in _SESSION_FIELDS and not key.startswith("$")}
+        try:
+            self._explain_queue.put_nowait((entry, database_name, explainable))
+        except queue.Full:
+            logger.warning(json.dumps(entry, ensure_ascii=False, default=str))
+            return
+        self._start_worker()
+
+    def _sample(self, entry: dict) -> bool:
+        """Si se pide el plan: con probabilidad SLOW_QUERY_EXPLAIN_RATE y una vez por intervalo y forma"""
+        if random.random() >= SLOW_QUERY_EXPLAIN_RATE:
+            return False
+        key = json.dumps({k: v for k, v in entry.items() if k not in ("time", "duration_ms")},
+                         sort_keys=True, default=str)
+        now = time.monotonic()
+        with self._lock:
+            if now - self._explained.get(key, float("-inf")) < SLOW_QUERY_EXPLAIN_INTERVAL:
+                self._explained.move_to_end(key)
+                return False
+            self._explained[key] = now
+            self._explained.move_to_end(key)
+            if len(self._explained) > SLOW_QUERY_EXPLAIN_SHAPES:
+                self._explained.popitem(last=False)
+        return True
+
+    def _start_worker(self) -> None:
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._explain_loop, name="slow-query-explain", daemon=True)
+                self._worker.start()
+
+    def _explain_loop(self) -> None:
+        while True:
+            entry, database_name, command = self._explain_queue.get()
+            try:
+                entry["explain"] = summarize_explain(self.explain(database_name, command))
+            except Exception as error:
+                entry["explain"] = {"error": str(error)}
+            logger.warning(json.dumps(entry, ensure_ascii=False, default=str))
+
+    def recent(self, limit: int) -> List[dict]:
+        """Últimas consultas lentas, de la más reciente a la más antigua"""
+        with self._lock:
+            entries = list(self._entries)[-limit:] if limit > 0 else []
+        return [dict(entry) for entry in reversed(entries)]
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            commands = {
+                name: {
+                    "count": int(counters["count"]),
+                    "slow": int(counters["slow"]),
+                    "avg_ms": round(counters["total_ms"] / counters["count"], 2),
+                    "max_ms": round(counters["max_ms"], 2)
+                }
+                for name, counters in sorted(self._commands.items())
+            }
+        return {
+            "threshold_ms": SLOW_QUERY_MS,
+            "explain_sample_rate": SLOW_QUERY_EXPLAIN_RATE,
+            "commands": commands
+        }
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict
+from typing import Any, Optional, List, Dict, Literal, Tuple
 from datetime import datetime
 
 class Portion(BaseModel):
@@ -218,6 +218,16 @@ class FoodSearchResponse(BaseModel):
         ...,
         description="Lista de porciones disponibles"
     )
+    score: Optional[float] = Field(
+        None,
+        description="Puntuación de relevancia (solo con sort=relevance)",
+        example=7.42
+    )
+    distance: Optional[float] = Field(
+        None,
+        description="Distancia entre perfiles nutricionales (solo en alimentos similares)",
+        example=0.38
+    )
     
     class Config:
         json_schema_extra = {
@@ -239,3 +249,451 @@ class FoodSearchResponse(BaseModel):
                 ]
             }
         }
+
+
+class FoodSuggestion(BaseModel):
+    """
+    Sugerencia de autocompletado
+
+    Solo contiene lo imprescindible para pintar la lista mientras el usuario
+    escribe; el detalle se pide después con el ID.
+    """
+    id: str = Field(
+        ...,
+        description="ID único del alimento"
+    )
+    display_name: str = Field(
+        ...,
+        description="Nombre a mostrar (incluye la marca si existe)",
+        example="Yogur natural (Danone)"
+    )
+
+
+class CategoryCount(BaseModel):
+    """
+    Categoría con el número de alimentos que contiene
+    """
+    category: str = Field(
+        ...,
+        description="Nombre de la categoría",
+        example="Lácteos"
+    )
+    count: int = Field(
+        ...,
+        description="Número de alimentos de la categoría",
+        example=42
+    )
+
+
+# Campos de Food que se pueden pedir como proyección
+FoodField = Literal[
+    "name", "brand", "category", "nutritional_info_per_100g", "portions",
+    "barcode", "source", "created_at", "updated_at"
+]
+
+class FoodBatchRequest(BaseModel):
+    """
+    Petición de varios alimentos por ID en una sola llamada
+    """
+    ids: List[str] = Field(
+        ...,
+        description="IDs de los alimentos (ObjectId); se devuelven en el mismo orden",
+        min_length=1,
+        max_length=500,
+        example=["507f1f77bcf86cd799439011", "507f1f77bcf86cd799439012"]
+    )
+    fields: Optional[List[FoodField]] = Field(
+        None,
+        description="Campos a devolver de cada alimento (por defecto, todos)",
+        example=["name", "nutritional_info_per_100g"]
+    )
+
+class FoodBatchResponse(BaseModel):
+    """
+    Resultado de una búsqueda de alimentos por lote
+
+    `foods` respeta el orden de la petición y contiene null en las posiciones
+    cuyo ID no existe o no es válido.
+    """
+    foods: List[Optional[Dict[str, Any]]] = Field(
+        ...,
+        description="Alimentos en el orden de la petición (null si no se encontró)"
+    )
+    missing: List[str] = Field(
+        default=[],
+        description="IDs válidos que no existen en el catálogo"
+    )
+    invalid: List[str] = Field(
+        default=[],
+        description="IDs con formato incorrecto (no son ObjectId)"
+    )
+
+
+class BarcodeLookupRequest(BaseModel):
+    """
+    Lista de códigos de barras escaneados (por ejemplo, un ticket de compra)
+    """
+    codes: List[str] = Field(
+        ...,
+        description="Códigos EAN-8, UPC-A o EAN-13",
+        min_length=1,
+        max_length=500,
+        example=["8480000123456", "5449000000996"]
+    )
+
+class BarcodeResult(BaseModel):
+    """
+    Resultado de la búsqueda de un código de barras
+    """
+    code: str = Field(
+        ...,
+        description="Código tal y como se recibió"
+    )
+    barcode: Optional[str] = Field(
+        None,
+        description="Código normalizado (EAN-8 o EAN-13); null si no es válido"
+    )
+    found: bool = Field(
+        ...,
+        description="Si existe un alimento con ese código"
+    )
+    food: Optional[Food] = Field(
+        None,
+        description="Alimento encontrado"
+    )
+    error: Optional[str] = Field(
+        None,
+        description="Motivo por el que el código no es válido"
+    )
+
+class BarcodeLookupResponse(BaseModel):
+    """
+    Resultados de una búsqueda de códigos de barras por lote, en el orden pedido
+    """
+    results: List[BarcodeResult] = Field(
+        ...,
+        description="Un resultado por código pedido"
+    )
+    hits: int = Field(
+        ...,
+        description="Códigos encontrados"
+    )
+    misses: int = Field(
+        ...,
+        description="Códigos válidos no encontrados o inválidos"
+    )
+
+
+class NutritionItem(BaseModel):
+    """
+    Elemento a calcular: un alimento con una porción o una cantidad en gramos
+
+    Si no se indica ni porción ni gramos se calculan 100 g.
+    """
+    food_id: str = Field(
+        ...,
+        description="ID del alimento",
+        example="507f1f77bcf86cd799439011"
+    )
+    portion: Optional[str] = Field(
+        None,
+        description="Nombre de una de las porciones del alimento",
+        example="unidad"
+    )
+    grams: Optional[float] = Field(
+        None,
+        description="Cantidad en gramos (si no se indica porción)",
+        example=150,
+        gt=0
+    )
+    quantity: float = Field(
+        1,
+        description="Número de porciones (o multiplicador de los gramos)",
+        example=2,
+        gt=0
+    )
+
+class NutritionComputeRequest(BaseModel):
+    """
+    Lista de elementos (por ejemplo, una semana de diario) a calcular de una vez
+    """
+    items: List[NutritionItem] = Field(
+        ...,
+        description="Elementos a calcular",
+        min_length=1,
+        max_length=5000
+    )
+
+class NutritionItemResult(BaseModel):
+    """
+    Nutrientes calculados para un elemento de la petición
+    """
+    food_id: str = Field(
+        ...,
+        description="ID del alimento"
+    )
+    name: Optional[str] = Field(
+        None,
+        description="Nombre del alimento"
+    )
+    grams: float = Field(
+        ...,
+        description="Gramos totales del elemento"
+    )
+    nutrients: Optional[NutritionalInfo] = Field(
+        None,
+        description="Nutrientes del elemento; null si hubo un error"
+    )
+    error: Optional[str] = Field(
+        None,
+        description="Motivo por el que no se pudo calcular"
+    )
+
+class NutritionComputeResponse(BaseModel):
+    """
+    Nutrientes por elemento (en el orden de la petición) y totales
+    """
+    items: List[NutritionItemResult] = Field(
+        ...,
+        description="Resultado por elemento"
+    )
+    totals: NutritionalInfo = Field(
+        ...,
+        description="Suma de los elementos calculados correctamente"
+    )
+
+class NutrientFilter(BaseModel):
+    """
+    Filtros por categoría y por rango de nutrientes (valores por 100g)
+
+    Se reciben como parámetros de consulta, por ejemplo
+    `?category=Lácteos&min_protein=10&max_calories=120`.
+    """
+    category: Optional[str] = Field(
+        None,
+        description="Categoría exacta del alimento",
+        example="Lácteos"
+    )
+    min_calories: Optional[float] = Field(
+        None,
+        description="Calorías (kcal) mínimas por 100g",
+        ge=0
+    )
+    max_calories: Optional[float] = Field(
+        None,
+        description="Calorías (kcal) máximas por 100g",
+        ge=0
+    )
+    min_protein: Optional[float] = Field(
+        None,
+        description="Proteínas (g) mínimas por 100g",
+        ge=0
+    )
+    max_protein: Optional[float] = Field(
+        None,
+        description="Proteínas (g) máximas por 100g",
+        ge=0
+    )
+    min_carbohydrates: Optional[float] = Field(
+        None,
+        description="Carbohidratos (g) mínimos por 100g",
+        ge=0
+    )
+    max_carbohydrates: Optional[float] = Field(
+        None,
+        description="Carbohidratos (g) máximos por 100g",
+        ge=0
+    )
+    min_fat: Optional[float] = Field(
+        None,
+        description="Grasas (g) mínimas por 100g",
+        ge=0
+    )
+    max_fat: Optional[float] = Field(
+        None,
+        description="Grasas (g) máximas por 100g",
+        ge=0
+    )
+    min_fiber: Optional[float] = Field(
+        None,
+        description="Fibra (g) mínima por 100g",
+        ge=0
+    )
+    max_fiber: Optional[float] = Field(
+        None,
+        description="Fibra (g) máxima por 100g",
+        ge=0
+    )
+    min_sugar: Optional[float] = Field(
+        None,
+        description="Azúcares (g) mínimos por 100g",
+        ge=0
+    )
+    max_sugar: Optional[float] = Field(
+        None,
+        description="Azúcares (g) máximos por 100g",
+        ge=0
+    )
+    min_sodium: Optional[float] = Field(
+        None,
+        description="Sodio (mg) mínimo por 100g",
+        ge=0
+    )
+    max_sodium: Optional[float] = Field(
+        None,
+        description="Sodio (mg) máximo por 100g",
+        ge=0
+    )
+
+    def ranges(self) -> Dict[str, Tuple[Optional[float], Optional[float]]]:
+        """Rangos (mínimo, máximo) de los nutrientes filtrados"""
+        ranges = {}
+        for field in NutritionalInfo.model_fields:
+            low = getattr(self, f"min_{field}")
+            high = getattr(self, f"max_{field}")
+            if low is not None or high is not None:
+                ranges[field] = (low, high)
+        return ranges
+
+    def is_active(self) -> bool:
+        return self.category is not None or bool(self.ranges())
+
+    def cache_key(self) -> tuple:
+        return tuple(sorted(self.model_dump(exclude_none=True).items()))
+
+class MealPlanRequest(BaseModel):
+    """
+    Objetivo de calorías y macronutrientes para una comida
+    """
+    calories: float = Field(
+        ...,
+        description="Calorías objetivo (kcal)",
+        example=600,
+        gt=0
+    )
+    protein: Optional[float] = Field(
+        None,
+        description="Proteínas objetivo (g)",
+        example=40,
+        gt=0
+    )
+    carbohydrates: Optional[float] = Field(
+        None,
+        description="Carbohidratos objetivo (g)",
+        gt=0
+    )
+    fat: Optional[float] = Field(
+        None,
+        description="Grasas objetivo (g)",
+        gt=0
+    )
+    tolerance: float = Field(
+        0.1,
+        description="Desviación relativa admitida en cada objetivo (0.1 = ±10%)",
+        ge=0.01,
+        le=0.5
+    )
+    categories: Optional[List[str]] = Field(
+        None,
+        description="Limitar a alimentos de estas categorías",
+        example=["Carnes", "Cereales", "Verduras"]
+    )
+    max_items: int = Field(
+        3,
+        description="Número máximo de alimentos en la combinación",
+        ge=1,
+        le=5
+    )
+    time_budget_ms: int = Field(
+        200,
+        description="Tiempo máximo de búsqueda en milisegundos",
+        ge=10,
+        le=2000
+    )
+
+    def targets(self) -> Dict[str, float]:
+        """Objetivos indicados, por nutriente"""
+        fields = ("calories", "protein", "carbohydrates", "fat")
+        return {field: getattr(self, field) for field in fields if getattr(self, field) is not None}
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "calories": 600,
+                "protein": 40,
+                "tolerance": 0.1,
+                "categories": ["Carnes", "Cereales", "Verduras"],
+                "max_items": 3,
+                "time_budget_ms": 200
+            }
+        }
+
+class MealPlanItem(BaseModel):
+    """
+    Alimento y porción propuestos
+    """
+    food_id: str = Field(
+        ...,
+        description="ID del alimento"
+    )
+    name: str = Field(
+        ...,
+        description="Nombre del alimento",
+        example="Pechuga de pollo"
+    )
+    portion: str = Field(
+        ...,
+        description="Nombre de la porción",
+        example="unidad"
+    )
+    quantity: float = Field(
+        ...,
+        description="Número de porciones",
+        example=1
+    )
+    grams: float = Field(
+        ...,
+        description="Gramos totales",
+        example=150
+    )
+
+class MealPlanResponse(BaseModel):
+    """
+    Mejor combinación encontrada y datos de la búsqueda
+    """
+    items: List[MealPlanItem] = Field(
+        ...,
+        description="Alimentos propuestos (vacío si no se encontró ninguna combinación)"
+    )
+    totals: NutritionalInfo = Field(
+        ...,
+        description="Nutrientes totales de la combinación"
+    )
+    error: Optional[float] = Field(
+        None,
+        description="Mayor desviación relativa respecto a los objetivos",
+        example=0.03
+    )
+    within_tolerance: bool = Field(
+        ...,
+        description="Si todos los objetivos se cumplen dentro de la tolerancia"
+    )
+    solve_time_ms: float = Field(
+        ...,
+        description="Tiempo de resolución en milisegundos",
+        example=48.2
+    )
+    candidates_considered: int = Field(
+        ...,
+        description="Combinaciones evaluadas",
+        example=66425
+    )
+    pool_size: int = Field(
+        ...,
+        description="Opciones (alimento, porción, cantidad) preseleccionadas",
+        example=150
+    )
+    timed_out: bool = Field(
+        ...,
+        description="Si se agotó el tiempo antes de terminar la búsqueda"
+    )
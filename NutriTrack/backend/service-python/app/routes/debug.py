@@ -0,0 +1,136 @@
+from fastapi import APIRouter, Query
+from app.config.database import slow_query_log
+from app.services.cache import search_cache
+from app.services.catalog_snapshot import CATALOG_SNAPSHOT_ENABLED, catalog_snapshot
+from app.services.singleflight import food_singleflight
+
+router = APIRouter(prefix="/debug", tags=["debug"])
+
+@router.get(
+    "/search-cache",
+    summary="Estadísticas de la caché de búsqueda",
+    description="Contadores de aciertos, fallos y expulsiones de la caché de /api/foods/search",
+    response_description="Estado actual de la caché"
+)
+async def get_search_cache_stats():
+    """
+    ## Estadísticas de la Caché de Búsqueda
+    
+    Permite dimensionar la caché (`SEARCH_CACHE_SIZE`, `SEARCH_CACHE_TTL`).
+    
+    ### Respuesta:
+    - **size** / **maxsize**: Entradas ocupadas y capacidad
+    - **ttl_seconds**: Caducidad de cada entrada
+    - **hits** / **misses** / **hit_ratio**: Aciertos y fallos acumulados
+    - **evictions**: Entradas expulsadas por LRU al llenarse
+    - **expirations**: Entradas descartadas por caducidad
+    - **invalidations**: Vaciados por cambios en el catálogo
+    """
+    return search_cache.stats()
+
+@router.get(
+    "/singleflight",
+    summary="Estadísticas de agrupación de consultas",
+    description="Consultas a MongoDB ejecutadas frente a llamadas que reutilizaron una en curso",
+    response_description="Contadores de single-flight"
+)
+async def get_singleflight_stats():
+    """
+    ## Estadísticas de Single-Flight
+    
+    Las llamadas idénticas y simultáneas de `FoodService` (búsqueda sin índice
+    y obtención por ID) comparten una única consulta a MongoDB.
+    
+    ### Respuesta:
+    - **in_flight**: Consultas en curso ahora mismo
+    - **executions**: Consultas realmente ejecutadas
+    - **shared**: Llamadas que esperaron una consulta ya en curso
+    """
+    return food_singleflight.stats()
+
+@router.get(
+    "/catalog-snapshot",
+    summary="Estado de la instantánea del catálogo",
+    description="Memoria ocupada por la copia columnar del catálogo (CATALOG_SNAPSHOT=true)",
+    response_description="Huella de memoria y extrapolación a 100.000 alimentos"
+)
+async def get_catalog_snapshot_stats():
+    """
+    ## Instantánea del Catálogo
+    
+    Con `CATALOG_SNAPSHOT=true` la obtención por ID y el listado se sirven
+    desde una copia columnar en memoria en lugar de MongoDB, y los
+    resultados de búsqueda y similares se leen de ella en lugar de guardar
+    los documentos completos en el índice de búsqueda.
+    
+    ### Respuesta:
+    - **enabled** / **ready**: Si está activada y cargada
+    - **foods**: Alimentos en la instantánea
+    - **bytes**: Memoria aproximada por componente
+    - **bytes_per_100k_foods**: Extrapolación a 100.000 alimentos
+    """
+    stats = {"enabled": CATALOG_SNAPSHOT_ENABLED, "ready": catalog_snapshot.ready}
+    if catalog_snapshot.ready:
+        stats.update(catalog_snapshot.memory_footprint())
+    return stats
+
+@router.get(
+    "/slow-queries",
+    summary="Consultas lentas a MongoDB",
+    description="Últimos comandos que superaron SLOW_QUERY_MS, con la forma del filtro y el plan de una muestra",
+    response_description="Duración por tipo de comando y consultas lentas recientes",
+    responses={
+        200: {
+            "description": "Registro de consultas lentas",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "threshold_ms": 100.0,
+                        "explain_sample_rate": 0.1,
+                        "commands": {
+                            "find": {"count": 1520, "slow": 3, "avg_ms": 4.12, "max_ms": 310.5}
+                        },
+                        "entries": [
+                            {
+                                "time": "2024-01-15T10:30:00.123",
+                                "duration_ms": 310.5,
+                                "caller": "FoodService.search_foods",
+                                "command": "find",
+                                "collection": "foods",
+                                "filter": {"$or": [{"name": "?"}, {"brand": "?"}, {"category": "?"}]},
+                                "explain": {"stages": ["LIMIT", "FETCH", "OR", "IXSCAN", "IXSCAN", "IXSCAN"],
+                                            "indexes": ["name", "brand", "category_calories"]}
+                            }
+                        ]
+                    }
+                }
+            }
+        }
+    }
+)
+async def get_slow_queries(
+    limit: int = Query(
+        50,
+        description="Número de consultas lentas a devolver (las más recientes primero)",
+        ge=1,
+        le=1000
+    )
+):
+    """
+    ## Consultas Lentas
+    
+    Todos los comandos enviados a MongoDB se miden con los eventos del
+    driver; los que tardan más de `SLOW_QUERY_MS` se guardan (los últimos
+    `SLOW_QUERY_LOG_SIZE`) y se escriben en el logger `slow_queries`.
+    
+    ### Respuesta:
+    - **threshold_ms**: Umbral de consulta lenta
+    - **explain_sample_rate**: Fracción de consultas lentas con plan (`SLOW_QUERY_EXPLAIN_RATE`)
+    - **commands**: Número de comandos, lentos, duración media y máxima por tipo de comando
+    - **entries**: Consultas lentas, de la más reciente a la más antigua:
+      - **caller**: Método que hizo la consulta (`FoodService.*`, `CatalogSync.*` o función del ETL)
+      - **filter** / **pipeline** / **sort**: Forma de la consulta, con los valores sustituidos por `?`
+      - **explain**: Etapas e índices del plan ganador, si la consulta entró en la muestra
+      - **error**: Mensaje del servidor si el comando falló
+    """
+    return {**slow_query_log.stats(), "entries": slow_query_log.recent(limit)}
@@ -1,10 +1,23 @@
-from fastapi import APIRouter, HTTPException, Query, Path
-from typing import List, Optional
-from app.models.food import Food, FoodSearchResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Path, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Optional, Union
+from datetime import datetime
+from pymongo.errors import DuplicateKeyError
+from app.models.food import (
+    BarcodeLookupRequest, BarcodeLookupResponse, CategoryCount, Food, FoodBatchRequest,
+    FoodBatchResponse, FoodSearchResponse, FoodSuggestion, MealPlanRequest, MealPlanResponse,
+    NutrientFilter, NutritionComputeRequest, NutritionComputeResponse
+)
 from app.services.food_service import FoodService
+from app.services.pagination import encode_cursor
 
 router = APIRouter(prefix="/api/foods", tags=["foods"])
 
+# Claves de orden por nutriente (por 100g); con "-" delante, descendente
+NUTRIENT_SORT_PATTERN = (
+    "-?(calories|protein|carbohydrates|fat|fiber|sugar|sodium|protein_per_kcal)"
+)
+
 @router.get(
     "/search",
     response_model=List[FoodSearchResponse],
@@ -32,7 +45,8 @@ router = APIRouter(prefix="/api/foods", tags=["foods"])
                                     "weight_grams": 150,
                                     "multiplier": 1.5
                                 }
-                            ]
+                            ],
+                            "score": None
                         }
                     ]
                 }
@@ -52,7 +66,19 @@ async def search_foods(
         ge=1, 
         le=100,
         description="Número máximo de resultados a devolver"
-    )
+    ),
+    sort: Optional[str] = Query(
+        None,
+        pattern=f"^(relevance|{NUTRIENT_SORT_PATTERN})$",
+        description="Orden: 'relevance' por puntuación o un nutriente ('-protein' descendente)",
+        example="relevance"
+    ),
+    fuzzy: bool = Query(
+        False,
+        description="Tolerar errores tipográficos (distancia de edición 1-2)"
+    ),
+    filters: NutrientFilter = Depends(),
+    response: Response = None
 ):
     """
     ## Buscar Alimentos
@@ -62,11 +88,25 @@ async def search_foods(
     ### Parámetros:
     - **q**: Término de búsqueda (obligatorio)
         - Busca en nombre, marca y categoría
+        - No distingue mayúsculas ni acentos ("platano" encuentra "Plátano")
+        - Cada palabra se trata como prefijo y deben aparecer todas
         - Mínimo 1 carácter
         - Ejemplos: "pollo", "yogur", "manzana"
     - **limit**: Número de resultados (opcional, por defecto 20)
         - Mínimo: 1
         - Máximo: 100
+    - **sort**: Orden de los resultados (opcional)
+        - `relevance`: ranking BM25 con pesos nombre > marca > categoría
+        - Un nutriente por 100g (`protein`, `calories`, ...) o `protein_per_kcal`;
+          con `-` delante, descendente (`-protein`)
+        - Sin valor: orden de inserción en el catálogo
+    - **fuzzy**: Tolerar errores tipográficos (opcional, por defecto false)
+        - 1 error en palabras de 4 a 7 letras, 2 errores en palabras más largas
+        - Se recomienda combinarlo con `sort=relevance`
+        - La cabecera `X-Fuzzy-Expanded-Terms` indica cuántos términos se añadieron
+    - **category**: Categoría exacta (opcional)
+    - **min_<nutriente>** / **max_<nutriente>**: Rango por 100g (opcional)
+        - Nutrientes: calories, protein, carbohydrates, fat, fiber, sugar, sodium
     
     ### Respuesta:
     Lista de alimentos con:
@@ -75,17 +115,87 @@ async def search_foods(
     - Categoría
     - Información nutricional por 100g
     - Porciones disponibles
+    - Puntuación de relevancia (`score`, solo con `sort=relevance`)
+    
+    La cabecera `X-Query-Plan` indica cómo se resolvió la consulta
+    (por ejemplo `memory:inverted-index > candidates(12) > filter(protein)`).
     
     ### Ejemplos de uso:
     - `/api/foods/search?q=pollo` - Buscar pollo
     - `/api/foods/search?q=yogur&limit=10` - Buscar yogur (máximo 10 resultados)
+    - `/api/foods/search?q=pollo&sort=relevance` - Mejores coincidencias primero
+    - `/api/foods/search?q=yogurt&fuzzy=true&sort=relevance` - Encuentra también "yogur"
+    - `/api/foods/search?q=queso&min_protein=20&sort=-protein_per_kcal` - Quesos más proteicos por kcal
     """
-    results = await FoodService.search_foods(q, limit)
+    stats = {}
+    results = await FoodService.search_foods(q, limit, sort, fuzzy, stats, filters)
+    if fuzzy:
+        response.headers["X-Fuzzy-Expanded-Terms"] = str(stats.get("expanded_terms", 0))
+    response.headers["X-Query-Plan"] = stats.get("query_plan", "")
     return results
 
+@router.get(
+    "/suggest",
+    response_model=List[FoodSuggestion],
+    summary="Autocompletar alimentos",
+    description="Sugerencias rápidas por prefijo de nombre o marca para mostrar mientras se escribe",
+    response_description="Lista de sugerencias (ID y nombre a mostrar)",
+    responses={
+        200: {
+            "description": "Sugerencias obtenidas",
+            "content": {
+                "application/json": {
+                    "example": [
+                        {
+                            "id": "507f1f77bcf86cd799439011",
+                            "display_name": "Pechuga de pollo (Carrefour)"
+                        }
+                    ]
+                }
+            }
+        }
+    }
+)
+async def suggest_foods(
+    q: str = Query(
+        ...,
+        min_length=1,
+        description="Texto escrito hasta el momento",
+        example="pech"
+    ),
+    limit: int = Query(
+        10,
+        ge=1,
+        le=25,
+        description="Número máximo de sugerencias"
+    )
+):
+    """
+    ## Autocompletar Alimentos
+    
+    Devuelve sugerencias mientras el usuario escribe. Se sirve desde un índice
+    en memoria, sin consultar MongoDB, por lo que es mucho más ligero que
+    `/api/foods/search`.
+    
+    ### Parámetros:
+    - **q**: Texto escrito (obligatorio)
+        - Coincide con el inicio del nombre, de cualquier palabra del nombre o de la marca
+        - No distingue mayúsculas ni acentos
+    - **limit**: Número de sugerencias (opcional, por defecto 10, máximo 25)
+    
+    ### Respuesta:
+    Lista con el ID y el nombre a mostrar de cada alimento. Primero los
+    nombres que empiezan por el texto, después las coincidencias de palabra
+    y por último las de marca.
+    
+    ### Ejemplos de uso:
+    - `/api/foods/suggest?q=pech` - "Pechuga de pollo (Carrefour)", ...
+    """
+    return FoodService.suggest_foods(q, limit)
+
 @router.get(
     "/categories",
-    response_model=List[str],
+    response_model=Union[List[str], List[CategoryCount]],
     summary="Obtener categorías de alimentos",
     description="Devuelve todas las categorías únicas de alimentos disponibles en el catálogo",
     response_description="Lista de categorías disponibles",
@@ -107,14 +217,25 @@ async def search_foods(
         }
     }
 )
-async def get_categories():
+async def get_categories(
+    with_counts: bool = Query(
+        False,
+        description="Incluir el número de alimentos de cada categoría"
+    )
+):
     """
     ## Obtener Categorías
     
     Devuelve todas las categorías de alimentos disponibles en el catálogo.
+    Se sirven desde una tabla de recuentos en memoria que se actualiza con
+    cada alta, sin consultar MongoDB en cada petición.
+    
+    ### Parámetros:
+    - **with_counts**: Incluir recuentos (opcional, por defecto false)
     
     ### Respuesta:
     Lista de strings con los nombres de las categorías únicas.
+    Con `with_counts=true`, lista de objetos `{"category": ..., "count": ...}`.
     
     ### Uso:
     Útil para:
@@ -129,7 +250,449 @@ async def get_categories():
     - Cereales y Legumbres
     - Bebidas
     """
-    return await FoodService.get_categories()
+    return await FoodService.get_categories(with_counts)
+
+@router.get(
+    "/export",
+    summary="Exportar el catálogo completo",
+    description="Descarga todo el catálogo como JSON por líneas (NDJSON) en streaming",
+    response_description="Un alimento por línea",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "description": "Exportación en curso",
+            "content": {
+                "application/x-ndjson": {
+                    "example": '{"_id": "507f1f77bcf86cd799439011", "name": "Pechuga de pollo", ...}\n'
+                }
+            }
+        }
+    }
+)
+async def export_foods(
+    since: Optional[datetime] = Query(
+        None,
+        description="Exportar solo alimentos actualizados desde esta fecha (ISO 8601)",
+        example="2025-01-01T00:00:00"
+    ),
+    gzip: bool = Query(
+        False,
+        description="Comprimir la respuesta con gzip"
+    )
+):
+    """
+    ## Exportar Catálogo
+    
+    Envía el catálogo completo en streaming, un alimento por línea (NDJSON),
+    leyendo MongoDB por lotes. La memoria usada no crece con el tamaño del
+    catálogo, a diferencia de paginar `GET /api/foods`.
+    
+    ### Parámetros:
+    - **since**: Exportación incremental (opcional)
+        - Solo alimentos con `updated_at` igual o posterior
+        - Se ordenan por `updated_at`: el último valor recibido sirve como próximo `since`
+    - **gzip**: Comprimir la respuesta (opcional, por defecto false)
+        - Se envía con `Content-Encoding: gzip`
+    
+    ### Respuesta:
+    Cada línea es un objeto Food completo en JSON.
+    
+    ### Ejemplos de uso:
+    - `/api/foods/export` - Catálogo completo
+    - `/api/foods/export?since=2025-01-01T00:00:00&gzip=true` - Cambios desde una fecha, comprimidos
+    """
+    headers = {"Content-Disposition": 'attachment; filename="foods.ndjson"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        FoodService.export_foods(since, gzip),
+        media_type="application/x-ndjson",
+        headers=headers
+    )
+
+@router.post(
+    "/batch",
+    response_model=FoodBatchResponse,
+    summary="Obtener varios alimentos por ID",
+    description="Resuelve hasta 500 IDs de alimentos en una sola petición y una sola consulta",
+    response_description="Alimentos en el orden pedido, con los IDs no encontrados o inválidos",
+    responses={
+        200: {
+            "description": "Lote resuelto",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "foods": [
+                            {
+                                "_id": "507f1f77bcf86cd799439011",
+                                "name": "Pechuga de pollo",
+                                "nutritional_info_per_100g": {
+                                    "calories": 165,
+                                    "protein": 31,
+                                    "carbohydrates": 0,
+                                    "fat": 3.6
+                                }
+                            },
+                            None
+                        ],
+                        "missing": ["507f1f77bcf86cd799439012"],
+                        "invalid": []
+                    }
+                }
+            }
+        }
+    }
+)
+async def get_foods_batch(request: FoodBatchRequest):
+    """
+    ## Obtener Alimentos por Lote
+    
+    Pensado para pintar un día del diario sin pedir cada alimento por
+    separado: una sola petición y una sola consulta `$in` a MongoDB.
+    
+    ### Body (JSON):
+    - **ids** (requerido): Lista de IDs (1 a 500); se admiten repetidos
+    - **fields** (opcional): Campos a devolver, por ejemplo
+      `["name", "nutritional_info_per_100g", "portions"]`
+    
+    ### Respuesta:
+    - **foods**: Un elemento por ID pedido, en el mismo orden; `null` si no se encontró
+    - **missing**: IDs con formato válido que no existen
+    - **invalid**: IDs que no son ObjectId válidos
+    """
+    return await FoodService.get_foods_by_ids(request.ids, request.fields)
+
+@router.post(
+    "/nutrition/compute",
+    response_model=NutritionComputeResponse,
+    summary="Calcular nutrientes de varias porciones",
+    description="Calcula los nutrientes de una lista de alimentos y porciones, y sus totales",
+    response_description="Nutrientes por elemento y totales",
+    responses={
+        200: {
+            "description": "Cálculo realizado",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "items": [
+                            {
+                                "food_id": "507f1f77bcf86cd799439011",
+                                "name": "Pechuga de pollo",
+                                "grams": 150,
+                                "nutrients": {
+                                    "calories": 247.5,
+                                    "protein": 46.5,
+                                    "carbohydrates": 0,
+                                    "fat": 5.4,
+                                    "fiber": 0,
+                                    "sugar": 0,
+                                    "sodium": 105
+                                },
+                                "error": None
+                            }
+                        ],
+                        "totals": {
+                            "calories": 247.5,
+                            "protein": 46.5,
+                            "carbohydrates": 0,
+                            "fat": 5.4,
+                            "fiber": 0,
+                            "sugar": 0,
+                            "sodium": 105
+                        }
+                    }
+                }
+            }
+        }
+    }
+)
+async def compute_nutrition(request: NutritionComputeRequest):
+    """
+    ## Calcular Nutrientes
+    
+    Calcula en el servidor lo que hoy cada cliente hace alimento a alimento
+    (`nutritional_info_per_100g` × gramos / 100). Todos los alimentos se
+    leen con una sola consulta y el cálculo se hace en una única operación
+    vectorizada, así que una semana de diario se resuelve en una llamada.
+    
+    ### Body (JSON):
+    - **items** (requerido): Lista de elementos con
+        - **food_id**: ID del alimento
+        - **portion**: Nombre de la porción (opcional), por ejemplo "unidad (125g)"
+        - **grams**: Gramos (opcional, si no hay porción; por defecto 100)
+        - **quantity**: Número de porciones (opcional, por defecto 1)
+    
+    ### Respuesta:
+    - **items**: Nutrientes de cada elemento en el orden pedido; los que no
+      se pueden calcular llevan `error` y no suman en los totales
+    - **totals**: Suma de todos los elementos
+    """
+    return await FoodService.compute_nutrition(request.items)
+
+@router.post(
+    "/meal-plan",
+    response_model=MealPlanResponse,
+    summary="Proponer una comida para un objetivo de macros",
+    description="Busca una combinación de alimentos y porciones que se acerque al objetivo",
+    response_description="Mejor combinación encontrada en el tiempo indicado",
+    responses={
+        200: {
+            "description": "Búsqueda realizada",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "items": [
+                            {
+                                "food_id": "507f1f77bcf86cd799439011",
+                                "name": "Pechuga de pollo",
+                                "portion": "unidad",
+                                "quantity": 1,
+                                "grams": 150
+                            },
+                            {
+                                "food_id": "507f1f77bcf86cd799439012",
+                                "name": "Arroz blanco cocido",
+                                "portion": "100g",
+                                "quantity": 2,
+                                "grams": 200
+                            }
+                        ],
+                        "totals": {
+                            "calories": 507.5,
+                            "protein": 51.9,
+                            "carbohydrates": 56,
+                            "fat": 5.8,
+                            "fiber": 0.8,
+                            "sugar": 0.2,
+                            "sodium": 107
+                        },
+                        "error": 0.154,
+                        "within_tolerance": False,
+                        "solve_time_ms": 48.2,
+                        "candidates_considered": 66425,
+                        "pool_size": 150,
+                        "timed_out": False
+                    }
+                }
+            }
+        },
+        503: {
+            "description": "El catálogo aún se está cargando",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "El catálogo todavía se está cargando"}
+                }
+            }
+        }
+    }
+)
+async def plan_meal(request: MealPlanRequest):
+    """
+    ## Proponer una Comida
+    
+    Propone una combinación de alimentos del catálogo y sus porciones que
+    cumple un objetivo de calorías y macros (por ejemplo 600 kcal y 40 g de
+    proteína), como los que se fijan en la calculadora de calorías.
+    
+    ### Body (JSON):
+    - **calories** (requerido): Calorías objetivo
+    - **protein** / **carbohydrates** / **fat**: Gramos objetivo (opcionales)
+    - **tolerance**: Desviación admitida en cada objetivo (por defecto 0.1 = ±10%)
+    - **categories**: Limitar a estas categorías (opcional)
+    - **max_items**: Alimentos como máximo en la combinación (por defecto 3, máximo 5)
+    - **time_budget_ms**: Tiempo máximo de búsqueda (por defecto 200 ms, máximo 2000)
+    
+    ### Funcionamiento:
+    Se consideran 1, 2 o 3 unidades de cada porción. Sobre una matriz de
+    nutrientes precalculada se preseleccionan las opciones más prometedoras y
+    se hace una búsqueda entera acotada que descarta las combinaciones que ya
+    superan el objetivo. Al agotarse el tiempo se devuelve la mejor encontrada.
+    
+    ### Respuesta:
+    - **items** / **totals**: Combinación propuesta y sus nutrientes
+    - **error**: Mayor desviación relativa respecto a los objetivos
+    - **within_tolerance**: Si se cumplen todos los objetivos
+    - **solve_time_ms** / **candidates_considered** / **pool_size** / **timed_out**:
+      Datos de la búsqueda
+    
+    ### Errores:
+    - **503**: Si el catálogo aún se está cargando al arrancar
+    """
+    try:
+        return await FoodService.plan_meal(request)
+    except RuntimeError as error:
+        raise HTTPException(status_code=503, detail=str(error))
+
+@router.get(
+    "/barcode/{ean}",
+    response_model=Food,
+    summary="Obtener alimento por código de barras",
+    description="Busca un alimento por su código EAN-8, UPC-A o EAN-13",
+    response_description="Información completa del alimento",
+    responses={
+        400: {
+            "description": "Código de barras no válido",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Dígito de control del código de barras incorrecto"}
+                }
+            }
+        },
+        404: {
+            "description": "Alimento no encontrado",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Alimento no encontrado"}
+                }
+            }
+        }
+    }
+)
+async def get_food_by_barcode(
+    ean: str = Path(
+        ...,
+        description="Código de barras escaneado",
+        example="8480000123456"
+    )
+):
+    """
+    ## Obtener Alimento por Código de Barras
+    
+    Pensado para el escaneo desde la app móvil.
+    
+    ### Parámetros:
+    - **ean**: Código de barras
+        - Se admiten EAN-8, UPC-A (12 dígitos) y EAN-13; espacios y guiones se ignoran
+        - Se comprueba el dígito de control antes de consultar la base de datos
+    
+    ### Errores:
+    - **400**: Si el código no es válido
+    - **404**: Si no hay ningún alimento con ese código
+    """
+    try:
+        food = await FoodService.get_food_by_barcode(ean)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    if not food:
+        raise HTTPException(status_code=404, detail="Alimento no encontrado")
+    return food
+
+@router.post(
+    "/barcode",
+    response_model=BarcodeLookupResponse,
+    summary="Buscar varios códigos de barras",
+    description="Resuelve hasta 500 códigos de barras (por ejemplo, de un ticket) en una sola consulta",
+    response_description="Resultado por código, en el orden pedido"
+)
+async def get_foods_by_barcodes(request: BarcodeLookupRequest):
+    """
+    ## Buscar Códigos de Barras por Lote
+    
+    ### Body (JSON):
+    - **codes** (requerido): Lista de códigos (1 a 500)
+    
+    ### Respuesta:
+    - **results**: Por cada código, el código normalizado, si se encontró,
+      el alimento y, si no es válido, el motivo
+    - **hits** / **misses**: Recuento de aciertos y fallos
+    """
+    return await FoodService.get_foods_by_barcodes(request.codes)
+
+@router.get(
+    "/{food_id}/similar",
+    response_model=List[FoodSearchResponse],
+    summary="Alimentos similares",
+    description="Alimentos con el perfil nutricional más parecido (vecinos más cercanos)",
+    response_description="Alimentos ordenados de más a menos parecido",
+    responses={
+        200: {
+            "description": "Alimentos similares encontrados",
+            "content": {
+                "application/json": {
+                    "example": [
+                        {
+                            "id": "507f1f77bcf86cd799439012",
+                            "name": "Yogur griego natural",
+                            "brand": "Hacendado",
+                            "category": "Lácteos",
+                            "calories_per_100g": 97,
+                            "protein_per_100g": 9,
+                            "carbs_per_100g": 4,
+                            "fat_per_100g": 5,
+                            "portions": [],
+                            "score": None,
+                            "distance": 0.38
+                        }
+                    ]
+                }
+            }
+        },
+        404: {
+            "description": "Alimento no encontrado",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Alimento no encontrado"}
+                }
+            }
+        },
+        503: {
+            "description": "El índice de similitud aún se está cargando",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "El índice de similitud todavía se está cargando"}
+                }
+            }
+        }
+    }
+)
+async def get_similar_foods(
+    food_id: str = Path(
+        ...,
+        description="ID único del alimento de referencia",
+        example="507f1f77bcf86cd799439011"
+    ),
+    k: int = Query(
+        10,
+        ge=1,
+        le=50,
+        description="Número de alimentos similares a devolver"
+    ),
+    same_category: bool = Query(
+        False,
+        description="Buscar solo dentro de la categoría del alimento de referencia"
+    )
+):
+    """
+    ## Alimentos Similares
+    
+    Sugiere sustitutos con un perfil nutricional parecido ("algo como este
+    yogur"). Compara calorías, proteínas, carbohidratos, grasas, fibra,
+    azúcares y sodio por 100g, normalizados para que todos pesen igual.
+    
+    ### Parámetros:
+    - **food_id**: ID del alimento de referencia
+    - **k**: Número de resultados (por defecto 10, máximo 50)
+    - **same_category**: Restringir a la misma categoría (por defecto false)
+    
+    ### Respuesta:
+    Lista de alimentos, del más al menos parecido, con la distancia entre
+    perfiles en `distance` (0 = idéntico). El alimento de referencia no se incluye.
+    
+    ### Funcionamiento:
+    Búsqueda exacta de vecinos más cercanos sobre un KD-tree en memoria
+    construido al cargar el catálogo (uno por categoría bajo demanda).
+    
+    ### Errores:
+    - **404**: Si el alimento no existe
+    - **503**: Si el índice aún se está cargando al arrancar
+    """
+    try:
+        foods = FoodService.get_similar_foods(food_id, k, same_category)
+    except RuntimeError as error:
+        raise HTTPException(status_code=503, detail=str(error))
+    if foods is None:
+        raise HTTPException(status_code=404, detail="Alimento no encontrado")
+    return foods
 
 @router.get(
     "/{food_id}",
@@ -238,6 +801,14 @@ async def get_food(
                     ]
                 }
             }
+        },
+        503: {
+            "description": "Filtro u orden por nutriente sin categoría mientras se carga el índice",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "El índice de nutrientes todavía se está cargando"}
+                }
+            }
         }
     }
 )
@@ -254,12 +825,26 @@ async def get_all_foods(
         le=500,
         description="Número máximo de registros a devolver",
         example=100
-    )
+    ),
+    cursor: Optional[str] = Query(
+        None,
+        description="Cursor opaco de la cabecera X-Next-Cursor de la página anterior",
+        example="ZQ3k8Qx1c2ZxAAAB"
+    ),
+    sort: Optional[str] = Query(
+        None,
+        pattern=f"^{NUTRIENT_SORT_PATTERN}$",
+        description="Ordenar por un nutriente por 100g ('-protein' descendente)",
+        example="-protein_per_kcal"
+    ),
+    filters: NutrientFilter = Depends(),
+    response: Response = None
 ):
     """
     ## Listar Todos los Alimentos
     
-    Obtiene todos los alimentos del catálogo con soporte de paginación.
+    Obtiene todos los alimentos del catálogo con soporte de paginación,
+    ordenados por ID o por un nutriente y opcionalmente filtrados.
     
     ### Parámetros:
     - **skip**: Número de registros a saltar (por defecto 0)
@@ -268,9 +853,25 @@ async def get_all_foods(
     - **limit**: Número de registros por página (por defecto 100)
         - Mínimo: 1
         - Máximo: 500
+    - **cursor**: Continuar tras la página anterior (opcional)
+        - Valor de la cabecera `X-Next-Cursor` de la respuesta anterior
+        - Si se indica, se ignora `skip`
+        - No se puede combinar con `sort` ni con filtros de nutrientes
+    - **sort**: Ordenar por un nutriente (opcional)
+        - `protein`, `calories`, ... o `protein_per_kcal`; `-protein` descendente
+    - **category**: Categoría exacta (opcional)
+    - **min_<nutriente>** / **max_<nutriente>**: Rango por 100g (opcional)
+    
+    Los filtros y el orden se resuelven en un índice de columnas ordenadas en
+    memoria o, mientras se carga, con los índices `category + nutriente` de
+    MongoDB si se indica `category`. Sin categoría no hay índice que acote la
+    consulta, así que se responde 503 hasta que el índice esté cargado en
+    lugar de recorrer la colección.
     
     ### Respuesta:
-    Lista de objetos Food con toda su información.
+    Lista de objetos Food con toda su información. Si la página está
+    completa, la cabecera `X-Next-Cursor` contiene el cursor de la siguiente.
+    La cabecera `X-Query-Plan` indica el plan usado.
     
     ### Paginación:
     ```
@@ -282,14 +883,35 @@ async def get_all_foods(
     
     # Tercera página (alimentos 200-299)
     GET /api/foods?skip=200&limit=100
+    
+    # Paginación por cursor (coste constante aunque la página sea profunda)
+    GET /api/foods?limit=100
+    GET /api/foods?limit=100&cursor=<X-Next-Cursor anterior>
+    
+    # Lácteos con proteína ≥ 10 g y calorías ≤ 120, por proteína por kcal
+    GET /api/foods?category=Lácteos&min_protein=10&max_calories=120&sort=-protein_per_kcal
     ```
     
     ### Uso recomendado:
     - Para cargar datos iniciales
-    - Para exportar el catálogo completo
-    - Para sincronización de datos
+    - Para recorrer el catálogo completo, mejor con `cursor` que con `skip`
+    
+    ### Errores:
+    - **400**: Si el cursor no es válido o se combina con filtros u orden
+    - **503**: Si hay filtros u orden por nutriente sin `category` mientras
+      el índice de nutrientes se carga al arrancar
     """
-    return await FoodService.get_all_foods(skip, limit)
+    stats = {}
+    try:
+        foods = await FoodService.get_all_foods(skip, limit, cursor, sort, filters, stats)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    except RuntimeError as error:
+        raise HTTPException(status_code=503, detail=str(error))
+    if len(foods) == limit and not (sort or filters.is_active()):
+        response.headers["X-Next-Cursor"] = encode_cursor(foods[-1].id)
+    response.headers["X-Query-Plan"] = stats.get("query_plan", "")
+    return foods
 
 @router.post(
     "",
@@ -379,6 +1001,13 @@ async def create_food(food: Food):
     - Todos los campos requeridos deben estar presentes
     - Los valores numéricos deben ser positivos
     - Las porciones deben tener name, weight_grams y multiplier
+    - El código de barras se normaliza (EAN-8/EAN-13) y no puede repetirse (409)
     """
-    food_id = await FoodService.create_food(food)
+    try:
+        food_id = await FoodService.create_food(food)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=409,
+            detail="Ya existe un alimento con ese código de barras"
+        )
     return {"id": food_id, "message": "Alimento creado exitosamente"}
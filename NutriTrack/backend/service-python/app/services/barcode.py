@@ -0,0 +1,49 @@
+from typing import Optional
+import re
+
+_SEPARATORS = re.compile(r"[\s\-]+")
+
+
+def gs1_check_digit(body: str) -> int:
+    """Dígito de control GS1 para los dígitos dados (sin el de control)"""
+    total = 0
+    for position, digit in enumerate(reversed(body)):
+        total += int(digit) * (3 if position % 2 == 0 else 1)
+    return (10 - total % 10) % 10
+
+
+def normalize_barcode(code: str) -> str:
+    """
+    Normalizar un código de barras a su forma canónica (EAN-8 o EAN-13)
+
+    Quita espacios y guiones, pasa los dígitos a ASCII, completa UPC-A (12 dígitos) a EAN-13, reduce
+    GTIN-14 con indicador 0 a EAN-13 y comprueba el dígito de control.
+    Lanza ValueError si el código no es válido.
+    """
+    # Sin separadores (lo habitual) no hace falta la regex
+    digits = code if code and code.isascii() and code.isdigit() else _SEPARATORS.sub("", code or "")
+    # isdecimal, no isdigit: isdigit acepta '²' y similares, que int() no convierte
+    if not digits.isdecimal():
+        raise ValueError("El código de barras solo puede contener dígitos")
+    if not digits.isascii():
+        # Dígitos de otras escrituras (árabes, de ancho completo...) a ASCII
+        digits = "".join(str(int(digit)) for digit in digits)
+    if len(digits) == 12:
+        digits = "0" + digits
+    elif len(digits) == 14 and digits.startswith("0"):
+        digits = digits[1:]
+    if len(digits) not in (8, 13):
+        raise ValueError("El código de barras debe ser EAN-8, UPC-A o EAN-13")
+    if gs1_check_digit(digits[:-1]) != int(digits[-1]):
+        raise ValueError("Dígito de control del código de barras incorrecto")
+    return digits
+
+
+def clean_barcode(code: Optional[str]) -> Optional[str]:
+    """Forma normalizada si es válida; si no, el código recortado (o None si está vacío)"""
+    if not code or not code.strip():
+        return None
+    try:
+        return normalize_barcode(code)
+    except ValueError:
+        return code.strip()
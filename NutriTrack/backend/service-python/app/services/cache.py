@@ -0,0 +1,86 @@
+from typing import Any, Hashable, Optional
+from collections import OrderedDict
+import os
+import time
+
+
+class TTLCache:
+    """
+    Caché en memoria con tamaño máximo, caducidad (TTL) y expulsión LRU
+
+    Implementa también la interfaz de consumidor de CatalogSync: cualquier
+    cambio en el catálogo invalida por completo la caché.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Devolver el valor guardado o None si no existe o ha caducado"""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Guardar un valor, expulsando el menos usado si se supera el tamaño"""
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """Vaciar la caché"""
+        if self._data:
+            self._data.clear()
+        self.invalidations += 1
+
+    def rebuild(self, docs) -> None:
+        # Diccionario nuevo en lugar de vaciar el actual (CatalogSync reconstruye una copia)
+        self._data = OrderedDict()
+        self.invalidations += 1
+
+    def upsert(self, doc: dict) -> None:
+        self.clear()
+
+    def stats(self) -> dict:
+        """Contadores para dimensionar la caché"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations
+        }
+
+
+# Caché de resultados de /api/foods/search
+search_cache = TTLCache(
+    maxsize=int(os.getenv("SEARCH_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("SEARCH_CACHE_TTL", "60"))
+)
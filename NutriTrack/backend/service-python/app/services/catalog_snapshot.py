@@ -0,0 +1,223 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from datetime import datetime
+import bisect
+import os
+import sys
+import numpy as np
+from bson import ObjectId
+from app.services.nutrition import NUTRIENT_FIELDS, nutrient_row
+
+# Activar con CATALOG_SNAPSHOT=true para servir lecturas desde memoria
+CATALOG_SNAPSHOT_ENABLED = os.getenv("CATALOG_SNAPSHOT", "false").lower() == "true"
+
+_INITIAL_CAPACITY = 1024
+
+
+class _StringTable:
+    """Tabla de valores repetidos (categorías, fuentes) codificados como enteros"""
+
+    def __init__(self):
+        self.values: List[Optional[str]] = []
+        self._codes: Dict[Optional[str], int] = {}
+
+    def code(self, value: Optional[str]) -> int:
+        if value not in self._codes:
+            self._codes[value] = len(self.values)
+            self.values.append(value if value is None else sys.intern(value))
+        return self._codes[value]
+
+
+class CatalogSnapshot:
+    """
+    Copia columnar en memoria de la colección `foods`
+
+    Los nutrientes se guardan en una matriz NumPy (filas × NUTRIENT_FIELDS),
+    las categorías y fuentes como códigos enteros, nombres y marcas como
+    cadenas internadas y las listas de porciones se comparten entre todos
+    los alimentos que tienen las mismas. Es consumidor de CatalogSync, que
+    la carga al arrancar y la refresca consultando `updated_at`.
+
+    Cuando está activada sustituye a los documentos que guardaría el índice
+    de búsqueda: búsqueda, similares y obtención por ID leen de aquí, así
+    que su huella es la de todo el catálogo en memoria y no una copia más.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._reset(_INITIAL_CAPACITY)
+
+    def _reset(self, capacity: int) -> None:
+        self._size = 0
+        self._ids: List[str] = []
+        self._row_of: Dict[str, int] = {}
+        self._nutrients = np.zeros((capacity, len(NUTRIENT_FIELDS)), dtype=np.float32)
+        self._category = np.zeros(capacity, dtype=np.int32)
+        self._source = np.zeros(capacity, dtype=np.int32)
+        self._portion_set = np.zeros(capacity, dtype=np.int32)
+        self._created_at = np.zeros(capacity, dtype="datetime64[ms]")
+        self._updated_at = np.zeros(capacity, dtype="datetime64[ms]")
+        self._names: List[str] = []
+        self._brands: List[Optional[str]] = []
+        self._barcodes: List[Optional[str]] = []
+        self._categories = _StringTable()
+        self._sources = _StringTable()
+        self._portion_sets: List[Tuple[dict, ...]] = []
+        self._portion_codes: Dict[tuple, int] = {}
+        # IDs ordenados (el hex de un ObjectId ordena igual que el ObjectId)
+        self._sorted_ids: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._sorted_ids)
+
+    def _grow(self) -> None:
+        capacity = max(_INITIAL_CAPACITY, len(self._category) * 2)
+        for attribute in ("_nutrients", "_category", "_source", "_portion_set",
+                          "_created_at", "_updated_at"):
+            column = getattr(self, attribute)
+            grown = np.zeros((capacity,) + column.shape[1:], dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, attribute, grown)
+
+    def _portion_code(self, portions: List[dict]) -> int:
+        key = tuple(
+            (portion.get("name"), portion.get("weight_grams"), portion.get("multiplier"))
+            for portion in portions or []
+        )
+        if key not in self._portion_codes:
+            self._portion_codes[key] = len(self._portion_sets)
+            self._portion_sets.append(tuple(
+                {"name": name, "weight_grams": weight, "multiplier": multiplier}
+                for name, weight, multiplier in key
+            ))
+        return self._portion_codes[key]
+
+    @staticmethod
+    def _timestamp(value: Optional[datetime]):
+        return np.datetime64(value, "ms") if value else np.datetime64("NaT", "ms")
+
+    def _write(self, row: int, doc: dict) -> None:
+        self._nutrients[row] = nutrient_row(doc)
+        self._category[row] = self._categories.code(doc.get("category"))
+        self._source[row] = self._sources.code(doc.get("source"))
+        self._portion_set[row] = self._portion_code(doc.get("portions"))
+        self._created_at[row] = self._timestamp(doc.get("created_at"))
+        self._updated_at[row] = self._timestamp(doc.get("updated_at"))
+        self._names[row] = sys.intern(doc.get("name") or "")
+        brand = doc.get("brand")
+        self._brands[row] = sys.intern(brand) if brand else None
+        self._barcodes[row] = doc.get("barcode")
+
+    def rebuild(self, docs: Iterable[dict]) -> None:
+        """Cargar la instantánea completa"""
+        docs = sorted(docs, key=lambda doc: str(doc["_id"]))
+        self._reset(max(_INITIAL_CAPACITY, len(docs)))
+        self._names = [""] * len(docs)
+        self._brands = [None] * len(docs)
+        self._barcodes = [None] * len(docs)
+        for row, doc in enumerate(docs):
+            doc_id = str(doc["_id"])
+            self._ids.append(doc_id)
+            self._row_of[doc_id] = row
+            self._write(row, doc)
+        self._size = len(docs)
+        self._sorted_ids = list(self._ids)
+        self.ready = True
+
+    def upsert(self, doc: dict) -> None:
+        """Añadir o actualizar un alimento sin recargar la instantánea"""
+        doc_id = str(doc["_id"])
+        row = self._row_of.get(doc_id)
+        if row is None:
+            if self._size == len(self._category):
+                self._grow()
+            row = self._size
+            self._size += 1
+            self._ids.append(doc_id)
+            self._names.append("")
+            self._brands.append(None)
+            self._barcodes.append(None)
+            self._row_of[doc_id] = row
+            bisect.insort(self._sorted_ids, doc_id)
+        self._write(row, doc)
+
+    def _document(self, row: int) -> dict:
+        doc = {
+            "_id": self._ids[row],
+            "name": self._names[row],
+            "brand": self._brands[row],
+            "category": self._categories.values[self._category[row]],
+            # float32 -> float con redondeo para no arrastrar error de representación
+            "nutritional_info_per_100g": {
+                field: round(float(value), 3)
+                for field, value in zip(NUTRIENT_FIELDS, self._nutrients[row])
+            },
+            "portions": list(self._portion_sets[self._portion_set[row]]),
+            "barcode": self._barcodes[row],
+            "source": self._sources.values[self._source[row]]
+        }
+        for field, column in (("created_at", self._created_at), ("updated_at", self._updated_at)):
+            if not np.isnat(column[row]):
+                doc[field] = column[row].astype(datetime)
+        return doc
+
+    def get(self, food_id: str) -> Optional[dict]:
+        """Documento de un alimento por ID (None si no existe)"""
+        row = self._row_of.get(food_id)
+        if row is None:
+            return None
+        return self._document(row)
+
+    def name(self, food_id: str) -> Optional[str]:
+        """Nombre de un alimento por ID, sin construir el documento"""
+        row = self._row_of.get(food_id)
+        return None if row is None else self._names[row]
+
+    def page(self, skip: int, limit: int, after: Optional[ObjectId] = None) -> List[dict]:
+        """Página de alimentos ordenada por ID, por desplazamiento o a partir de un ID"""
+        if after is not None:
+            start = bisect.bisect_right(self._sorted_ids, str(after))
+        else:
+            start = skip
+        return [
+            self._document(self._row_of[food_id])
+            for food_id in self._sorted_ids[start:start + limit]
+        ]
+
+    def memory_footprint(self) -> dict:
+        """Bytes aproximados ocupados y extrapolación a 100.000 alimentos"""
+        arrays = sum(
+            getattr(self, attribute)[:self._size].nbytes
+            for attribute in ("_nutrients", "_category", "_source", "_portion_set",
+                              "_created_at", "_updated_at")
+        )
+        strings = sum(sys.getsizeof(name) for name in set(self._names))
+        strings += sum(sys.getsizeof(brand) for brand in set(self._brands) if brand)
+        strings += sum(sys.getsizeof(barcode) for barcode in self._barcodes if barcode)
+        ids = sum(sys.getsizeof(food_id) for food_id in self._ids)
+        containers = sum(sys.getsizeof(container) for container in (
+            self._ids, self._names, self._brands, self._barcodes, self._sorted_ids,
+            self._row_of
+        ))
+        portions = sum(
+            sys.getsizeof(portion_set) + sum(sys.getsizeof(p) for p in portion_set)
+            for portion_set in self._portion_sets
+        )
+        total = arrays + strings + ids + containers + portions
+        foods = len(self)
+        return {
+            "foods": foods,
+            "distinct_portion_sets": len(self._portion_sets),
+            "categories": len(self._categories.values),
+            "bytes": {
+                "numeric_columns": arrays,
+                "strings": strings,
+                "ids": ids,
+                "containers": containers,
+                "portions": portions,
+                "total": total
+            },
+            "bytes_per_100k_foods": round(total / foods * 100_000) if foods else 0
+        }
+
+
+catalog_snapshot = CatalogSnapshot()
@@ -0,0 +1,168 @@
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import copy
+import logging
+import os
+from app.config.database import get_async_foods_collection
+from app.config.slow_queries import record_caller
+from app.services.search_index import search_index
+from app.services.suggest_index import suggest_index
+from app.services.cache import search_cache
+from app.services.catalog_snapshot import CATALOG_SNAPSHOT_ENABLED, catalog_snapshot
+from app.services.facets import facet_table
+from app.services.meal_plan import meal_planner
+from app.services.nutrient_index import nutrient_index
+from app.services.similarity import similarity_index
+
+logger = logging.getLogger(__name__)
+
+# Segundos entre comprobaciones de cambios en la colección
+CATALOG_SYNC_INTERVAL = float(os.getenv("CATALOG_SYNC_INTERVAL", "30"))
+
+# Margen (segundos) que se vuelve a consultar en cada sincronización: cubre las
+# escrituras que terminan después de empezar la consulta anterior y los relojes
+# algo desfasados entre la API y el ETL
+CATALOG_SYNC_OVERLAP = float(os.getenv("CATALOG_SYNC_OVERLAP", "120"))
+
+
+def _rebuilt(consumer, docs: List[dict]) -> dict:
+    """
+    Reconstruir una copia del consumidor y devolver los atributos que cambian
+
+    `rebuild` solo reasigna atributos (no modifica en sitio los que
+    comparte con el original), así que la copia se puede construir en otro
+    hilo mientras el original sigue atendiendo peticiones.
+    """
+    fresh = copy.copy(consumer)
+    before = dict(vars(fresh))
+    fresh.rebuild(docs)
+    return {
+        name: value for name, value in vars(fresh).items()
+        if name not in before or before[name] is not value
+    }
+
+
+@record_caller
+class CatalogSync:
+    """
+    Mantiene sincronizadas las estructuras en memoria con la colección `foods`
+
+    Cada consumidor implementa `rebuild(docs)` y `upsert(doc)`. Al arrancar se
+    hace una carga completa y después se consultan periódicamente los
+    documentos con `updated_at` posterior al inicio de la consulta anterior
+    menos CATALOG_SYNC_OVERLAP (los que no han cambiado desde la última vez
+    no se reenvían). La marca es la hora a la que empezó la consulta, no el
+    mayor `updated_at` visto: así un documento escrito con un reloj atrasado
+    no queda por detrás de ella. Si el número de documentos no cuadra (por
+    ejemplo, porque el ETL ha borrado productos), se recarga todo.
+
+    La recarga construye copias de los consumidores en un hilo y las
+    sustituye de una vez en el bucle de eventos, de modo que las peticiones
+    siguen usando el estado anterior mientras tanto. Las altas que llegan
+    durante la recarga se vuelven a aplicar después de la sustitución. Tras
+    cada sincronización, los consumidores con `settle` reconstruyen en un
+    hilo lo que las altas han dejado desactualizado.
+    """
+
+    def __init__(self, consumers: List):
+        self.consumers = consumers
+        self._versions: Dict[str, Optional[datetime]] = {}
+        self._watermark: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+        # Altas recibidas durante una recarga (None si no hay ninguna en curso)
+        self._missed: Optional[List[dict]] = None
+
+    def _build(self, docs: List[dict]) -> Tuple[List[dict], Dict[str, Optional[datetime]]]:
+        """Estado nuevo de cada consumidor (se ejecuta en un hilo)"""
+        for doc in docs:
+            doc["_id"] = str(doc["_id"])
+        changes = [_rebuilt(consumer, docs) for consumer in self.consumers]
+        return changes, {doc["_id"]: doc.get("updated_at") for doc in docs}
+
+    async def reload(self) -> None:
+        """Recargar todos los consumidores desde MongoDB sin bloquear el bucle de eventos"""
+        started = datetime.now()
+        self._missed = []
+        try:
+            docs = await get_async_foods_collection().find().to_list(None)
+            changes, versions = await asyncio.to_thread(self._build, docs)
+        except BaseException:
+            self._missed = None
+            raise
+        # Sustitución atómica: no hay ningún `await` entre un consumidor y el siguiente
+        for consumer, changed in zip(self.consumers, changes):
+            vars(consumer).update(changed)
+        self._versions = versions
+        self._watermark = started
+        missed, self._missed = self._missed, None
+        for doc in missed:
+            self.upsert(doc)
+
+    async def settle(self) -> None:
+        """Dejar que los consumidores con estructuras derivadas las reconstruyan fuera del bucle"""
+        for consumer in self.consumers:
+            if hasattr(consumer, "settle"):
+                await consumer.settle()
+
+    def upsert(self, doc: dict) -> None:
+        """Propagar un documento nuevo o modificado a los consumidores"""
+        doc["_id"] = str(doc["_id"])
+        for consumer in self.consumers:
+            consumer.upsert(doc)
+        self._versions[doc["_id"]] = doc.get("updated_at")
+        if self._missed is not None:
+            self._missed.append(doc)
+
+    async def refresh(self) -> None:
+        """Aplicar los cambios producidos desde la última sincronización"""
+        if self._watermark is None:
+            await self.reload()
+            return
+
+        started = datetime.now()
+        since = self._watermark - timedelta(seconds=CATALOG_SYNC_OVERLAP)
+        cursor = get_async_foods_collection().find({"updated_at": {"$gte": since}})
+        async for doc in cursor:
+            if self._versions.get(str(doc["_id"]), False) != doc.get("updated_at"):
+                self.upsert(doc)
+        self._watermark = started
+        await self.settle()
+
+        total = await get_async_foods_collection().estimated_document_count()
+        if total != len(self._versions):
+            await self.reload()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(CATALOG_SYNC_INTERVAL)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Error sincronizando el catálogo en memoria")
+
+    async def start(self) -> None:
+        """Carga inicial y arranque de la sincronización periódica"""
+        try:
+            await self.reload()
+        except Exception:
+            logger.exception("No se pudo cargar el catálogo en memoria")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Detener la sincronización periódica"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+catalog_sync = CatalogSync([
+    search_index, suggest_index, nutrient_index, similarity_index, meal_planner,
+    facet_table, search_cache
+])
+if CATALOG_SNAPSHOT_ENABLED:
+    catalog_sync.consumers.insert(0, catalog_snapshot)
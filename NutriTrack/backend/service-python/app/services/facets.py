@@ -0,0 +1,128 @@
+from typing import Dict, Iterable, Optional, Tuple
+from collections import Counter
+
+# Campos por los que se agregan recuentos
+FACET_FIELDS = ("category", "source", "brand")
+
+# Agregación que devuelve los recuentos de cada combinación en una sola consulta
+FACET_PIPELINE = [
+    {"$group": {
+        "_id": {field: f"${field}" for field in FACET_FIELDS},
+        "count": {"$sum": 1}
+    }}
+]
+
+FacetKey = Tuple[Optional[str], ...]
+
+
+def facet_key(doc: dict) -> FacetKey:
+    """Combinación (categoría, fuente, marca) de un documento"""
+    return tuple(doc.get(field) for field in FACET_FIELDS)
+
+
+class FacetTable:
+    """
+    Tabla materializada de recuentos por categoría, fuente y marca
+
+    Guarda cuántos alimentos hay de cada combinación y se actualiza de forma
+    incremental con cada alta, en lugar de ejecutar `distinct()` o un
+    `count_documents` por categoría en cada consulta. La usan tanto la API
+    (como consumidor de CatalogSync) como el importador.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._counts: Counter = Counter()
+        self._field_counts: Dict[str, Counter] = {field: Counter() for field in FACET_FIELDS}
+        self._doc_keys: Dict[str, FacetKey] = {}
+
+    def _reset(self) -> None:
+        self._counts = Counter()
+        self._field_counts = {field: Counter() for field in FACET_FIELDS}
+        self._doc_keys = {}
+
+    def rebuild(self, docs: Iterable[dict]) -> None:
+        """Recalcular la tabla a partir de los documentos"""
+        self._reset()
+        for doc in docs:
+            self.upsert(doc)
+        self.ready = True
+
+    def load_groups(self, groups: Iterable[dict]) -> None:
+        """Cargar la tabla desde el resultado de FACET_PIPELINE"""
+        self._reset()
+        for group in groups:
+            key = tuple(group["_id"].get(field) for field in FACET_FIELDS)
+            self._increment(key, group["count"])
+        self.ready = True
+
+    def upsert(self, doc: dict) -> None:
+        """Contar un documento nuevo o mover uno existente a su nueva combinación"""
+        doc_id = str(doc["_id"])
+        previous = self._doc_keys.get(doc_id)
+        if previous is not None:
+            self._decrement(previous, 1)
+        key = facet_key(doc)
+        self._doc_keys[doc_id] = key
+        self._increment(key, 1)
+
+    def remove_matching(self, **filters) -> int:
+        """Descontar todas las combinaciones que cumplen los filtros (p. ej. source=...)"""
+        removed = 0
+        for key in list(self._counts):
+            if self._matches(key, filters):
+                count = self._counts[key]
+                self._decrement(key, count)
+                removed += count
+        self._doc_keys = {
+            doc_id: key for doc_id, key in self._doc_keys.items()
+            if not self._matches(key, filters)
+        }
+        return removed
+
+    def _increment(self, key: FacetKey, amount: int) -> None:
+        self._counts[key] += amount
+        for field, value in zip(FACET_FIELDS, key):
+            self._field_counts[field][value] += amount
+
+    def _decrement(self, key: FacetKey, amount: int) -> None:
+        self._counts[key] -= amount
+        if self._counts[key] <= 0:
+            del self._counts[key]
+        for field, value in zip(FACET_FIELDS, key):
+            counter = self._field_counts[field]
+            counter[value] -= amount
+            if counter[value] <= 0:
+                del counter[value]
+
+    @staticmethod
+    def _matches(key: FacetKey, filters: dict) -> bool:
+        return all(
+            key[FACET_FIELDS.index(field)] == value
+            for field, value in filters.items()
+        )
+
+    def counts(self, field: str, **filters) -> Dict[str, int]:
+        """Recuento por valor de `field`, opcionalmente filtrado por otros campos"""
+        if not filters:
+            return {
+                value: count for value, count in self._field_counts[field].items()
+                if value is not None
+            }
+
+        position = FACET_FIELDS.index(field)
+        result: Counter = Counter()
+        for key, count in self._counts.items():
+            if key[position] is not None and self._matches(key, filters):
+                result[key[position]] += count
+        return dict(result)
+
+    def total(self, **filters) -> int:
+        """Número de documentos que cumplen los filtros"""
+        return sum(
+            count for key, count in self._counts.items()
+            if self._matches(key, filters)
+        )
+
+
+facet_table = FacetTable()
@@ -1,72 +1,560 @@
-from typing import List, Optional, Dict
+from typing import AsyncIterator, List, Optional, Dict, Union
+from datetime import datetime
 from bson import ObjectId
-from app.config.database import async_foods_collection
-from app.models.food import Food, FoodSearchResponse
+from bson.errors import InvalidId
+from app.config.database import get_async_foods_collection
+from app.config.slow_queries import record_caller
+from app.models.food import (
+    BarcodeLookupResponse, BarcodeResult, CategoryCount, Food, FoodBatchResponse,
+    FoodSearchResponse, FoodSuggestion, MealPlanRequest, MealPlanResponse,
+    NutrientFilter, NutritionalInfo, NutritionComputeResponse, NutritionItem,
+    NutritionItemResult
+)
+from app.services.barcode import clean_barcode, normalize_barcode
+from app.services.cache import search_cache
+from app.services.catalog_snapshot import catalog_snapshot
+from app.services.catalog_sync import catalog_sync
+from app.services.facets import facet_table
+from app.services.meal_plan import meal_planner
+from app.services.nutrient_index import DERIVED_KEYS, nutrient_index, parse_sort
+from app.services.nutrition import NUTRIENT_FIELDS, compute_nutrients
+from app.services.pagination import decode_cursor
+from app.services.search_index import normalize_text, search_index
+from app.services.similarity import similarity_index
+from app.services.singleflight import food_singleflight
+from app.services.suggest_index import suggest_index
+import asyncio
+import os
 import re
+import zlib
 
+# Documentos por lote al recorrer la colección para exportar
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+# Tamaño aproximado de cada bloque enviado al cliente durante la exportación
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+@record_caller
 class FoodService:
     
     @staticmethod
-    async def search_foods(query: str, limit: int = 20) -> List[FoodSearchResponse]:
-        """Buscar alimentos por nombre o marca"""
-        # Crear regex para búsqueda flexible
-        regex_pattern = re.compile(query, re.IGNORECASE)
+    def _to_search_response(
+        doc: dict,
+        score: Optional[float] = None,
+        distance: Optional[float] = None
+    ) -> FoodSearchResponse:
+        return FoodSearchResponse(
+            id=str(doc["_id"]),
+            name=doc["name"],
+            brand=doc.get("brand"),
+            category=doc["category"],
+            calories_per_100g=doc["nutritional_info_per_100g"]["calories"],
+            protein_per_100g=doc["nutritional_info_per_100g"]["protein"],
+            carbs_per_100g=doc["nutritional_info_per_100g"]["carbohydrates"],
+            fat_per_100g=doc["nutritional_info_per_100g"]["fat"],
+            portions=doc.get("portions", []),
+            score=round(score, 4) if score is not None else None,
+            distance=distance
+        )
+    
+    @staticmethod
+    async def search_foods(
+        query: str,
+        limit: int = 20,
+        sort: Optional[str] = None,
+        fuzzy: bool = False,
+        stats: Optional[dict] = None,
+        filters: Optional[NutrientFilter] = None
+    ) -> List[FoodSearchResponse]:
+        """Buscar alimentos por nombre, marca o categoría (con caché)"""
+        filters = filters or NutrientFilter()
+        # Mientras el índice en memoria no está cargado se consulta MongoDB sin cachear,
+        # agrupando las búsquedas idénticas que lleguen a la vez
+        if not (search_index.ready and nutrient_index.ready):
+            if stats is not None:
+                stats["query_plan"] = FoodService._mongo_plan(filters, sort)
+            return await food_singleflight.do(
+                ("search_foods", query, limit, sort, filters.cache_key()),
+                lambda: FoodService._search_foods_regex(query, limit, sort, filters)
+            )
         
-        # Búsqueda en MongoDB
-        cursor = async_foods_collection.find({
+        key = (normalize_text(query), limit, sort, fuzzy, filters.cache_key())
+        cached = search_cache.get(key)
+        if cached is None:
+            cached_stats = {}
+            results = FoodService._search_index(query, limit, sort, fuzzy, cached_stats, filters)
+            cached = (results, cached_stats)
+            search_cache.set(key, cached)
+        
+        results, cached_stats = cached
+        if stats is not None:
+            stats.update(cached_stats)
+        return results
+    
+    @staticmethod
+    def _search_index(
+        query: str,
+        limit: int,
+        sort: Optional[str],
+        fuzzy: bool,
+        stats: dict,
+        filters: NutrientFilter
+    ) -> List[FoodSearchResponse]:
+        """Búsqueda sobre el índice invertido en memoria"""
+        if not filters.is_active() and sort in (None, "relevance"):
+            stats["query_plan"] = "memory:inverted-index"
+            if sort == "relevance":
+                stats["query_plan"] += " > rank(bm25f)"
+                return [
+                    FoodService._to_search_response(doc, score)
+                    for doc, score in search_index.search_ranked(query, limit, fuzzy, stats)
+                ]
+            docs = search_index.search(query, limit, fuzzy, stats)
+            return [FoodService._to_search_response(doc) for doc in docs]
+        
+        # Las coincidencias del índice invertido se filtran y ordenan en el índice de nutrientes
+        matched = search_index.match(query, fuzzy, stats)
+        if sort == "relevance":
+            ids, plan = nutrient_index.query(filters.ranges(), filters.category, candidates=matched)
+            stats["query_plan"] = plan.replace("memory:", "memory:inverted-index > ") + " > rank(bm25f)"
+            return [
+                FoodService._to_search_response(doc, score)
+                for doc, score in search_index.search_ranked(query, limit, fuzzy, allowed=set(ids))
+            ]
+        ids, plan = nutrient_index.query(
+            filters.ranges(), filters.category, sort, limit=limit, candidates=matched
+        )
+        stats["query_plan"] = plan.replace("memory:", "memory:inverted-index > ")
+        return [FoodService._to_search_response(search_index.get(doc_id)) for doc_id in ids]
+    
+    @staticmethod
+    def _nutrient_pipeline(filters: NutrientFilter, sort: Optional[str]) -> List[dict]:
+        """Etapas de agregación equivalentes a los filtros y el orden por nutrientes"""
+        match = {}
+        if filters.category is not None:
+            match["category"] = filters.category
+        for field, (low, high) in filters.ranges().items():
+            condition = {}
+            if low is not None:
+                condition["$gte"] = low
+            if high is not None:
+                condition["$lte"] = high
+            match[f"nutritional_info_per_100g.{field}"] = condition
+        
+        pipeline = [{"$match": match}] if match else []
+        if not sort or sort == "relevance":
+            return pipeline + [{"$sort": {"_id": 1}}]
+        key, descending = parse_sort(sort)
+        if key in DERIVED_KEYS:
+            # protein_per_kcal: proteína por kcal (null si el alimento no tiene calorías)
+            pipeline.append({"$addFields": {key: {"$cond": [
+                {"$gt": ["$nutritional_info_per_100g.calories", 0]},
+                {"$divide": ["$nutritional_info_per_100g.protein",
+                             "$nutritional_info_per_100g.calories"]},
+                None
+            ]}}})
+            sort_field = key
+        else:
+            sort_field = f"nutritional_info_per_100g.{key}"
+        return pipeline + [{"$sort": {sort_field: -1 if descending else 1, "_id": 1}}]
+    
+    @staticmethod
+    def _mongo_plan(filters: NutrientFilter, sort: Optional[str]) -> str:
+        """Descripción del plan cuando la consulta se resuelve en MongoDB"""
+        steps = []
+        if filters.category is not None:
+            steps.append("match(category)")
+        steps.extend(f"match({field})" for field in filters.ranges())
+        if sort and sort != "relevance":
+            steps.append(f"sort({parse_sort(sort)[0]})")
+        else:
+            steps.append("sort(_id)")
+        return "mongo:" + " > ".join(steps)
+    
+    @staticmethod
+    def _text_match(query: str) -> dict:
+        """Filtro de la búsqueda en MongoDB: el texto en nombre, marca o categoría"""
+        # Crear regex para búsqueda flexible
+        regex_pattern = re.compile(re.escape(query), re.IGNORECASE)
+        return {
             "$or": [
                 {"name": regex_pattern},
                 {"brand": regex_pattern},
                 {"category": regex_pattern}
             ]
-        }).limit(limit)
+        }
+    
+    @staticmethod
+    async def _search_foods_regex(
+        query: str,
+        limit: int = 20,
+        sort: Optional[str] = None,
+        filters: Optional[NutrientFilter] = None
+    ) -> List[FoodSearchResponse]:
+        """Búsqueda directa en MongoDB mientras el índice no está disponible"""
+        text_match = FoodService._text_match(query)
+        
+        # Búsqueda en MongoDB
+        if filters is not None and (filters.is_active() or sort not in (None, "relevance")):
+            pipeline = [{"$match": text_match}]
+            pipeline += FoodService._nutrient_pipeline(filters, sort)
+            cursor = get_async_foods_collection().aggregate(pipeline + [{"$limit": limit}])
+        else:
+            cursor = get_async_foods_collection().find(text_match).limit(limit)
         
         results = []
         async for doc in cursor:
-            results.append(FoodSearchResponse(
-                id=str(doc["_id"]),
-                name=doc["name"],
-                brand=doc.get("brand"),
-                category=doc["category"],
-                calories_per_100g=doc["nutritional_info_per_100g"]["calories"],
-                protein_per_100g=doc["nutritional_info_per_100g"]["protein"],
-                carbs_per_100g=doc["nutritional_info_per_100g"]["carbohydrates"],
-                fat_per_100g=doc["nutritional_info_per_100g"]["fat"],
-                portions=doc.get("portions", [])
-            ))
+            results.append(FoodService._to_search_response(doc))
         
         return results
     
+    @staticmethod
+    def suggest_foods(query: str, limit: int = 10) -> List[FoodSuggestion]:
+        """Sugerencias de autocompletado servidas desde memoria"""
+        return [
+            FoodSuggestion(id=doc_id, display_name=name)
+            for doc_id, name in suggest_index.suggest(query, limit)
+        ]
+    
+    @staticmethod
+    def get_similar_foods(
+        food_id: str,
+        k: int = 10,
+        same_category: bool = False
+    ) -> Optional[List[FoodSearchResponse]]:
+        """
+        Alimentos con el perfil nutricional más parecido (None si el alimento no existe)
+        
+        Lanza RuntimeError si el índice de similitud aún no está cargado.
+        """
+        if not (similarity_index.ready and search_index.ready):
+            raise RuntimeError("El índice de similitud todavía se está cargando")
+        neighbours = similarity_index.similar(food_id, k, same_category)
+        if neighbours is None:
+            return None
+        return [
+            FoodService._to_search_response(search_index.get(neighbour_id), distance=distance)
+            for neighbour_id, distance in neighbours
+        ]
+    
     @staticmethod
     async def get_food_by_id(food_id: str) -> Optional[Food]:
-        """Obtener alimento por ID"""
+        """Obtener alimento por ID (una sola consulta para peticiones simultáneas)"""
+        if catalog_snapshot.ready:
+            doc = catalog_snapshot.get(food_id)
+            return Food(**doc) if doc else None
+        return await food_singleflight.do(
+            ("get_food_by_id", food_id),
+            lambda: FoodService._get_food_by_id(food_id)
+        )
+    
+    @staticmethod
+    async def _get_food_by_id(food_id: str) -> Optional[Food]:
         try:
-            doc = await async_foods_collection.find_one({"_id": ObjectId(food_id)})
-            if doc:
-                doc["_id"] = str(doc["_id"])
-                return Food(**doc)
-        except:
+            object_id = ObjectId(food_id)
+        except (InvalidId, TypeError):
             return None
+        doc = await get_async_foods_collection().find_one({"_id": object_id})
+        if doc:
+            doc["_id"] = str(doc["_id"])
+            return Food(**doc)
+        return None
+    
+    @staticmethod
+    async def get_foods_by_ids(
+        food_ids: List[str],
+        fields: Optional[List[str]] = None
+    ) -> FoodBatchResponse:
+        """Obtener varios alimentos con una sola consulta `$in`, en el orden pedido"""
+        object_ids = {}
+        invalid = []
+        for food_id in food_ids:
+            try:
+                object_ids[food_id] = ObjectId(food_id)
+            except (InvalidId, TypeError):
+                invalid.append(food_id)
+        
+        projection = dict.fromkeys(fields, 1) if fields else None
+        found = {}
+        if object_ids:
+            query = {"_id": {"$in": list(set(object_ids.values()))}}
+            async for doc in get_async_foods_collection().find(query, projection):
+                doc["_id"] = str(doc["_id"])
+                if fields:
+                    found[doc["_id"]] = doc
+                else:
+                    found[doc["_id"]] = Food(**doc).model_dump(by_alias=True)
+        
+        foods = []
+        missing = []
+        for food_id in food_ids:
+            doc = found.get(str(object_ids[food_id])) if food_id in object_ids else None
+            if doc is None and food_id in object_ids:
+                missing.append(food_id)
+            foods.append(doc)
+        return FoodBatchResponse(foods=foods, missing=missing, invalid=invalid)
+    
+    @staticmethod
+    async def get_food_by_barcode(code: str) -> Optional[Food]:
+        """Obtener alimento por código de barras (ValueError si el código no es válido)"""
+        barcode = normalize_barcode(code)
+        doc = await get_async_foods_collection().find_one({"barcode": barcode})
+        if doc:
+            doc["_id"] = str(doc["_id"])
+            return Food(**doc)
+        return None
+    
+    @staticmethod
+    async def get_foods_by_barcodes(codes: List[str]) -> BarcodeLookupResponse:
+        """Resolver varios códigos de barras con una sola consulta `$in`"""
+        normalized = {}
+        errors = {}
+        for code in codes:
+            try:
+                normalized[code] = normalize_barcode(code)
+            except ValueError as error:
+                errors[code] = str(error)
+        
+        found = {}
+        if normalized:
+            query = {"barcode": {"$in": list(set(normalized.values()))}}
+            async for doc in get_async_foods_collection().find(query):
+                doc["_id"] = str(doc["_id"])
+                found[doc["barcode"]] = Food(**doc)
+        
+        results = []
+        for code in codes:
+            barcode = normalized.get(code)
+            food = found.get(barcode) if barcode else None
+            results.append(BarcodeResult(
+                code=code,
+                barcode=barcode,
+                found=food is not None,
+                food=food,
+                error=errors.get(code)
+            ))
+        hits = sum(1 for result in results if result.found)
+        return BarcodeLookupResponse(results=results, hits=hits, misses=len(results) - hits)
+    
+    @staticmethod
+    async def compute_nutrition(items: List[NutritionItem]) -> NutritionComputeResponse:
+        """Calcular nutrientes de muchos elementos con una consulta y una pasada NumPy"""
+        # Clave normalizada de cada elemento (hex en minúsculas, como str(doc["_id"]))
+        keys = []
+        object_ids = set()
+        for item in items:
+            try:
+                object_id = ObjectId(item.food_id)
+            except (InvalidId, TypeError):
+                keys.append(item.food_id)
+                continue
+            object_ids.add(object_id)
+            keys.append(str(object_id))
+        
+        docs = {}
+        if object_ids:
+            query = {"_id": {"$in": list(object_ids)}}
+            projection = {"name": 1, "nutritional_info_per_100g": 1, "portions": 1}
+            async for doc in get_async_foods_collection().find(query, projection):
+                docs[str(doc["_id"])] = doc
+        
+        per_item, totals, grams, errors = compute_nutrients(docs, [
+            (key, item.portion, item.grams, item.quantity) for key, item in zip(keys, items)
+        ])
+        results = []
+        for position, item in enumerate(items):
+            doc = docs.get(keys[position])
+            error = errors[position]
+            nutrients = None
+            if error is None:
+                nutrients = NutritionalInfo(**dict(zip(
+                    NUTRIENT_FIELDS, per_item[position].round(1).tolist()
+                )))
+            results.append(NutritionItemResult(
+                food_id=item.food_id,
+                name=doc["name"] if doc else None,
+                grams=round(float(grams[position]), 1),
+                nutrients=nutrients,
+                error=error
+            ))
+        return NutritionComputeResponse(
+            items=results,
+            totals=NutritionalInfo(**dict(zip(NUTRIENT_FIELDS, totals.round(1).tolist())))
+        )
+    
+    @staticmethod
+    async def plan_meal(request: MealPlanRequest) -> MealPlanResponse:
+        """
+        Combinación de alimentos y porciones más cercana al objetivo
+        
+        La búsqueda se ejecuta en un hilo para no bloquear el bucle de eventos.
+        Lanza RuntimeError si el catálogo aún no está cargado.
+        """
+        if not meal_planner.ready:
+            raise RuntimeError("El catálogo todavía se está cargando")
+        result = await asyncio.to_thread(
+            meal_planner.solve,
+            request.targets(),
+            request.tolerance,
+            request.categories,
+            request.max_items,
+            request.time_budget_ms / 1000
+        )
+        return MealPlanResponse(**result)
     
     @staticmethod
     async def create_food(food: Food) -> str:
         """Crear nuevo alimento"""
         food_dict = food.model_dump(exclude={"id"})
-        result = await async_foods_collection.insert_one(food_dict)
+        food_dict["barcode"] = clean_barcode(food_dict.get("barcode"))
+        result = await get_async_foods_collection().insert_one(food_dict)
+        
+        # Reflejar el alta en los índices (e invalidar la caché) sin esperar a la sincronización
+        food_dict["_id"] = result.inserted_id
+        catalog_sync.upsert(food_dict)
+        await catalog_sync.settle()
         return str(result.inserted_id)
     
     @staticmethod
-    async def get_all_foods(skip: int = 0, limit: int = 100) -> List[Food]:
-        """Obtener todos los alimentos con paginación"""
-        cursor = async_foods_collection.find().skip(skip).limit(limit)
+    async def get_all_foods(
+        skip: int = 0,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        sort: Optional[str] = None,
+        filters: Optional[NutrientFilter] = None,
+        stats: Optional[dict] = None
+    ) -> List[Food]:
+        """
+        Obtener todos los alimentos con paginación ordenada por `_id`
+        
+        Con `cursor` se continúa justo después del último `_id` devuelto
+        (coste constante por página); sin él se usa `skip` como antes.
+        Con filtros de nutrientes o `sort` se resuelve en el índice de
+        nutrientes en memoria (o con una agregación sobre los índices
+        category + nutriente si aún no está cargado y hay categoría). Lanza
+        ValueError si el cursor no es válido o se combina con filtros u
+        orden, y RuntimeError si el índice aún no está cargado y no hay
+        categoría (la agregación recorrería toda la colección).
+        """
+        stats = {} if stats is None else stats
+        filters = filters or NutrientFilter()
+        if filters.is_active() or sort:
+            if cursor:
+                raise ValueError("El cursor no se puede combinar con filtros de nutrientes ni con sort")
+            return await FoodService._get_filtered_foods(skip, limit, sort, filters, stats)
+        
+        if catalog_snapshot.ready:
+            stats["query_plan"] = "memory:snapshot"
+            after = decode_cursor(cursor) if cursor else None
+            return [Food(**doc) for doc in catalog_snapshot.page(skip, limit, after)]
+        
+        stats["query_plan"] = "mongo:sort(_id)"
+        if cursor:
+            query = {"_id": {"$gt": decode_cursor(cursor)}}
+            documents = get_async_foods_collection().find(query).sort("_id", 1).limit(limit)
+        else:
+            documents = get_async_foods_collection().find().sort("_id", 1).skip(skip).limit(limit)
         results = []
-        async for doc in cursor:
+        async for doc in documents:
             doc["_id"] = str(doc["_id"])
             results.append(Food(**doc))
         return results
     
     @staticmethod
-    async def get_categories() -> List[str]:
-        """Obtener todas las categorías únicas"""
-        categories = await async_foods_collection.distinct("category")
-        return sorted(categories)
\ No newline at end of file
+    async def _get_filtered_foods(
+        skip: int,
+        limit: int,
+        sort: Optional[str],
+        filters: NutrientFilter,
+        stats: dict
+    ) -> List[Food]:
+        """Listado con filtros de nutrientes y orden por nutriente"""
+        if not nutrient_index.ready:
+            if filters.category is None:
+                # Sin categoría ningún índice de MongoDB acota la consulta
+                raise RuntimeError("El índice de nutrientes todavía se está cargando")
+            stats["query_plan"] = FoodService._mongo_plan(filters, sort)
+            pipeline = FoodService._nutrient_pipeline(filters, sort)
+            pipeline += [
+                {"$skip": skip},
+                {"$limit": limit},
+                {"$project": dict.fromkeys(DERIVED_KEYS, 0)}
+            ]
+            results = []
+            async for doc in get_async_foods_collection().aggregate(pipeline):
+                doc["_id"] = str(doc["_id"])
+                results.append(Food(**doc))
+            return results
+        
+        ids, stats["query_plan"] = nutrient_index.query(
+            filters.ranges(), filters.category, sort, skip, limit
+        )
+        if catalog_snapshot.ready:
+            return [Food(**catalog_snapshot.get(doc_id)) for doc_id in ids]
+        if search_index.ready:
+            return [Food(**search_index.get(doc_id)) for doc_id in ids]
+        
+        docs = {}
+        async for doc in get_async_foods_collection().find({"_id": {"$in": [ObjectId(i) for i in ids]}}):
+            doc["_id"] = str(doc["_id"])
+            docs[doc["_id"]] = doc
+        return [Food(**docs[doc_id]) for doc_id in ids if doc_id in docs]
+    
+    @staticmethod
+    async def export_foods(
+        since: Optional[datetime] = None,
+        compress: bool = False
+    ) -> AsyncIterator[bytes]:
+        """
+        Exportar el catálogo como JSON por líneas (NDJSON), opcionalmente en gzip
+        
+        Recorre la colección con un cursor por lotes y emite bloques de tamaño
+        acotado, de modo que la memoria no depende del tamaño del catálogo.
+        Con `since` solo exporta los alimentos actualizados desde esa fecha,
+        ordenados por `updated_at` para poder encadenar exportaciones.
+        """
+        if since:
+            documents = get_async_foods_collection().find({"updated_at": {"$gte": since}}).sort(
+                [("updated_at", 1), ("_id", 1)]
+            )
+        else:
+            documents = get_async_foods_collection().find().sort("_id", 1)
+        documents = documents.batch_size(EXPORT_BATCH_SIZE)
+        
+        compressor = zlib.compressobj(wbits=31) if compress else None
+        buffer = bytearray()
+        async for doc in documents:
+            doc["_id"] = str(doc["_id"])
+            buffer += Food(**doc).model_dump_json(by_alias=True).encode()
+            buffer += b"\n"
+            if len(buffer) >= EXPORT_CHUNK_BYTES:
+                yield compressor.compress(bytes(buffer)) if compressor else bytes(buffer)
+                buffer.clear()
+        
+        if compressor:
+            yield compressor.compress(bytes(buffer)) + compressor.flush()
+        elif buffer:
+            yield bytes(buffer)
+    
+    @staticmethod
+    async def get_categories(
+        with_counts: bool = False
+    ) -> Union[List[str], List[CategoryCount]]:
+        """Obtener todas las categorías únicas (desde la tabla de facetas en memoria)"""
+        if facet_table.ready:
+            counts = facet_table.counts("category")
+        else:
+            counts = {
+                group["_id"]: group["count"]
+                async for group in get_async_foods_collection().aggregate([
+                    {"$group": {"_id": "$category", "count": {"$sum": 1}}}
+                ])
+                if group["_id"] is not None
+            }
+        
+        if with_counts:
+            return [
+                CategoryCount(category=category, count=counts[category])
+                for category in sorted(counts)
+            ]
+        return sorted(counts)
\ No newline at end of file
@@ -0,0 +1,109 @@
+from typing import Dict, Iterable, List, Set
+
+# Solo se generan borrados sobre los primeros caracteres del término
+# (técnica SymSpell) para acotar memoria; la distancia real se verifica después
+PREFIX_LENGTH = 7
+
+
+def max_distance_for(term: str) -> int:
+    """Distancia de edición tolerada según la longitud del término"""
+    if len(term) <= 3:
+        return 0
+    if len(term) <= 7:
+        return 1
+    return 2
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Distancia Damerau-Levenshtein (variante OSA) con corte temprano
+
+    Devuelve `limit + 1` en cuanto se sabe que la distancia supera el límite.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous_previous: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + cost
+            )
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+def _deletes(word: str, distance: int) -> Set[str]:
+    """Variantes del término con hasta `distance` caracteres borrados"""
+    variants = {word}
+    frontier = {word}
+    for _ in range(distance):
+        next_frontier = set()
+        for variant in frontier:
+            for position in range(len(variant)):
+                next_frontier.add(variant[:position] + variant[position + 1:])
+        variants |= next_frontier
+        frontier = next_frontier
+    return variants
+
+
+class FuzzyIndex:
+    """
+    Índice de borrados (SymSpell) sobre el vocabulario normalizado
+
+    Para cada término del vocabulario se guardan las variantes obtenidas
+    borrando hasta dos caracteres. Una consulta genera sus propias variantes
+    y solo compara la distancia real con los términos que comparten alguna,
+    sin recorrer el vocabulario completo.
+    """
+
+    MAX_DISTANCE = 2
+
+    def __init__(self):
+        self._deletes: Dict[str, Set[str]] = {}
+
+    def rebuild(self, terms: Iterable[str]) -> None:
+        """Reconstruir el índice a partir del vocabulario"""
+        self._deletes = {}
+        for term in terms:
+            self.add(term)
+
+    def add(self, term: str) -> None:
+        """Registrar un término nuevo del vocabulario"""
+        for variant in _deletes(term[:PREFIX_LENGTH], self.MAX_DISTANCE):
+            self._deletes.setdefault(variant, set()).add(term)
+
+    def remove(self, term: str) -> None:
+        """Olvidar un término que ya no aparece en el catálogo"""
+        for variant in _deletes(term[:PREFIX_LENGTH], self.MAX_DISTANCE):
+            terms = self._deletes.get(variant)
+            if terms is not None:
+                terms.discard(term)
+                if not terms:
+                    del self._deletes[variant]
+
+    def lookup(self, term: str) -> Dict[str, int]:
+        """Términos distintos del dado a distancia tolerada, con su distancia"""
+        limit = max_distance_for(term)
+        if limit == 0:
+            return {}
+
+        candidates: Set[str] = set()
+        for variant in _deletes(term[:PREFIX_LENGTH], limit):
+            candidates |= self._deletes.get(variant, set())
+
+        matches = {}
+        candidates.discard(term)
+        for candidate in candidates:
+            distance = edit_distance(term, candidate, limit)
+            if distance <= limit:
+                matches[candidate] = distance
+        return matches
@@ -0,0 +1,263 @@
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+import time
+import numpy as np
+from app.services.nutrition import NUTRIENT_FIELDS, nutrient_row
+
+# Cantidades de cada porción que se consideran (1, 2 o 3 unidades)
+PORTION_QUANTITIES = (1, 2, 3)
+
+# Opciones (alimento, porción, cantidad) preseleccionadas para la búsqueda
+POOL_SIZE = 150
+
+# Las opciones desactivadas se eliminan cuando superan esta fracción del total
+DEAD_OPTIONS_RATIO = 0.25
+
+
+class _Options(NamedTuple):
+    """Estado completo del planificador; se sustituye entero, nunca se modifica"""
+    food_ids: List[str]
+    names: List[str]
+    categories: List[Optional[str]]
+    food: np.ndarray
+    portion: List[str]
+    quantity: np.ndarray
+    grams: np.ndarray
+    nutrients: np.ndarray
+    alive: np.ndarray
+
+
+class MealPlanner:
+    """
+    Combinaciones de alimentos y porciones que se acercan a un objetivo de macros
+
+    Mantiene una matriz precalculada de "opciones" (alimento × porción ×
+    cantidad) con los nutrientes de cada una. Para resolver se preselecciona
+    un grupo de opciones prometedoras y se hace una búsqueda entera acotada:
+    en profundidad sobre los primeros elementos y vectorizada con NumPy para
+    los dos últimos, podando las combinaciones que ya superan el objetivo más
+    la tolerancia. Es consumidor de CatalogSync.
+
+    `solve` se ejecuta en un hilo mientras CatalogSync aplica cambios en el
+    bucle de eventos: todo el estado vive en un único `_Options` que las
+    actualizaciones sustituyen de una vez, y `solve` trabaja con el que había
+    al empezar.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._reset()
+
+    def _reset(self) -> None:
+        self._food_of: Dict[str, int] = {}
+        self._options = _Options(
+            food_ids=[],
+            names=[],
+            categories=[],
+            food=np.zeros(0, dtype=np.intp),
+            portion=[],
+            quantity=np.zeros(0),
+            grams=np.zeros(0),
+            nutrients=np.zeros((0, len(NUTRIENT_FIELDS)), dtype=np.float32),
+            alive=np.zeros(0, dtype=bool)
+        )
+
+    def rebuild(self, docs: Iterable[dict]) -> None:
+        """Recalcular la matriz de opciones"""
+        self._reset()
+        self._append(docs)
+        self.ready = True
+
+    def upsert(self, doc: dict) -> None:
+        """Añadir o sustituir las opciones de un alimento"""
+        self._append([doc])
+
+    def _append(self, docs: Iterable[dict]) -> None:
+        current = self._options
+        food_ids, names, categories = list(current.food_ids), list(current.names), list(current.categories)
+        alive = current.alive.copy()
+        foods, portions, quantities, grams, per_100g = [], [], [], [], []
+        for doc in docs:
+            doc_id = str(doc["_id"])
+            food = self._food_of.get(doc_id)
+            if food is None:
+                food = len(food_ids)
+                self._food_of[doc_id] = food
+                food_ids.append(doc_id)
+                names.append(doc.get("name") or "")
+                categories.append(doc.get("category"))
+            else:
+                # Las opciones antiguas quedan desactivadas hasta la siguiente compactación
+                alive[current.food == food] = False
+                names[food] = doc.get("name") or ""
+                categories[food] = doc.get("category")
+
+            nutrients = nutrient_row(doc)
+            for portion in doc.get("portions") or [{"name": "100g", "weight_grams": 100}]:
+                for quantity in PORTION_QUANTITIES:
+                    foods.append(food)
+                    portions.append(portion["name"])
+                    quantities.append(quantity)
+                    grams.append(float(portion["weight_grams"]) * quantity)
+                    per_100g.append(nutrients)
+
+        grams = np.array(grams, dtype=np.float64)
+        nutrients = (np.array(per_100g, dtype=np.float64).reshape(len(foods), len(NUTRIENT_FIELDS))
+                     * grams[:, None] / 100).astype(np.float32)
+        options = _Options(
+            food_ids=food_ids,
+            names=names,
+            categories=categories,
+            food=np.concatenate([current.food, np.array(foods, dtype=np.intp)]),
+            portion=current.portion + portions,
+            quantity=np.concatenate([current.quantity, np.array(quantities, dtype=np.float64)]),
+            grams=np.concatenate([current.grams, grams]),
+            nutrients=np.vstack([current.nutrients, nutrients]),
+            alive=np.concatenate([alive, np.ones(len(foods), dtype=bool)])
+        )
+        self._options = self._compact(options)
+
+    @staticmethod
+    def _compact(options: _Options) -> _Options:
+        """Eliminar las opciones desactivadas si ya son demasiadas"""
+        dead = len(options.alive) - int(options.alive.sum())
+        if dead <= DEAD_OPTIONS_RATIO * len(options.alive):
+            return options
+        keep = np.flatnonzero(options.alive)
+        return options._replace(
+            food=options.food[keep],
+            portion=[options.portion[index] for index in keep],
+            quantity=options.quantity[keep],
+            grams=options.grams[keep],
+            nutrients=options.nutrients[keep],
+            alive=np.ones(len(keep), dtype=bool)
+        )
+
+    @staticmethod
+    def _pool(relative: np.ndarray) -> np.ndarray:
+        """Opciones más prometedoras: proporciones parecidas al objetivo o ricas en un nutriente"""
+        totals = relative.sum(axis=1)
+        norms = np.linalg.norm(relative, axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cosine = np.where(norms > 0, totals / (norms * np.sqrt(relative.shape[1])), 0.0)
+            shares = np.where(totals[:, None] > 0, relative / totals[:, None], 0.0)
+
+        def top(scores: np.ndarray, count: int) -> np.ndarray:
+            if len(scores) <= count:
+                return np.argsort(-scores, kind="stable")
+            best = np.argpartition(-scores, count)[:count]
+            return best[np.argsort(-scores[best], kind="stable")]
+
+        picked = list(top(cosine, POOL_SIZE // 2))
+        if relative.shape[1] > 1:
+            per_dimension = POOL_SIZE // (2 * relative.shape[1])
+            for dimension in range(relative.shape[1]):
+                picked.extend(top(shares[:, dimension], per_dimension))
+        # Sin repetir y conservando el orden (las mejores primero)
+        return np.array(list(dict.fromkeys(int(i) for i in picked)), dtype=np.intp)
+
+    def solve(
+        self,
+        targets: Dict[str, float],
+        tolerance: float,
+        categories: Optional[Sequence[str]] = None,
+        max_items: int = 3,
+        time_budget: float = 0.2
+    ) -> dict:
+        """
+        Mejor combinación encontrada dentro del presupuesto de tiempo (segundos)
+
+        El error de una combinación es la mayor desviación relativa respecto a
+        los objetivos; está dentro de tolerancia si no supera `tolerance`.
+        """
+        started = time.perf_counter()
+        deadline = started + time_budget
+        dimensions = [NUTRIENT_FIELDS.index(field) for field in targets]
+        target = np.array(list(targets.values()), dtype=np.float64)
+        ceiling = 1 + tolerance
+        # Estado al empezar: las actualizaciones posteriores no lo modifican
+        state = self._options
+
+        mask = state.alive.copy()
+        if categories:
+            wanted = set(categories)
+            foods = [food for food, category in enumerate(state.categories) if category in wanted]
+            mask &= np.isin(state.food, foods)
+        options = np.flatnonzero(mask)
+        relative = state.nutrients[options][:, dimensions].astype(np.float64) / target
+        # Una opción que por sí sola se pasa del objetivo no puede formar parte de la solución
+        fits = (relative <= ceiling).all(axis=1) & (relative.sum(axis=1) > 0)
+        options, relative = options[fits], relative[fits]
+        pool = self._pool(relative)
+        options, vectors = options[pool], relative[pool]
+        foods = state.food[options]
+
+        best_error, best_combination = np.inf, ()
+        considered = 0
+        timed_out = False
+        # Nodos pendientes: (índices elegidos, suma relativa, primer índice disponible)
+        stack: List[Tuple[Tuple[int, ...], np.ndarray, int]] = [((), np.zeros(len(target)), 0)]
+        while stack:
+            if time.perf_counter() > deadline:
+                timed_out = True
+                break
+            chosen, partial, start = stack.pop()
+            used_foods = foods[list(chosen)]
+            candidates = np.arange(start, len(options))
+            candidates = candidates[~np.isin(foods[candidates], used_foods)]
+            sums = partial + vectors[candidates]
+            feasible = (sums <= ceiling).all(axis=1)
+            candidates, sums = candidates[feasible], sums[feasible]
+            if not len(candidates):
+                continue
+
+            # Completar con un elemento más
+            errors = np.abs(sums - 1).max(axis=1)
+            considered += len(candidates)
+            index = int(np.argmin(errors))
+            if errors[index] < best_error - 1e-9:
+                best_error = float(errors[index])
+                best_combination = chosen + (int(candidates[index]),)
+
+            # Completar con dos elementos más (pares j < k de alimentos distintos)
+            if len(chosen) + 2 <= max_items and len(candidates) > 1:
+                pairs = sums[:, None, :] + vectors[candidates][None, :, :]
+                valid = np.triu(np.ones((len(candidates), len(candidates)), dtype=bool), k=1)
+                valid &= foods[candidates][:, None] != foods[candidates][None, :]
+                valid &= (pairs <= ceiling).all(axis=2)
+                considered += int(valid.sum())
+                errors = np.where(valid, np.abs(pairs - 1).max(axis=2), np.inf)
+                first, second = np.unravel_index(int(np.argmin(errors)), errors.shape)
+                if errors[first, second] < best_error - 1e-9:
+                    best_error = float(errors[first, second])
+                    best_combination = chosen + (int(candidates[first]), int(candidates[second]))
+
+            # Ramificar para combinaciones de tres o más elementos
+            if len(chosen) + 3 <= max_items:
+                for position in range(len(candidates) - 1, -1, -1):
+                    candidate = int(candidates[position])
+                    stack.append((chosen + (candidate,), sums[position], candidate + 1))
+
+        items = [
+            {
+                "food_id": state.food_ids[state.food[options[index]]],
+                "name": state.names[state.food[options[index]]],
+                "portion": state.portion[options[index]],
+                "quantity": float(state.quantity[options[index]]),
+                "grams": float(state.grams[options[index]])
+            }
+            for index in best_combination
+        ]
+        totals = state.nutrients[options[list(best_combination)]].sum(axis=0, dtype=np.float64)
+        return {
+            "items": items,
+            "totals": dict(zip(NUTRIENT_FIELDS, (round(float(value), 2) for value in totals))),
+            "error": round(best_error, 4) if best_combination else None,
+            "within_tolerance": bool(best_combination) and best_error <= tolerance,
+            "solve_time_ms": round((time.perf_counter() - started) * 1000, 2),
+            "candidates_considered": considered,
+            "pool_size": len(options),
+            "timed_out": timed_out
+        }
+
+
+meal_planner = MealPlanner()
@@ -0,0 +1,239 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from app.services.nutrition import NUTRIENT_FIELDS, nutrient_row
+
+# Claves derivadas que se pueden usar para filtrar u ordenar
+DERIVED_KEYS = ("protein_per_kcal",)
+
+SORT_KEYS = NUTRIENT_FIELDS + DERIVED_KEYS
+
+Range = Tuple[Optional[float], Optional[float]]
+
+
+def parse_sort(sort: str) -> Tuple[str, bool]:
+    """Separar la clave de orden y si es descendente ("-protein")"""
+    return (sort[1:], True) if sort.startswith("-") else (sort, False)
+
+
+class NutrientIndex:
+    """
+    Índice de columnas ordenadas sobre `nutritional_info_per_100g`
+
+    Guarda los nutrientes de todos los alimentos en una matriz NumPy (filas
+    ordenadas por `_id`) y, para cada clave, el orden de las filas por valor.
+    Un rango se resuelve con búsqueda binaria sobre la columna ordenada más
+    selectiva y el resto de condiciones se aplican como máscaras vectoriales
+    sobre ese subconjunto; nunca se recorre la colección en MongoDB.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._ids: List[str] = []
+        self._row_of: Dict[str, int] = {}
+        # Matriz con capacidad de sobra; `_values` es la vista de las filas ocupadas
+        self._buffer = np.zeros((0, len(NUTRIENT_FIELDS)))
+        self._values = self._buffer
+        self._categories: List[Optional[str]] = []
+        self._category_rows: Dict[Optional[str], np.ndarray] = {}
+        self._sorted: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def rebuild(self, docs: Iterable[dict]) -> None:
+        """Reconstruir la matriz, las columnas ordenadas y las filas por categoría"""
+        docs = sorted(docs, key=lambda doc: str(doc["_id"]))
+        self._ids = [str(doc["_id"]) for doc in docs]
+        self._row_of = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        self._buffer = np.array([nutrient_row(doc) for doc in docs], dtype=np.float64)
+        self._buffer = self._buffer.reshape(len(docs), len(NUTRIENT_FIELDS))
+        self._values = self._buffer
+        self._categories = [doc.get("category") for doc in docs]
+        # Todo se calcula aquí (CatalogSync reconstruye en un hilo) y no en la primera consulta
+        self._sorted = {}
+        for key in SORT_KEYS:
+            self._sorted_column(key)
+        self._category_rows = {}
+        self._rows_in_category(None)
+        self.ready = True
+
+    def upsert(self, doc: dict) -> None:
+        """Añadir o actualizar un alimento manteniendo las columnas ordenadas"""
+        doc_id = str(doc["_id"])
+        row = self._row_of.get(doc_id)
+        category = doc.get("category")
+        if row is None:
+            row = len(self._ids)
+            if row == len(self._buffer):
+                # Capacidad doble para no copiar la matriz en cada alta
+                grown = np.zeros((max(1024, 2 * row), len(NUTRIENT_FIELDS)))
+                grown[:row] = self._buffer[:row]
+                self._buffer = grown
+            self._row_of[doc_id] = row
+            self._ids.append(doc_id)
+            self._categories.append(category)
+            added, previous = True, None
+        else:
+            added = False
+            previous = self._categories[row]
+            self._categories[row] = category
+        self._buffer[row] = nutrient_row(doc)
+        self._values = self._buffer[:len(self._ids)]
+        for key in self._sorted:
+            if added:
+                self._insert_sorted(key, row)
+            else:
+                self._move_sorted(key, row)
+        if self._category_rows and (added or previous != category):
+            self._move_category(row, previous, category, added)
+
+    def _sorted_position(self, key: str, row: int) -> Tuple[int, float]:
+        values, order = self._sorted[key]
+        value = self._row_value(key, row)
+        # Entre valores iguales, por fila (el mismo orden que argsort estable)
+        low = int(np.searchsorted(values, value, side="left"))
+        high = int(np.searchsorted(values, value, side="right"))
+        return low + int(np.searchsorted(order[low:high], row)), value
+
+    def _insert_sorted(self, key: str, row: int) -> None:
+        values, order = self._sorted[key]
+        position, value = self._sorted_position(key, row)
+        self._sorted[key] = (np.insert(values, position, value), np.insert(order, position, row))
+
+    def _move_sorted(self, key: str, row: int) -> None:
+        values, order = self._sorted[key]
+        old = int(np.flatnonzero(order == row)[0])
+        position, value = self._sorted_position(key, row)
+        if position > old:
+            # Sin contar la entrada antigua, que queda antes de la nueva posición
+            position -= 1
+            values[old:position] = values[old + 1:position + 1]
+            order[old:position] = order[old + 1:position + 1]
+        else:
+            values[position + 1:old + 1] = values[position:old]
+            order[position + 1:old + 1] = order[position:old]
+        values[position] = value
+        order[position] = row
+
+    def _move_category(
+        self, row: int, previous: Optional[str], category: Optional[str], added: bool
+    ) -> None:
+        rows = dict(self._category_rows)
+        if not added and previous in rows:
+            old = rows[previous]
+            rows[previous] = old[old != row]
+        current = rows.get(category, np.array([], dtype=np.intp))
+        rows[category] = np.insert(current, int(np.searchsorted(current, row)), row)
+        self._category_rows = rows
+
+    def _row_value(self, key: str, row: int) -> float:
+        values = self._values[row]
+        if key == "protein_per_kcal":
+            calories = values[NUTRIENT_FIELDS.index("calories")]
+            return values[NUTRIENT_FIELDS.index("protein")] / calories if calories > 0 else np.nan
+        return values[NUTRIENT_FIELDS.index(key)]
+
+    def column(self, key: str) -> np.ndarray:
+        """Valores de una clave para todas las filas (NaN si no se puede calcular)"""
+        if key == "protein_per_kcal":
+            calories = self._values[:, NUTRIENT_FIELDS.index("calories")]
+            protein = self._values[:, NUTRIENT_FIELDS.index("protein")]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return np.where(calories > 0, protein / calories, np.nan)
+        return self._values[:, NUTRIENT_FIELDS.index(key)]
+
+    def _sorted_column(self, key: str) -> Tuple[np.ndarray, np.ndarray]:
+        if key not in self._sorted:
+            column = self.column(key)
+            order = np.argsort(column, kind="stable")
+            self._sorted[key] = (column[order], order)
+        return self._sorted[key]
+
+    def _rows_in_category(self, category: Optional[str]) -> np.ndarray:
+        if not self._category_rows:
+            grouped: Dict[Optional[str], List[int]] = {}
+            for row, value in enumerate(self._categories):
+                grouped.setdefault(value, []).append(row)
+            self._category_rows = {
+                value: np.array(rows, dtype=np.intp) for value, rows in grouped.items()
+            }
+        return self._category_rows.get(category, np.array([], dtype=np.intp))
+
+    def _range_bounds(self, key: str, low: Optional[float], high: Optional[float]) -> Tuple[int, int]:
+        values, _ = self._sorted_column(key)
+        start = 0 if low is None else int(np.searchsorted(values, low, side="left"))
+        # Los NaN quedan al final de la columna ordenada y nunca cumplen un rango
+        finite_end = int(np.searchsorted(values, np.inf, side="right"))
+        end = finite_end if high is None else int(np.searchsorted(values, high, side="right"))
+        return start, min(end, finite_end)
+
+    def query(
+        self,
+        ranges: Dict[str, Range],
+        category: Optional[str] = None,
+        sort: Optional[str] = None,
+        skip: int = 0,
+        limit: Optional[int] = None,
+        candidates: Optional[Set[str]] = None
+    ) -> Tuple[List[str], str]:
+        """
+        Devolver los IDs que cumplen los filtros, ordenados, y el plan usado
+
+        Sin `sort` se mantiene el orden por `_id`. `candidates` restringe la
+        consulta a un conjunto previo (por ejemplo, coincidencias de búsqueda).
+        """
+        steps = []
+        remaining = dict(ranges)
+        sort_key, descending = parse_sort(sort) if sort else (None, False)
+
+        if candidates is not None:
+            rows = np.array(sorted(self._row_of[doc_id] for doc_id in candidates
+                                   if doc_id in self._row_of), dtype=np.intp)
+            steps.append(f"candidates({len(rows)})")
+        elif remaining:
+            # Empezar por el rango que deja menos filas
+            bounds = {key: self._range_bounds(key, *bound) for key, bound in remaining.items()}
+            key = min(bounds, key=lambda name: bounds[name][1] - bounds[name][0])
+            start, end = bounds[key]
+            rows = np.sort(self._sorted_column(key)[1][start:end])
+            del remaining[key]
+            steps.append(f"range-index({key})")
+        elif category is not None:
+            rows = self._rows_in_category(category)
+            category = None
+            steps.append("category-index")
+        elif sort_key:
+            rows = self._sorted_column(sort_key)[1]
+            steps.append(f"sorted-column({sort_key})")
+        else:
+            rows = np.arange(len(self._ids), dtype=np.intp)
+            steps.append("all-rows")
+
+        if category is not None:
+            rows = np.intersect1d(rows, self._rows_in_category(category), assume_unique=True)
+            steps.append("filter(category)")
+        for key, (low, high) in remaining.items():
+            values = self.column(key)[rows]
+            mask = ~np.isnan(values)
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+            rows = rows[mask]
+            steps.append(f"filter({key})")
+
+        if sort_key and not steps[0].startswith("sorted-column"):
+            values = self.column(sort_key)[rows]
+            if descending:
+                values = -values
+            rows = rows[np.argsort(values, kind="stable")]
+            steps.append(f"sort({sort_key})")
+        elif sort_key and descending:
+            # Invertir la columna ordenada dejando los NaN al final
+            values = self.column(sort_key)[rows]
+            finite = ~np.isnan(values)
+            rows = np.concatenate([rows[finite][::-1], rows[~finite]])
+
+        end = None if limit is None else skip + limit
+        page = [self._ids[row] for row in rows[skip:end]]
+        return page, "memory:" + " > ".join(steps)
+
+
+nutrient_index = NutrientIndex()
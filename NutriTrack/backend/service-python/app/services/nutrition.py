@@ -0,0 +1,63 @@
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+# Orden de las columnas de la matriz de nutrientes (igual que NutritionalInfo)
+NUTRIENT_FIELDS = ("calories", "protein", "carbohydrates", "fat", "fiber", "sugar", "sodium")
+
+
+def nutrient_row(doc: dict) -> List[float]:
+    """Nutrientes por 100 g de un documento, en el orden de NUTRIENT_FIELDS"""
+    info = doc.get("nutritional_info_per_100g") or {}
+    return [float(info.get(field) or 0) for field in NUTRIENT_FIELDS]
+
+
+def portion_grams(doc: dict, portion: str) -> Optional[float]:
+    """Gramos de una porción del alimento por su nombre (None si no existe)"""
+    for candidate in doc.get("portions") or []:
+        if candidate.get("name") == portion:
+            return float(candidate["weight_grams"])
+    return None
+
+
+def compute_nutrients(
+    docs: Dict[str, dict],
+    items: List[Tuple[str, Optional[str], Optional[float], float]]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[Optional[str]]]:
+    """
+    Calcular nutrientes por elemento y totales en una sola pasada vectorizada
+
+    `items` son tuplas (food_id, porción, gramos, cantidad). Se construye una
+    matriz alimentos × nutrientes (por 100 g) y un vector de gramos por
+    elemento; el resultado es `matriz[filas] * gramos / 100`. Devuelve la
+    matriz por elemento, los totales, los gramos y el error de cada
+    elemento (o None).
+    """
+    food_ids = list(docs)
+    row_of = {food_id: row for row, food_id in enumerate(food_ids)}
+    matrix = np.array([nutrient_row(docs[food_id]) for food_id in food_ids], dtype=np.float64)
+    matrix = matrix.reshape(len(food_ids), len(NUTRIENT_FIELDS))
+
+    rows = np.zeros(len(items), dtype=np.intp)
+    grams = np.zeros(len(items), dtype=np.float64)
+    errors: List[Optional[str]] = []
+    for position, (food_id, portion, amount, quantity) in enumerate(items):
+        doc = docs.get(food_id)
+        if doc is None:
+            errors.append("Alimento no encontrado")
+            continue
+        if portion is not None:
+            weight = portion_grams(doc, portion)
+            if weight is None:
+                errors.append(f"Porción '{portion}' no encontrada")
+                continue
+        else:
+            weight = amount if amount is not None else 100.0
+        rows[position] = row_of[food_id]
+        grams[position] = weight * quantity
+        errors.append(None)
+
+    if not len(food_ids):
+        per_item = np.zeros((len(items), len(NUTRIENT_FIELDS)))
+    else:
+        per_item = matrix[rows] * (grams / 100.0)[:, np.newaxis]
+    return per_item, per_item.sum(axis=0), grams, errors
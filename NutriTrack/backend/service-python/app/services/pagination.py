@@ -0,0 +1,18 @@
+from bson import ObjectId
+from bson.errors import InvalidId
+import base64
+import binascii
+
+
+def encode_cursor(food_id: str) -> str:
+    """Cursor opaco a partir del último `_id` devuelto"""
+    return base64.urlsafe_b64encode(ObjectId(food_id).binary).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> ObjectId:
+    """Recuperar el `_id` de un cursor; ValueError si no es válido"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return ObjectId(raw)
+    except (binascii.Error, InvalidId, TypeError) as error:
+        raise ValueError("Cursor inválido") from error
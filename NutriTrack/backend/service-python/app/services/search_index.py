@@ -0,0 +1,298 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from collections import Counter
+import bisect
+import heapq
+import math
+import re
+import unicodedata
+from app.services.catalog_snapshot import CATALOG_SNAPSHOT_ENABLED, CatalogSnapshot, catalog_snapshot
+from app.services.fuzzy_index import FuzzyIndex
+
+# Campos del documento que se indexan para la búsqueda
+SEARCH_FIELDS = ("name", "brand", "category")
+
+# Parámetros del ranking BM25F: peso de cada campo y normalización por longitud
+FIELD_WEIGHTS = (3.0, 1.5, 1.0)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Un término que solo coincide como prefijo puntúa menos que uno exacto
+PREFIX_MATCH_FACTOR = 0.6
+
+# Factor para términos corregidos por distancia de edición (se divide por la distancia)
+FUZZY_MATCH_FACTOR = 0.5
+
+# Multiplicadores cuando el nombre coincide con la consulta completa
+EXACT_NAME_BOOST = 2.0
+NAME_PREFIX_BOOST = 1.5
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Pasar a minúsculas, quitar acentos y sustituir signos por espacios"""
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    folded = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return _NON_ALNUM.sub(" ", folded).strip()
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Dividir un texto normalizado en términos"""
+    return normalize_text(text).split()
+
+
+class SearchIndex:
+    """
+    Índice invertido en memoria sobre nombre, marca y categoría
+
+    Cada término normalizado (sin acentos, en minúsculas) apunta a los
+    alimentos que lo contienen junto con su frecuencia en cada campo. El
+    vocabulario se mantiene ordenado para resolver prefijos con búsqueda
+    binaria, de modo que "pol" encuentra "pollo" sin recorrer la colección.
+
+    Con `store` (la instantánea del catálogo) los documentos no se guardan
+    aquí: los resultados se leen de la instantánea, que CatalogSync
+    actualiza antes que el índice.
+    """
+
+    def __init__(self, store: Optional[CatalogSnapshot] = None):
+        self.ready = False
+        self._store = store
+        self._postings: Dict[str, Dict[str, Tuple[int, ...]]] = {}
+        self._vocabulary: List[str] = []
+        self._docs: Dict[str, dict] = {}
+        self._doc_terms: Dict[str, Set[str]] = {}
+        self._field_lengths: Dict[str, Tuple[int, ...]] = {}
+        self._total_lengths = [0] * len(SEARCH_FIELDS)
+        self._order: Dict[str, int] = {}
+        self._sequence = 0
+        self.fuzzy = FuzzyIndex()
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def rebuild(self, docs: Iterable[dict]) -> None:
+        """Reconstruir el índice completo a partir de los documentos"""
+        self._postings = {}
+        self._vocabulary = []
+        self._docs = {}
+        self._doc_terms = {}
+        self._field_lengths = {}
+        self._total_lengths = [0] * len(SEARCH_FIELDS)
+        self._order = {}
+        self._sequence = 0
+        for doc in docs:
+            self._add(doc)
+        self._vocabulary = sorted(self._postings)
+        # Índice difuso nuevo: el anterior puede seguir en uso mientras se reconstruye
+        self.fuzzy = FuzzyIndex()
+        self.fuzzy.rebuild(self._vocabulary)
+        self.ready = True
+
+    def upsert(self, doc: dict) -> None:
+        """Añadir o actualizar un documento en el índice"""
+        doc_id = str(doc["_id"])
+        if doc_id in self._doc_terms:
+            self.remove(doc_id)
+        for term in self._add(doc):
+            if len(self._postings[term]) == 1:
+                bisect.insort(self._vocabulary, term)
+                self.fuzzy.add(term)
+
+    def remove(self, doc_id: str) -> None:
+        """Eliminar un documento del índice"""
+        self._docs.pop(doc_id, None)
+        self._order.pop(doc_id, None)
+        for position, length in enumerate(self._field_lengths.pop(doc_id, ())):
+            self._total_lengths[position] -= length
+        for term in self._doc_terms.pop(doc_id, ()):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+                index = bisect.bisect_left(self._vocabulary, term)
+                if index < len(self._vocabulary) and self._vocabulary[index] == term:
+                    del self._vocabulary[index]
+                self.fuzzy.remove(term)
+
+    def _add(self, doc: dict) -> Set[str]:
+        doc_id = str(doc["_id"])
+        field_counts = [Counter(tokenize(doc.get(field))) for field in SEARCH_FIELDS]
+        terms = set().union(*field_counts)
+        lengths = tuple(sum(counts.values()) for counts in field_counts)
+
+        if self._store is None:
+            self._docs[doc_id] = doc
+        self._doc_terms[doc_id] = terms
+        self._field_lengths[doc_id] = lengths
+        for position, length in enumerate(lengths):
+            self._total_lengths[position] += length
+        self._order[doc_id] = self._sequence
+        self._sequence += 1
+        for term in terms:
+            frequencies = tuple(counts[term] for counts in field_counts)
+            self._postings.setdefault(term, {})[doc_id] = frequencies
+        return terms
+
+    def expand_prefix(self, prefix: str) -> List[str]:
+        """Términos del vocabulario que empiezan por el prefijo dado"""
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        terms = []
+        for term in self._vocabulary[start:]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def _expand(self, term: str, fuzzy: bool, stats: Optional[dict]) -> Dict[str, float]:
+        """Términos del vocabulario que cubren un término de la consulta, con su factor"""
+        expansions = {
+            expanded: 1.0 if expanded == term else PREFIX_MATCH_FACTOR
+            for expanded in self.expand_prefix(term)
+        }
+        if fuzzy:
+            corrections = self.fuzzy.lookup(term)
+            if stats is not None:
+                stats["expanded_terms"] = stats.get("expanded_terms", 0) + len(corrections)
+            for corrected, distance in corrections.items():
+                expansions.setdefault(corrected, FUZZY_MATCH_FACTOR / distance)
+        return expansions
+
+    def _match_term(self, expansions: Dict[str, float]) -> Set[str]:
+        matched: Set[str] = set()
+        for expanded in expansions:
+            matched.update(self._postings[expanded])
+        return matched
+
+    def _match_all(self, expanded_terms: List[Dict[str, float]]) -> Set[str]:
+        # Empezar por el término más selectivo para reducir las intersecciones
+        candidate_sets = sorted(
+            (self._match_term(expansions) for expansions in expanded_terms),
+            key=len
+        )
+        matched = candidate_sets[0]
+        for candidates in candidate_sets[1:]:
+            if not matched:
+                break
+            matched = matched & candidates
+        return matched
+
+    def _term_weights(self, expansions: Dict[str, float]) -> Dict[str, float]:
+        """Puntuación BM25F de un término de la consulta para cada documento"""
+        total_docs = len(self._doc_terms)
+        average_lengths = [
+            (total / total_docs) or 1.0 for total in self._total_lengths
+        ]
+        scores: Dict[str, float] = {}
+        for expanded, factor in expansions.items():
+            postings = self._postings[expanded]
+            df = len(postings)
+            idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+            for doc_id, frequencies in postings.items():
+                lengths = self._field_lengths[doc_id]
+                tf = 0.0
+                for position, frequency in enumerate(frequencies):
+                    if frequency:
+                        norm = 1 - BM25_B + BM25_B * lengths[position] / average_lengths[position]
+                        tf += FIELD_WEIGHTS[position] * frequency / norm
+                score = factor * idf * tf * (BM25_K1 + 1) / (tf + BM25_K1)
+                # Con varias expansiones del término se queda la mejor
+                if score > scores.get(doc_id, 0.0):
+                    scores[doc_id] = score
+        return scores
+
+    def get(self, doc_id: str) -> Optional[dict]:
+        """Documento indexado por ID"""
+        if self._store is not None:
+            return self._store.get(doc_id)
+        return self._docs.get(doc_id)
+
+    def _name(self, doc_id: str) -> Optional[str]:
+        if self._store is not None:
+            return self._store.name(doc_id)
+        return self._docs[doc_id].get("name")
+
+    def match(self, query: str, fuzzy: bool = False, stats: Optional[dict] = None) -> Set[str]:
+        """IDs de todos los documentos que coinciden con la consulta, sin ordenar"""
+        terms = tokenize(query)
+        if not terms:
+            return set()
+        return self._match_all([self._expand(term, fuzzy, stats) for term in terms])
+
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        fuzzy: bool = False,
+        stats: Optional[dict] = None
+    ) -> List[dict]:
+        """
+        Buscar documentos que contengan todos los términos de la consulta
+
+        Cada término se interpreta como prefijo y debe aparecer en el nombre,
+        la marca o la categoría. Con `fuzzy` también valen los términos a
+        distancia de edición tolerada. Los resultados conservan el orden de carga.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        expanded_terms = [self._expand(term, fuzzy, stats) for term in terms]
+        matched = self._match_all(expanded_terms)
+        ids = heapq.nsmallest(limit, matched, key=self._order.__getitem__)
+        return [self.get(doc_id) for doc_id in ids]
+
+    def search_ranked(
+        self,
+        query: str,
+        limit: int = 20,
+        fuzzy: bool = False,
+        stats: Optional[dict] = None,
+        allowed: Optional[Set[str]] = None
+    ) -> List[Tuple[dict, float]]:
+        """
+        Buscar documentos ordenados por relevancia (BM25F)
+
+        Pondera nombre > marca > categoría, premia las coincidencias exactas
+        frente a las de prefijo y la coincidencia del nombre completo. Solo se
+        conservan los `limit` mejores en un montículo acotado. `allowed`
+        restringe el resultado a un conjunto de IDs ya filtrado.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        expanded_terms = [self._expand(term, fuzzy, stats) for term in terms]
+        matched = self._match_all(expanded_terms)
+        if allowed is not None:
+            matched &= allowed
+        if not matched:
+            return []
+
+        totals = dict.fromkeys(matched, 0.0)
+        for expansions in expanded_terms:
+            for doc_id, score in self._term_weights(expansions).items():
+                if doc_id in totals:
+                    totals[doc_id] += score
+
+        normalized_query = " ".join(terms)
+
+        def ranked():
+            for doc_id, score in totals.items():
+                name = normalize_text(self._name(doc_id))
+                if name == normalized_query:
+                    score *= EXACT_NAME_BOOST
+                elif name.startswith(normalized_query):
+                    score *= NAME_PREFIX_BOOST
+                # A igual puntuación, gana el documento cargado antes
+                yield score, -self._order[doc_id], doc_id
+
+        top = heapq.nlargest(limit, ranked())
+        return [(self.get(doc_id), score) for score, _, doc_id in top]
+
+
+search_index = SearchIndex(catalog_snapshot if CATALOG_SNAPSHOT_ENABLED else None)
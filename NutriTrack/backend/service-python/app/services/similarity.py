@@ -0,0 +1,237 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import heapq
+import math
+import numpy as np
+from app.services.nutrition import NUTRIENT_FIELDS, nutrient_row
+
+# Puntos por hoja del KD-tree; por debajo se calcula la distancia en bloque con NumPy
+LEAF_SIZE = 64
+
+
+class KDTree:
+    """
+    KD-tree estático sobre una matriz de puntos (filas × dimensiones)
+
+    Cada nodo parte por la mediana de la dimensión con más dispersión. Los
+    nodos se guardan en listas paralelas y los puntos de cada hoja son un
+    tramo contiguo de `_index`, de modo que la distancia a todos ellos se
+    calcula de una vez.
+    """
+
+    def __init__(self, points: np.ndarray):
+        self._points = points
+        self._index = np.arange(len(points), dtype=np.intp)
+        self._start: List[int] = []
+        self._end: List[int] = []
+        self._dim: List[int] = []
+        self._split: List[float] = []
+        self._left: List[int] = []
+        self._right: List[int] = []
+        if len(points):
+            self._build(0, len(points))
+
+    def _build(self, start: int, end: int) -> int:
+        node = len(self._start)
+        self._start.append(start)
+        self._end.append(end)
+        self._dim.append(-1)
+        self._split.append(0.0)
+        self._left.append(-1)
+        self._right.append(-1)
+        if end - start <= LEAF_SIZE:
+            return node
+
+        rows = self._index[start:end]
+        points = self._points[rows]
+        dim = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+        middle = (end - start) // 2
+        self._index[start:end] = rows[np.argpartition(points[:, dim], middle)]
+        self._dim[node] = dim
+        self._split[node] = float(self._points[self._index[start + middle], dim])
+        self._left[node] = self._build(start, start + middle)
+        self._right[node] = self._build(start + middle, end)
+        return node
+
+    def query(self, point: np.ndarray, k: int, exclude: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Los `k` puntos más cercanos (fila, distancia euclídea), del más cercano al más lejano"""
+        best: List[Tuple[float, int]] = []  # montículo de máximos: (-distancia², fila)
+        if not self._start or k <= 0:
+            return []
+
+        def visit(node: int) -> None:
+            dim = self._dim[node]
+            if dim < 0:
+                rows = self._index[self._start[node]:self._end[node]]
+                distances = ((self._points[rows] - point) ** 2).sum(axis=1)
+                if len(best) == k:
+                    # Descartar en bloque los puntos más lejanos que el peor candidato
+                    closer = distances < -best[0][0]
+                    rows, distances = rows[closer], distances[closer]
+                for row, distance in zip(rows.tolist(), distances.tolist()):
+                    if row == exclude:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, row))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, row))
+                return
+
+            diff = float(point[dim]) - self._split[node]
+            if diff < 0:
+                near, far = self._left[node], self._right[node]
+            else:
+                near, far = self._right[node], self._left[node]
+            visit(near)
+            # Solo se baja por la otra rama si el plano de corte está más cerca que el peor candidato
+            if len(best) < k or diff * diff < -best[0][0]:
+                visit(far)
+
+        visit(0)
+        return [(row, math.sqrt(-distance)) for distance, row in sorted(best, reverse=True)]
+
+
+class SimilarityIndex:
+    """
+    Vecinos más cercanos por perfil nutricional
+
+    Los nutrientes por 100 g se normalizan (puntuación z por columna) para
+    que el sodio en mg no pese más que la proteína en g. Al cargar se
+    construyen el KD-tree de todo el catálogo y uno por categoría. Es
+    consumidor de CatalogSync: un cambio no descarta los
+    árboles, solo marca los afectados (el global y los de su categoría
+    antigua y nueva), que siguen respondiendo hasta que CatalogSync llama a
+    `settle` y se reconstruyen en un hilo. La media y la desviación de la
+    normalización se fijan en cada carga completa.
+    """
+
+    GLOBAL = (False, None)
+
+    def __init__(self):
+        self.ready = False
+        self._ids: List[str] = []
+        self._row_of: Dict[str, int] = {}
+        # Matrices con capacidad de sobra; `_values` y `_normalized` son vistas de las filas ocupadas
+        self._values_buffer = np.zeros((0, len(NUTRIENT_FIELDS)))
+        self._normalized_buffer = np.zeros((0, len(NUTRIENT_FIELDS)))
+        self._values = self._values_buffer
+        self._normalized = self._normalized_buffer
+        self._categories: List[Optional[str]] = []
+        self._mean = np.zeros(len(NUTRIENT_FIELDS))
+        self._std = np.ones(len(NUTRIENT_FIELDS))
+        self._trees: Dict[Tuple[bool, Optional[str]], Tuple[KDTree, np.ndarray]] = {}
+        self._dirty: Set[Tuple[bool, Optional[str]]] = set()
+        # Una reconstrucción a la vez: una más antigua no puede sustituir a una más reciente
+        self._settling = asyncio.Lock()
+
+    def rebuild(self, docs: Iterable[dict]) -> None:
+        """Reconstruir a partir de los documentos (el árbol global y los de cada categoría)"""
+        docs = list(docs)
+        self._ids = [str(doc["_id"]) for doc in docs]
+        self._row_of = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        self._values = np.array([nutrient_row(doc) for doc in docs], dtype=np.float64)
+        self._values = self._values.reshape(len(docs), len(NUTRIENT_FIELDS))
+        self._categories = [doc.get("category") for doc in docs]
+        self._mean = self._values.mean(axis=0) if len(docs) else np.zeros(len(NUTRIENT_FIELDS))
+        self._std = self._values.std(axis=0) if len(docs) else np.ones(len(NUTRIENT_FIELDS))
+        self._std[self._std == 0] = 1.0
+        self._normalized = (self._values - self._mean) / self._std
+        self._values_buffer, self._normalized_buffer = self._values, self._normalized
+        keys = [self.GLOBAL] + [(True, category) for category in set(self._categories)]
+        self._trees = self._build_trees(self._normalized, self._categories, keys)
+        self._dirty = set()
+        self.ready = True
+
+    def upsert(self, doc: dict) -> None:
+        """Añadir o actualizar un alimento (los árboles afectados se reconstruyen en `settle`)"""
+        doc_id = str(doc["_id"])
+        values = nutrient_row(doc)
+        normalized = (values - self._mean) / self._std
+        category = doc.get("category")
+        row = self._row_of.get(doc_id)
+        if row is None:
+            row = len(self._ids)
+            if row == len(self._values_buffer):
+                # Capacidad doble para no copiar las matrices en cada alta
+                self._values_buffer = self._grown(self._values_buffer, row)
+                self._normalized_buffer = self._grown(self._normalized_buffer, row)
+            self._row_of[doc_id] = row
+            self._ids.append(doc_id)
+            self._categories.append(category)
+        else:
+            self._dirty.add((True, self._categories[row]))
+            self._categories[row] = category
+        self._values_buffer[row] = values
+        self._normalized_buffer[row] = normalized
+        self._values = self._values_buffer[:len(self._ids)]
+        self._normalized = self._normalized_buffer[:len(self._ids)]
+        if (True, category) not in self._trees:
+            # Categoría nueva: de momento solo tiene este alimento, hasta `settle`
+            rows = np.array([row], dtype=np.intp)
+            self._trees = {**self._trees, (True, category): (KDTree(self._normalized[rows]), rows)}
+        self._dirty.update((self.GLOBAL, (True, category)))
+
+    @staticmethod
+    def _grown(buffer: np.ndarray, size: int) -> np.ndarray:
+        grown = np.zeros((max(1024, 2 * size), buffer.shape[1]))
+        grown[:size] = buffer[:size]
+        return grown
+
+    async def settle(self) -> None:
+        """Reconstruir en un hilo los árboles afectados por los cambios"""
+        async with self._settling:
+            dirty = list(self._dirty)
+            self._dirty = set()
+            if not dirty:
+                return
+            # Copias: las altas que lleguen mientras tanto no afectan a la construcción
+            trees = await asyncio.to_thread(
+                self._build_trees, self._normalized.copy(), list(self._categories), dirty
+            )
+            self._trees = {**self._trees, **trees}
+
+    @staticmethod
+    def _build_trees(
+        points: np.ndarray,
+        categories: List[Optional[str]],
+        keys: Iterable[Tuple[bool, Optional[str]]]
+    ) -> Dict[Tuple[bool, Optional[str]], Tuple[KDTree, np.ndarray]]:
+        # Filas de cada categoría en una sola pasada
+        grouped: Dict[Optional[str], List[int]] = {}
+        for row, value in enumerate(categories):
+            grouped.setdefault(value, []).append(row)
+        trees = {}
+        for by_category, category in keys:
+            if by_category:
+                rows = np.array(grouped.get(category, []), dtype=np.intp)
+            else:
+                rows = np.arange(len(categories), dtype=np.intp)
+            trees[(by_category, category)] = (KDTree(points[rows]), rows)
+        return trees
+
+    def _tree(self, category: Optional[str], by_category: bool) -> Tuple[KDTree, np.ndarray]:
+        # Todos los árboles existen desde la carga; aquí nunca se construye ninguno
+        return self._trees[(by_category, category if by_category else None)]
+
+    def similar(
+        self,
+        food_id: str,
+        k: int = 10,
+        same_category: bool = False
+    ) -> Optional[List[Tuple[str, float]]]:
+        """IDs de los `k` alimentos más parecidos con su distancia (None si el alimento no existe)"""
+        row = self._row_of.get(food_id)
+        if row is None:
+            return None
+        tree, rows = self._tree(self._categories[row], same_category)
+        # Posición del propio alimento dentro del árbol, para excluirlo del resultado
+        position = np.searchsorted(rows, row)
+        exclude = int(position) if position < len(rows) and rows[position] == row else None
+        point = self._normalized[row]
+        return [
+            (self._ids[rows[neighbour]], round(distance, 4))
+            for neighbour, distance in tree.query(point, k, exclude)
+        ]
+
+
+similarity_index = SimilarityIndex()
@@ -0,0 +1,48 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable
+import asyncio
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes idénticas en una sola ejecución
+
+    La primera llamada con una clave lanza la corrutina como tarea; las
+    siguientes, mientras siga en curso, esperan esa misma tarea. Cada llamada
+    espera a través de `asyncio.shield`, de modo que si un cliente se
+    desconecta solo se cancela su espera y no la consulta compartida.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.executions = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Ejecutar `factory()` o unirse a la ejecución en curso con la misma clave"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._forget(key, task))
+            self.executions += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Marcar la excepción como recuperada aunque todos los clientes se hayan ido
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        """Contadores de ejecuciones reales y llamadas que se sumaron a una en curso"""
+        return {
+            "in_flight": len(self._inflight),
+            "executions": self.executions,
+            "shared": self.shared
+        }
+
+
+food_singleflight = SingleFlight()
@@ -0,0 +1,170 @@
+from typing import Dict, Iterable, Iterator, List, Tuple
+import bisect
+import itertools
+from app.services.search_index import normalize_text
+
+# Tipos de entrada, en orden de preferencia al sugerir
+NAME_PREFIX = 0
+NAME_WORD = 1
+BRAND_PREFIX = 2
+KINDS = (NAME_PREFIX, NAME_WORD, BRAND_PREFIX)
+
+# Entradas como máximo que se examinan por tipo y consulta (acota la latencia)
+MAX_SCANNED_ENTRIES = 200
+
+# Entradas por bloque de los arrays ordenados (un bloque se parte al doblar este tamaño)
+BLOCK_SIZE = 512
+
+
+def display_name(doc: dict) -> str:
+    """Nombre a mostrar en la lista de sugerencias"""
+    brand = doc.get("brand")
+    return f"{doc['name']} ({brand})" if brand else doc["name"]
+
+
+class _SortedEntries:
+    """
+    Entradas (clave, id) ordenadas, repartidas en bloques de hasta 2 × BLOCK_SIZE
+
+    Una alta o una baja busca su bloque por el máximo de cada uno y solo
+    desplaza ese bloque, en lugar de todo el array; un bloque que crece
+    demasiado se parte en dos.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, str]] = ()):
+        entries = sorted(entries)
+        self._blocks: List[List[Tuple[str, str]]] = [
+            entries[start:start + BLOCK_SIZE] for start in range(0, len(entries), BLOCK_SIZE)
+        ]
+        self._maxes: List[Tuple[str, str]] = [block[-1] for block in self._blocks]
+
+    def add(self, entry: Tuple[str, str]) -> None:
+        if not self._blocks:
+            self._blocks.append([entry])
+            self._maxes.append(entry)
+            return
+        # Mayor que todas: va al último bloque
+        position = min(bisect.bisect_left(self._maxes, entry), len(self._blocks) - 1)
+        block = self._blocks[position]
+        bisect.insort(block, entry)
+        self._maxes[position] = block[-1]
+        if len(block) > 2 * BLOCK_SIZE:
+            self._blocks[position:position + 1] = [block[:BLOCK_SIZE], block[BLOCK_SIZE:]]
+            self._maxes[position:position + 1] = [block[BLOCK_SIZE - 1], block[-1]]
+
+    def remove(self, entry: Tuple[str, str]) -> None:
+        position = bisect.bisect_left(self._maxes, entry)
+        if position == len(self._blocks):
+            return
+        block = self._blocks[position]
+        index = bisect.bisect_left(block, entry)
+        if index < len(block) and block[index] == entry:
+            del block[index]
+            if block:
+                self._maxes[position] = block[-1]
+            else:
+                del self._blocks[position]
+                del self._maxes[position]
+
+    def scan(self, prefix: str) -> Iterator[Tuple[str, str]]:
+        """Entradas cuya clave empieza por el prefijo, en orden"""
+        position = bisect.bisect_left(self._maxes, (prefix,))
+        if position == len(self._blocks):
+            return
+        index = bisect.bisect_left(self._blocks[position], (prefix,))
+        for number in range(position, len(self._blocks)):
+            block = self._blocks[number]
+            for entry_index in range(index, len(block)):
+                entry = block[entry_index]
+                if not entry[0].startswith(prefix):
+                    return
+                yield entry
+            index = 0
+
+
+class SuggestIndex:
+    """
+    Índice de autocompletado basado en arrays ordenados de claves
+
+    Cada alimento aporta su nombre normalizado, el resto del nombre a partir
+    de cada palabra ("de pollo", "pollo") y su marca, cada tipo en su propio
+    array. Un prefijo se resuelve con búsqueda binaria y un recorrido acotado
+    del tramo que coincide, empezando por los nombres: las palabras y las
+    marcas solo se recorren si todavía faltan sugerencias.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._entries: Dict[int, _SortedEntries] = {kind: _SortedEntries() for kind in KINDS}
+        self._doc_entries: Dict[str, List[Tuple[int, str]]] = {}
+        self._display: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._display)
+
+    @staticmethod
+    def _entries_for(doc: dict) -> List[Tuple[int, str]]:
+        name = normalize_text(doc.get("name"))
+        words = name.split()
+        entries = [(NAME_PREFIX, name)] if name else []
+        for position in range(1, len(words)):
+            entries.append((NAME_WORD, " ".join(words[position:])))
+        brand = normalize_text(doc.get("brand"))
+        if brand:
+            entries.append((BRAND_PREFIX, brand))
+        return entries
+
+    def rebuild(self, docs: Iterable[dict]) -> None:
+        """Reconstruir el índice completo a partir de los documentos"""
+        entries: Dict[int, List[Tuple[str, str]]] = {kind: [] for kind in KINDS}
+        self._doc_entries = {}
+        self._display = {}
+        for doc in docs:
+            doc_id = str(doc["_id"])
+            doc_entries = self._entries_for(doc)
+            self._doc_entries[doc_id] = doc_entries
+            self._display[doc_id] = display_name(doc)
+            for kind, key in doc_entries:
+                entries[kind].append((key, doc_id))
+        self._entries = {kind: _SortedEntries(entries[kind]) for kind in KINDS}
+        self.ready = True
+
+    def upsert(self, doc: dict) -> None:
+        """Añadir o actualizar un documento sin reconstruir el índice"""
+        doc_id = str(doc["_id"])
+        self.remove(doc_id)
+        doc_entries = self._entries_for(doc)
+        for kind, key in doc_entries:
+            self._entries[kind].add((key, doc_id))
+        self._doc_entries[doc_id] = doc_entries
+        self._display[doc_id] = display_name(doc)
+
+    def remove(self, doc_id: str) -> None:
+        """Eliminar un documento del índice"""
+        for kind, key in self._doc_entries.pop(doc_id, ()):
+            self._entries[kind].remove((key, doc_id))
+        self._display.pop(doc_id, None)
+
+    def suggest(self, query: str, limit: int = 10) -> List[Tuple[str, str]]:
+        """Devolver (id, nombre a mostrar) de los alimentos que empiezan por la consulta"""
+        prefix = normalize_text(query)
+        if not prefix:
+            return []
+
+        best: Dict[str, Tuple[int, int, str]] = {}
+        for kind in KINDS:
+            # Un tipo posterior no puede adelantar a los alimentos ya encontrados
+            if len(best) >= limit:
+                break
+            scanned = itertools.islice(self._entries[kind].scan(prefix), MAX_SCANNED_ENTRIES)
+            for key, doc_id in scanned:
+                # Preferir nombres que empiezan por la consulta y, después, los más cortos
+                rank = (kind, len(key), key)
+                if doc_id not in best or rank < best[doc_id]:
+                    best[doc_id] = rank
+
+        ranked = sorted(best, key=best.__getitem__)[:limit]
+        return [(doc_id, self._display[doc_id]) for doc_id in ranked]
+
+
+suggest_index = SuggestIndex()
@@ -0,0 +1,192 @@
+"""
+Micro-benchmark de la etapa de transformación del importador
+
+Compara la implementación anterior (recorrido de CATEGORY_MAPPING y de las
+listas de palabras con `in`, fecha por producto, un solo proceso) con la
+actual (reglas compiladas, fecha por bloque y pool de procesos) y comprueba
+que las categorías y porciones son idénticas. En un solo proceso las dos
+rinden prácticamente igual: la mejora viene del pool de procesos.
+
+    python -m etl.bench_transform                    # productos sintéticos
+    python -m etl.bench_transform --dump off.jsonl.gz --workers 4
+"""
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services import barcode
+from etl import transform
+from etl.dump import batched, iter_dump_records
+
+# Fragmentos para generar productos parecidos a los de Open Food Facts
+SAMPLE_NAMES = (
+    "Leche entera", "Yogur natural", "Pan de molde integral", "Queso curado", "Macarrones",
+    "Pechuga de pollo", "Almendras tostadas", "Aceite de oliva virgen extra", "Chocolate negro 70%",
+    "Galletas María", "Patatas fritas onduladas", "Atún claro en aceite", "Tomate frito",
+    "Refresco de cola", "Mermelada de fresa", "Frutos secos variados", "Zumo de naranja"
+)
+SAMPLE_CATEGORIES = (
+    "Plant-based foods and beverages", "Beverages", "Dairies", "Fermented foods", "Yogurts",
+    "Sweet snacks", "Biscuits and cakes", "Cereals and potatoes", "Breads", "Prepared meats",
+    "Hams", "Frutas", "Zumos de naranja", "Lácteos", "Quesos curados", "Aceites de oliva",
+    "Conservas", "Pescados en conserva", "Chocolates negros", "Legumbres secas", "Salsas",
+    "Groceries", "Condiments", "Frozen foods", "Nuts", "Mineral waters", "Sodas"
+)
+
+
+def reference_determine_category(categories_str):
+    """Versión anterior: recorrer todo el mapeo con `in`"""
+    if not categories_str:
+        return "Otros"
+    categories_lower = categories_str.lower()
+    for key, spanish_cat in transform.CATEGORY_MAPPING.items():
+        if key in categories_lower:
+            return spanish_cat
+    return "Otros"
+
+
+def reference_create_smart_portions(product_name):
+    """Versión anterior: un `any(word in name)` por regla"""
+    name_lower = product_name.lower()
+    for words, extra in transform.PORTION_RULES:
+        if any(word in name_lower for word in words):
+            break
+    else:
+        extra = transform.DEFAULT_PORTIONS
+    return [dict(transform.BASE_PORTION)] + [dict(portion) for portion in extra]
+
+
+def reference_gs1_check_digit(body):
+    """Versión anterior: bucle dígito a dígito"""
+    total = 0
+    for position, digit in enumerate(reversed(body)):
+        total += int(digit) * (3 if position % 2 == 0 else 1)
+    return (10 - total % 10) % 10
+
+
+@contextmanager
+def reference_implementation():
+    """Sustituir temporalmente las funciones actuales por las anteriores"""
+    saved = (transform.determine_category, transform.create_smart_portions, barcode.gs1_check_digit)
+    transform.determine_category = reference_determine_category
+    transform.create_smart_portions = reference_create_smart_portions
+    barcode.gs1_check_digit = reference_gs1_check_digit
+    try:
+        yield
+    finally:
+        transform.determine_category, transform.create_smart_portions, barcode.gs1_check_digit = saved
+
+
+def synthetic_records(count, seed=1):
+    """Líneas JSONL de productos sintéticos"""
+    rng = random.Random(seed)
+    for index in range(count):
+        categories = ", ".join(rng.sample(SAMPLE_CATEGORIES, rng.randint(0, 10)))
+        yield json.dumps({
+            "code": str(8480000000000 + index),
+            "product_name": f"{rng.choice(SAMPLE_NAMES)} {rng.choice(('Hacendado', 'Pascual', ''))}",
+            "brands": "Marca",
+            "categories": categories,
+            "countries_tags": ["en:spain"],
+            "nutriscore_grade": rng.choice("abcde"),
+            "nutriments": {
+                "energy-kcal_100g": rng.uniform(0, 900), "proteins_100g": rng.uniform(0, 40),
+                "carbohydrates_100g": rng.uniform(0, 90), "fat_100g": rng.uniform(0, 60)
+            }
+        }) + "\n"
+
+
+def rate(count, elapsed):
+    return f"{count / elapsed:>12,.0f} filas/s"
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def check_identical(products):
+    """Categorías y porciones de la versión actual iguales a las de la anterior"""
+    for product in products:
+        name = product.get("product_name", "")
+        categories = product.get("categories", "")
+        if transform.determine_category(categories) != reference_determine_category(categories):
+            raise AssertionError(f"Categoría distinta para {categories!r}")
+        if transform.create_smart_portions(name) != reference_create_smart_portions(name):
+            raise AssertionError(f"Porciones distintas para {name!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la transformación del importador")
+    parser.add_argument("--dump", help="Volcado JSONL/CSV (por defecto, productos sintéticos)")
+    parser.add_argument("--rows", type=int, default=100_000, help="Filas a procesar")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Procesos del pool")
+    parser.add_argument("--country", default="en:spain", help="Filtro de countries_tags ('' para ninguno)")
+    args = parser.parse_args()
+    country = args.country or None
+
+    source = iter_dump_records(args.dump) if args.dump else synthetic_records(args.rows)
+    records = list(islice(source, args.rows))
+    products = [p for p in (transform.product_from_record(r, country) for r in records) if p]
+    names = [p.get("product_name", "") for p in products]
+    categories = [p.get("categories", "") for p in products]
+    print(f"{len(records)} filas, {len(products)} productos tras el filtro de país\n")
+
+    check_identical(products)
+    print("✅ Categorías y porciones idénticas a la versión anterior\n")
+
+    print("Clasificación")
+    for label, function, values in (
+        ("categoría (antes)", reference_determine_category, categories),
+        ("categoría (ahora)", transform.determine_category, categories),
+        ("porciones (antes)", reference_create_smart_portions, names),
+        ("porciones (ahora)", transform.create_smart_portions, names)
+    ):
+        transform._category_of.cache_clear()
+        _, elapsed = timed(lambda: [function(value) for value in values])
+        print(f"   {label:<28} {rate(len(values), elapsed)}")
+
+    print("\nEtapa completa (JSON, filtro, validación y transformación)")
+
+    def before():
+        # Fecha por producto como antes (transform_product sin `now`)
+        docs = []
+        for record in records:
+            product = transform.product_from_record(record, country)
+            if product is not None and transform.is_valid_product(product):
+                doc = transform.transform_product(product)
+                if doc:
+                    docs.append(doc)
+        return docs
+
+    def after(workers):
+        chunks = ((chunk, country, datetime.now()) for chunk in batched(iter(records), transform.TRANSFORM_CHUNK_SIZE))
+        return [doc for docs in transform.map_chunks(transform.transform_records, chunks, workers) for doc in docs]
+
+    with reference_implementation():
+        expected, elapsed = timed(before)
+    print(f"   {'antes (1 proceso)':<28} {rate(len(records), elapsed)}")
+    transform._category_of.cache_clear()
+    docs, elapsed = timed(after, 1)
+    print(f"   {'ahora (1 proceso)':<28} {rate(len(records), elapsed)}")
+    if args.workers > 1:
+        docs, elapsed = timed(after, args.workers)
+        print(f"   {f'ahora ({args.workers} procesos)':<28} {rate(len(records), elapsed)}")
+
+    strip = lambda doc: {key: value for key, value in doc.items() if key not in ("created_at", "updated_at")}
+    if [strip(doc) for doc in docs] != [strip(doc) for doc in expected]:
+        raise AssertionError("Los documentos transformados no coinciden con la versión anterior")
+    print("\n✅ Documentos transformados idénticos (salvo fechas)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""Detección de productos casi duplicados durante la importación (MinHash + LSH)"""
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+import json
+import re
+import unicodedata
+
+import numpy as np
+
+from app.services.nutrition import NUTRIENT_FIELDS, nutrient_row
+
+# Funciones hash de la firma MinHash y bandas de LSH (NUM_PERM = BANDS × filas por banda).
+# Con 8 bandas de 4 filas, dos productos son candidatos con probabilidad ~0.9 si su
+# similitud de Jaccard es 0.7 y ~0.2 si es 0.4
+NUM_PERM = 32
+BANDS = 8
+
+# Similitud de Jaccard estimada mínima entre los n-gramas de nombre y marca
+JACCARD_THRESHOLD = 0.6
+
+# Diferencia de nutrientes admitida: relativa al mayor de los dos valores más un margen absoluto
+NUTRIENT_RELATIVE_TOLERANCE = 0.1
+NUTRIENT_ABSOLUTE_TOLERANCE = 1.0
+
+# Canónicos por cubo como máximo: una banda compartida por muchos productos es
+# demasiado genérica para distinguirlos, y así el coste por documento no crece
+MAX_BUCKET_SIZE = 64
+
+# Tamaño de los n-gramas de caracteres
+SHINGLE_SIZE = 3
+
+# Cantidades y formatos del envase, que no cambian el producto ("1 l", "6x125 g", "500ml")
+_QUANTITIES = re.compile(r"\b(?:\d+\s*x\s*)?\d+(?:[.,]\d+)?\s*(?:kg|g|gr|ml|cl|l)\b")
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+_NUMBERS = re.compile(r"\d+")
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas, sin tildes, sin cantidades del envase y sin signos (solo ASCII)"""
+    # NFKD separa las tildes, que desaparecen al pasar a ASCII
+    text = unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode("ascii")
+    text = _QUANTITIES.sub(" ", text)
+    return _NON_ALNUM.sub(" ", text).strip()
+
+
+def canonical_key(doc: dict) -> Tuple[bool, str, str, str]:
+    """
+    Orden para elegir el canónico de un grupo: primero los que tienen código
+    de barras, después el código, el nombre y la marca. No depende del orden
+    en que llegan los productos, así que dos importaciones eligen el mismo.
+    """
+    barcode = doc.get("barcode")
+    return (not barcode, barcode or "", doc.get("name") or "", doc.get("brand") or "")
+
+
+def shingle_codes(texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    n-gramas de caracteres de varios textos normalizados, como enteros
+
+    Los textos (ASCII) se concatenan con un espacio delante y detrás y cada
+    n-grama se codifica con sus bytes (`b0·2^16 + b1·2^8 + b2`). Devuelve los
+    códigos de todos los textos seguidos y el índice donde empieza cada uno;
+    los repetidos no se quitan porque no cambian el mínimo de MinHash.
+    """
+    padded = [f" {text} ".ljust(SHINGLE_SIZE) for text in texts]
+    data = np.frombuffer("".join(padded).encode("ascii"), dtype=np.uint8).astype(np.uint64)
+    codes = np.zeros(len(data) - SHINGLE_SIZE + 1, dtype=np.uint64)
+    for offset in range(SHINGLE_SIZE):
+        codes = (codes << np.uint64(8)) | data[offset:len(data) - SHINGLE_SIZE + 1 + offset]
+    # Solo los n-gramas que empiezan y terminan dentro del mismo texto
+    lengths = np.array([len(text) - SHINGLE_SIZE + 1 for text in padded])
+    ends = np.cumsum([len(text) for text in padded])
+    starts = ends - np.array([len(text) for text in padded])
+    keep = np.concatenate([np.arange(start, start + count) for start, count in zip(starts, lengths)])
+    return codes[keep], np.cumsum(np.concatenate(([0], lengths[:-1])))
+
+
+class NearDuplicateIndex:
+    """
+    Agrupación en tiempo casi lineal de productos casi duplicados
+
+    Cada documento recibe una firma MinHash de sus n-gramas de nombre y marca
+    (calculada con NumPy para todo el lote a la vez). La firma se parte en
+    bandas y cada banda se guarda en una tabla hash (LSH): solo los
+    documentos que comparten alguna banda se comparan, en lugar de todos
+    los pares. Un candidato es duplicado si la similitud estimada supera
+    JACCARD_THRESHOLD, los nutrientes por 100 g están dentro de la
+    tolerancia y los números que quedan en el nombre (sin cantidades del
+    envase) son los mismos: "0%" o "Pack 2" distinguen productos.
+
+    El canónico de cada grupo es el de menor `canonical_key`, no el primero
+    que llega: si un duplicado posterior tiene una clave menor, pasa a ser
+    el canónico y el anterior se descarta. Si el anterior ya se entregó en
+    un lote previo (y quizá ya está escrito), su código queda en
+    `superseded` para que la importación lo retire. Por documento canónico se guardan la
+    firma, los nutrientes y su posición en BANDS cubos (de como mucho
+    MAX_BUCKET_SIZE canónicos, para que el tiempo siga siendo lineal): en
+    torno a 1 KB por producto, casi todo en las tablas de LSH.
+    """
+
+    def __init__(self, num_perm: int = NUM_PERM, bands: int = BANDS, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm debe ser múltiplo de bands")
+        rng = np.random.default_rng(seed)
+        # Hash multiplicativo por permutación: ((a·x + b) mod 2^64) >> 32
+        self._a = rng.integers(1, 2 ** 63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+        self._band_mix = rng.integers(1, 2 ** 63, (bands, num_perm // bands), dtype=np.uint64) | np.uint64(1)
+        self.num_perm = num_perm
+        self.bands = bands
+        self.seen = 0
+        # Clave de banda -> canónico (o lista de canónicos si hay varios)
+        self._buckets: Dict[int, Union[int, List[int]]] = {}
+        self._signatures = np.zeros((0, num_perm), dtype=np.uint32)
+        self._nutrients = np.zeros((0, len(NUTRIENT_FIELDS)), dtype=np.float32)
+        self._count = 0
+        # (barcode, nombre, marca) y clave de cada canónico y duplicados descartados por canónico
+        self._labels: List[Tuple[Optional[str], str, Optional[str]]] = []
+        self._keys: List[Tuple[bool, str, str, str]] = []
+        self._duplicates: Dict[int, List[dict]] = {}
+        # Códigos de canónicos entregados en lotes anteriores y sustituidos después
+        self.superseded: List[str] = []
+
+    def signatures(self, texts: Sequence[str]) -> np.ndarray:
+        """Firmas MinHash (textos × NUM_PERM) de un lote de textos normalizados"""
+        values, starts = shingle_codes(texts)
+        hashed = (self._a[:, None] * values[None, :] + self._b[:, None]) >> np.uint64(32)
+        return np.minimum.reduceat(hashed, starts, axis=1).T.astype(np.uint32)
+
+    def _band_keys(self, signatures: np.ndarray, numbers: Sequence[int]) -> List[List[int]]:
+        """
+        Una clave por banda y documento
+
+        La banda y la huella de los números del nombre van mezcladas en la
+        clave: productos con números distintos nunca llegan a compararse.
+        """
+        rows = signatures.astype(np.uint64).reshape(len(signatures), self.bands, -1)
+        keys = (rows * self._band_mix[None, :, :]).sum(axis=2, dtype=np.uint64)
+        keys ^= np.arange(self.bands, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+        keys ^= np.array(numbers, dtype=np.int64).view(np.uint64)[:, None]
+        return keys.tolist()
+
+    def _best_match(
+        self,
+        signature: np.ndarray,
+        nutrients: np.ndarray,
+        keys: List[int]
+    ) -> Tuple[Optional[int], float]:
+        """Canónico más parecido entre los que comparten alguna banda (None si ninguno es duplicado)"""
+        candidates = set()
+        for key in keys:
+            bucket = self._buckets.get(key)
+            if isinstance(bucket, int):
+                candidates.add(bucket)
+            elif bucket:
+                candidates.update(bucket)
+        if not candidates:
+            return None, 0.0
+        candidates = np.fromiter(candidates, dtype=np.intp, count=len(candidates))
+        similarity = (self._signatures[candidates] == signature).mean(axis=1)
+        other = self._nutrients[candidates]
+        limit = NUTRIENT_RELATIVE_TOLERANCE * np.maximum(np.abs(other), np.abs(nutrients))
+        close = (np.abs(other - nutrients) <= limit + NUTRIENT_ABSOLUTE_TOLERANCE).all(axis=1)
+        similarity = np.where(close & (similarity >= JACCARD_THRESHOLD), similarity, -1.0)
+        best = int(np.argmax(similarity))
+        if similarity[best] < 0:
+            return None, 0.0
+        return int(candidates[best]), float(similarity[best])
+
+    def _append(self, signature: np.ndarray, nutrients: np.ndarray, doc: dict) -> int:
+        if self._count == len(self._signatures):
+            # Capacidad doble para no copiar las matrices en cada documento
+            capacity = max(1024, 2 * self._count)
+            self._signatures = np.resize(self._signatures, (capacity, self.num_perm))
+            self._nutrients = np.resize(self._nutrients, (capacity, len(NUTRIENT_FIELDS)))
+        index = self._count
+        self._signatures[index] = signature
+        self._nutrients[index] = nutrients
+        self._labels.append((doc.get("barcode"), doc.get("name") or "", doc.get("brand")))
+        self._keys.append(canonical_key(doc))
+        self._count += 1
+        return index
+
+    def _add_duplicate(self, index: int, label: Tuple[Optional[str], str, Optional[str]], similarity: float) -> None:
+        barcode, name, brand = label
+        self._duplicates.setdefault(index, []).append({
+            "barcode": barcode,
+            "name": name,
+            "brand": brand,
+            "similarity": round(similarity, 3)
+        })
+
+    def filter(self, docs: Sequence[dict]) -> List[dict]:
+        """Documentos del lote que no duplican a uno anterior (los demás se anotan en el informe)"""
+        if not docs:
+            return []
+        texts = [normalize_text(f"{doc.get('name') or ''} {doc.get('brand') or ''}") for doc in docs]
+        # Huella de los números del texto (hash de Python: solo vale dentro de este proceso)
+        numbers = [hash(frozenset(_NUMBERS.findall(text))) for text in texts]
+        signatures = self.signatures(texts)
+        band_keys = self._band_keys(signatures, numbers)
+        nutrients = np.array([nutrient_row(doc) for doc in docs], dtype=np.float32)
+        # Canónico -> documento entregado en este lote (conserva el orden de llegada)
+        kept: Dict[int, dict] = {}
+        for doc, signature, keys, row in zip(docs, signatures, band_keys, nutrients):
+            self.seen += 1
+            match, similarity = self._best_match(signature, row, keys)
+            label = (doc.get("barcode"), doc.get("name") or "", doc.get("brand"))
+            if match is not None:
+                # Solo se sustituye un canónico ya entregado si tiene código para retirarlo
+                replaceable = match in kept or self._labels[match][0]
+                if replaceable and canonical_key(doc) < self._keys[match]:
+                    # El duplicado pasa a ser el canónico; el grupo conserva la firma del primero
+                    previous = self._labels[match]
+                    self._add_duplicate(match, previous, similarity)
+                    self._labels[match] = label
+                    self._keys[match] = canonical_key(doc)
+                    if match not in kept:
+                        self.superseded.append(previous[0])
+                    kept[match] = doc
+                else:
+                    self._add_duplicate(match, label, similarity)
+                continue
+            index = self._append(signature, row, doc)
+            for key in keys:
+                # Casi todos los cubos tienen un solo canónico: se guarda sin lista
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    self._buckets[key] = index
+                elif isinstance(bucket, int):
+                    self._buckets[key] = [bucket, index]
+                elif len(bucket) < MAX_BUCKET_SIZE:
+                    bucket.append(index)
+            kept[index] = doc
+        return list(kept.values())
+
+    @property
+    def duplicates(self) -> int:
+        return self.seen - self._count
+
+    def report(self) -> dict:
+        """Grupos con duplicados, de mayor a menor"""
+        clusters = []
+        for index, duplicates in sorted(self._duplicates.items(), key=lambda item: -len(item[1])):
+            barcode, name, brand = self._labels[index]
+            clusters.append({
+                "canonical": {"barcode": barcode, "name": name, "brand": brand},
+                "duplicates": duplicates
+            })
+        return {
+            "documents": self.seen,
+            "canonical": self._count,
+            "duplicates": self.duplicates,
+            "superseded": len(self.superseded),
+            "clusters": clusters
+        }
+
+    def write_report(self, path: str) -> dict:
+        """Guardar el informe en JSON y devolverlo"""
+        report = self.report()
+        with open(path, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, ensure_ascii=False, indent=2)
+        return report
+
+    def summary(self, top: int = 5) -> str:
+        """Resumen para la consola con los grupos más grandes"""
+        report = self.report()
+        lines = [
+            f"   • documentos analizados: {report['documents']}",
+            f"   • grupos con duplicados: {len(report['clusters'])}",
+            f"   • duplicados descartados: {report['duplicates']}",
+            f"   • canónicos ya entregados y sustituidos: {report['superseded']}"
+        ]
+        for cluster in report["clusters"][:top]:
+            canonical = cluster["canonical"]
+            label = canonical["name"] + (f" ({canonical['brand']})" if canonical["brand"] else "")
+            lines.append(f"     - {label}: {len(cluster['duplicates'])} duplicados")
+        return "\n".join(lines)
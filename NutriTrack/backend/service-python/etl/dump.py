@@ -0,0 +1,106 @@
+"""Lectura en streaming de volcados de Open Food Facts (JSONL o CSV, opcionalmente .gz)"""
+from typing import Iterator, List, Optional, TextIO, Union
+import csv
+import gzip
+import json
+import sys
+
+# Columnas del CSV de Open Food Facts que pasan a `nutriments`
+CSV_NUTRIMENT_COLUMNS = (
+    "energy-kcal_100g", "energy_100g", "proteins_100g", "carbohydrates_100g",
+    "fat_100g", "fiber_100g", "sugars_100g", "sodium_100g"
+)
+
+# País por defecto del catálogo (etiqueta de `countries_tags`)
+DEFAULT_COUNTRY = "en:spain"
+
+
+def open_dump(path: str) -> TextIO:
+    """Abrir el volcado como texto, descomprimiendo sobre la marcha si es .gz"""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, "r", encoding="utf-8", newline="")
+
+
+def dump_format(path: str) -> str:
+    """'jsonl' o 'csv' según la extensión del fichero"""
+    name = path[:-3] if path.endswith(".gz") else path
+    if name.endswith((".jsonl", ".json")):
+        return "jsonl"
+    if name.endswith((".csv", ".tsv")):
+        return "csv"
+    raise ValueError(f"Formato de volcado no reconocido: {path}")
+
+
+def _float(value: str) -> Optional[float]:
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def product_from_csv_row(row: dict) -> dict:
+    """Fila del CSV con la misma forma que un producto de la API"""
+    nutriments = {}
+    for column in CSV_NUTRIMENT_COLUMNS:
+        value = _float(row.get(column))
+        if value is not None:
+            nutriments[column] = value
+    return {
+        "code": row.get("code"),
+        "product_name": row.get("product_name") or "",
+        "brands": row.get("brands") or "",
+        "categories": row.get("categories") or "",
+        "nutriscore_grade": row.get("nutriscore_grade") or None,
+        "countries_tags": [tag for tag in (row.get("countries_tags") or "").split(",") if tag],
+        "nutriments": nutriments
+    }
+
+
+def _iter_csv(stream: TextIO) -> Iterator[Optional[dict]]:
+    # El CSV oficial es en realidad TSV y algunos campos (ingredientes) son muy largos
+    csv.field_size_limit(sys.maxsize)
+    sample = stream.readline()
+    delimiter = "\t" if "\t" in sample else ","
+    header = next(csv.reader([sample], delimiter=delimiter))
+    for row in csv.DictReader(stream, fieldnames=header, delimiter=delimiter):
+        yield product_from_csv_row(row)
+
+
+def iter_dump_records(path: str) -> Iterator[Union[str, dict]]:
+    """
+    Registros del volcado sin cargar el fichero en memoria
+
+    En JSONL son las líneas sin decodificar (el JSON se lee después, en el
+    proceso que transforma el bloque); en CSV, los productos ya leídos porque
+    el CSV solo se puede recorrer en orden.
+    """
+    with open_dump(path) as stream:
+        if dump_format(path) == "jsonl":
+            yield from stream
+        else:
+            yield from _iter_csv(stream)
+
+
+def product_from_record(record: Union[str, dict], country: Optional[str] = DEFAULT_COUNTRY) -> Optional[dict]:
+    """Producto de un registro del volcado, o None si no se puede leer o es de otro país"""
+    if isinstance(record, str):
+        try:
+            record = json.loads(record)
+        except ValueError:
+            return None
+    if country and country not in (record.get("countries_tags") or []):
+        return None
+    return record
+
+
+def batched(items: Iterator[dict], size: int) -> Iterator[List[dict]]:
+    """Agrupar un iterador en listas de como mucho `size` elementos"""
+    batch: List[dict] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
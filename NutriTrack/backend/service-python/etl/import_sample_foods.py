@@ -3,299 +3,266 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-import aiohttp
+import argparse
 import asyncio
-from app.config.database import foods_collection
+import time
+from app.config.database import close_clients, get_foods_collection
+from app.services.facets import FACET_PIPELINE, FacetTable
+from bson import ObjectId
 from datetime import datetime
+from pymongo.errors import BulkWriteError
+from etl.dedup import NearDuplicateIndex
+from etl.dump import DEFAULT_COUNTRY, batched, iter_dump_records
+from etl.incremental import IncrementalWriter
+from etl.pipeline import BASE_URL, OFFPipeline
+from etl.state import STATE_DIR, HTTPCache, ImportCheckpoint
+from etl.transform import (
+    TRANSFORM_CHUNK_SIZE, is_valid_product, map_chunks, transform_product, transform_records
+)
 
-# Usar la API ESPAÑOLA directamente
-BASE_URL = "https://es.openfoodfacts.org"
+# Informe de casi duplicados de la última importación
+DEDUP_REPORT = os.path.join(STATE_DIR, "dedup-report.json")
 
-# Mapeo mejorado de categorías en español
-CATEGORY_MAPPING = {
-    'carne': 'Carnes y Embutidos', 'carnes': 'Carnes y Embutidos', 'pollo': 'Carnes y Embutidos',
-    'aves': 'Carnes y Embutidos', 'cerdo': 'Carnes y Embutidos', 'ternera': 'Carnes y Embutidos',
-    'embutido': 'Carnes y Embutidos', 'jamón': 'Carnes y Embutidos', 'chorizo': 'Carnes y Embutidos',
-    'pescado': 'Pescados y Mariscos', 'marisco': 'Pescados y Mariscos', 'salmón': 'Pescados y Mariscos',
-    'atún': 'Pescados y Mariscos', 'merluza': 'Pescados y Mariscos',
-    'lácteo': 'Lácteos', 'leche': 'Lácteos', 'queso': 'Lácteos', 'yogur': 'Lácteos',
-    'yogurt': 'Lácteos', 'nata': 'Lácteos', 'mantequilla': 'Lácteos',
-    'fruta': 'Frutas', 'manzana': 'Frutas', 'plátano': 'Frutas', 'naranja': 'Frutas',
-    'verdura': 'Verduras y Hortalizas', 'hortaliza': 'Verduras y Hortalizas',
-    'ensalada': 'Verduras y Hortalizas', 'tomate': 'Verduras y Hortalizas',
-    'legumbre': 'Legumbres', 'lenteja': 'Legumbres', 'garbanzo': 'Legumbres',
-    'cereal': 'Cereales y Granos', 'pan': 'Panadería', 'pasta': 'Cereales y Granos',
-    'arroz': 'Cereales y Granos', 'grano': 'Cereales y Granos',
-    'bebida': 'Bebidas', 'zumo': 'Bebidas', 'agua': 'Bebidas', 'café': 'Bebidas', 'té': 'Bebidas',
-    'refresco': 'Bebidas', 'snack': 'Snacks y Aperitivos', 'aperitivo': 'Snacks y Aperitivos',
-    'patata': 'Snacks y Aperitivos', 'galleta': 'Dulces y Repostería',
-    'chocolate': 'Dulces y Repostería', 'dulce': 'Dulces y Repostería', 'postre': 'Dulces y Repostería',
-    'fruto seco': 'Frutos Secos', 'nuez': 'Frutos Secos', 'almendra': 'Frutos Secos',
-    'huevo': 'Huevos', 'aceite': 'Aceites y Grasas', 'grasa': 'Aceites y Grasas',
-    'salsa': 'Salsas y Condimentos', 'condimento': 'Salsas y Condimentos',
-    'plato preparado': 'Platos Preparados', 'pizza': 'Platos Preparados',
-    # Inglés también por si acaso
-    'meat': 'Carnes y Embutidos', 'fish': 'Pescados y Mariscos', 'dairy': 'Lácteos',
-    'fruit': 'Frutas', 'vegetable': 'Verduras y Hortalizas', 'bread': 'Panadería',
-    'beverage': 'Bebidas', 'snack': 'Snacks y Aperitivos', 'dessert': 'Dulces y Repostería',
-}
+# Solo el cliente síncrono: el ETL no abre el pool asíncrono de la API
+foods_collection = get_foods_collection()
 
-def determine_category(categories_str):
-    """Determinar categoría en español"""
-    if not categories_str:
-        return "Otros"
-    categories_lower = categories_str.lower()
-    for key, spanish_cat in CATEGORY_MAPPING.items():
-        if key in categories_lower:
-            return spanish_cat
-    return "Otros"
+def first_barcode(doc, seen_barcodes):
+    """True si el código de barras del documento no se había visto (y lo registra)"""
+    # El índice de barcode es único: no repetir productos que aparecen varias veces
+    barcode = doc["barcode"]
+    if barcode and barcode in seen_barcodes:
+        return False
+    seen_barcodes.add(barcode)
+    return True
 
-def create_smart_portions(product_name):
-    """Crear porciones inteligentes según el tipo de alimento"""
-    portions = [{"name": "100g", "weight_grams": 100, "multiplier": 1}]
-    name_lower = product_name.lower()
-    
-    if any(word in name_lower for word in ['leche', 'zumo', 'bebida', 'agua', 'refresco']):
-        portions.extend([
-            {"name": "vaso (250ml)", "weight_grams": 250, "multiplier": 2.5},
-            {"name": "taza (200ml)", "weight_grams": 200, "multiplier": 2}
-        ])
-    elif any(word in name_lower for word in ['yogur', 'yoghurt']):
-        portions.append({"name": "unidad (125g)", "weight_grams": 125, "multiplier": 1.25})
-    elif any(word in name_lower for word in ['pan', 'galleta', 'biscuit']):
-        portions.extend([
-            {"name": "rebanada (30g)", "weight_grams": 30, "multiplier": 0.3},
-            {"name": "porción (50g)", "weight_grams": 50, "multiplier": 0.5}
-        ])
-    elif any(word in name_lower for word in ['queso']):
-        portions.extend([
-            {"name": "loncha (25g)", "weight_grams": 25, "multiplier": 0.25},
-            {"name": "porción (50g)", "weight_grams": 50, "multiplier": 0.5}
-        ])
-    elif any(word in name_lower for word in ['pasta', 'arroz', 'macarrones', 'espagueti']):
-        portions.extend([
-            {"name": "plato (150g)", "weight_grams": 150, "multiplier": 1.5},
-            {"name": "porción (200g)", "weight_grams": 200, "multiplier": 2}
-        ])
-    elif any(word in name_lower for word in ['carne', 'pollo', 'pescado', 'ternera', 'cerdo', 'pechuga', 'filete']):
-        portions.extend([
-            {"name": "filete (150g)", "weight_grams": 150, "multiplier": 1.5},
-            {"name": "porción (200g)", "weight_grams": 200, "multiplier": 2}
-        ])
-    elif any(word in name_lower for word in ['frutos secos', 'almendra', 'nuez', 'avellana', 'pistacho']):
-        portions.append({"name": "puñado (30g)", "weight_grams": 30, "multiplier": 0.3})
-    else:
-        portions.extend([
-            {"name": "porción (150g)", "weight_grams": 150, "multiplier": 1.5},
-            {"name": "porción (200g)", "weight_grams": 200, "multiplier": 2}
-        ])
-    
-    return portions
+def transform_unique(product, seen_barcodes, now=None):
+    """Validar y transformar un producto, descartando códigos de barras ya vistos"""
+    if not is_valid_product(product):
+        return None
+    transformed = transform_product(product, now)
+    if not transformed or not first_barcode(transformed, seen_barcodes):
+        return None
+    return transformed
 
-def is_valid_product(product):
-    """Validar que el producto tenga datos de calidad"""
-    product_name = product.get("product_name", "").strip()
-    if not product_name or len(product_name) < 3:
-        return False
+def print_summary(facets, imported):
+    """Resumen final por categoría y por fuente"""
+    print("\n" + "="*70)
+    print("✅ IMPORTACIÓN COMPLETADA")
+    print("="*70)
+    print(f"📊 Total productos importados: {imported}")
     
-    nutriments = product.get("nutriments", {})
-    has_energy = (
-        nutriments.get("energy-kcal_100g") is not None or
-        nutriments.get("energy_100g") is not None
-    )
-    if not has_energy:
-        return False
+    # Estadísticas por categoría
+    categories = facets.counts("category", source="openfoodfacts")
+    print(f"\n📁 Categorías disponibles ({len(categories)}):")
+    for cat in sorted(categories):
+        print(f"   • {cat}: {categories[cat]} productos")
     
-    has_macros = (
-        nutriments.get("proteins_100g") is not None or
-        nutriments.get("carbohydrates_100g") is not None or
-        nutriments.get("fat_100g") is not None
-    )
-    if not has_macros:
-        return False
+    # Estadísticas por fuente
+    print(f"\n📚 Productos por fuente:")
+    total_off = facets.total(source="openfoodfacts")
+    total_manual = facets.total(source="manual")
+    print(f"   • openfoodfacts: {total_off} productos")
+    print(f"   • manual: {total_manual} productos")
+    print(f"   • TOTAL: {total_off + total_manual} productos")
     
-    return True
+    print("\n🎉 Base de datos lista para usar!")
+    print("="*70 + "\n")
+
+def print_dedup(dedup, report_path):
+    """Resumen de casi duplicados y guardado del informe completo"""
+    os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+    dedup.write_report(report_path)
+    print(f"\n🧬 Casi duplicados (informe en {report_path}):")
+    print(dedup.summary())
 
-async def fetch_products_batch(session, page=1, page_size=50):
-    """Obtener productos de Open Food Facts España con páginas más pequeñas"""
-    url = f"{BASE_URL}/cgi/search.pl"
-    
-    # Parámetros simplificados para la API española
-    params = {
-        "search_simple": "1",
-        "action": "process",
-        "json": "1",
-        "page": str(page),
-        "page_size": str(page_size),
-        "sort_by": "unique_scans_n",
-        "tagtype_0": "countries",
-        "tag_contains_0": "contains",
-        "tag_0": "españa"
-    }
+def retire_superseded(near_duplicates, writer=None):
+    """
+    Retirar los canónicos ya escritos que un duplicado con menor clave ha sustituido
     
-    try:
-        timeout = aiohttp.ClientTimeout(total=30)
-        async with session.get(url, params=params, timeout=timeout) as response:
-            if response.status == 200:
-                try:
-                    data = await response.json()
-                    products = data.get("products", [])
-                    return products
-                except:
-                    return []
-            else:
-                return []
-    except asyncio.TimeoutError:
-        print("T", end="", flush=True)  # T = Timeout
-        return []
-    except Exception:
-        print("E", end="", flush=True)  # E = Error
-        return []
+    En modo incremental se marcan como desaparecidos; si no, se borran.
+    """
+    barcodes = near_duplicates.superseded
+    if not barcodes:
+        return 0
+    if writer:
+        writer.retire(barcodes)
+        return len(barcodes)
+    result = foods_collection.delete_many({"source": "openfoodfacts", "barcode": {"$in": barcodes}})
+    return result.deleted_count
 
-def transform_product(product):
-    """Transformar producto de Open Food Facts a nuestro formato"""
+def insert_idempotent(batch):
+    """
+    Insertar un lote ignorando las claves duplicadas; devuelve (insertados, descartados)
+    
+    Se descartan los documentos que ya se escribieron (mismo `_id`, al
+    reanudar) y los que tienen el código de barras de un producto existente
+    (índice único de barcode, por ejemplo un producto manual). Cualquier otro
+    error se propaga. `updated_at` se fija al escribir (no al transformar):
+    la sincronización del catálogo de la API busca los cambios por esa fecha.
+    """
+    now = datetime.now()
+    for doc in batch:
+        doc["updated_at"] = now
     try:
-        nutriments = product.get("nutriments", {})
-        product_name = product.get("product_name", "").strip()
-        
-        if not product_name:
-            return None
-        
-        calories = nutriments.get("energy-kcal_100g")
-        if calories is None:
-            energy_kj = nutriments.get("energy_100g")
-            if energy_kj:
-                calories = energy_kj / 4.184
-            else:
-                calories = 0
-        
-        categories_str = product.get("categories", "")
-        category = determine_category(categories_str)
-        portions = create_smart_portions(product_name)
-        
-        return {
-            "name": product_name,
-            "brand": product.get("brands", "").strip() or None,
-            "category": category,
-            "nutritional_info_per_100g": {
-                "calories": round(calories, 1) if calories else 0,
-                "protein": round(nutriments.get("proteins_100g", 0), 1),
-                "carbohydrates": round(nutriments.get("carbohydrates_100g", 0), 1),
-                "fat": round(nutriments.get("fat_100g", 0), 1),
-                "fiber": round(nutriments.get("fiber_100g", 0), 1),
-                "sugar": round(nutriments.get("sugars_100g", 0), 1),
-                "sodium": round(nutriments.get("sodium_100g", 0) * 1000, 1) if nutriments.get("sodium_100g") else 0
-            },
-            "portions": portions,
-            "barcode": product.get("code", ""),
-            "nutriscore": product.get("nutriscore_grade", "").upper() if product.get("nutriscore_grade") else None,
-            "source": "openfoodfacts",
-            "created_at": datetime.now(),
-            "updated_at": datetime.now()
-        }
-    except Exception:
-        return None
+        return len(foods_collection.insert_many(batch, ordered=False).inserted_ids), 0
+    except BulkWriteError as error:
+        errors = error.details.get("writeErrors", [])
+        if any(item.get("code") != 11000 for item in errors):
+            raise
+        return error.details.get("nInserted", 0), len(errors)
 
-async def import_from_openfoodfacts(total_products=500):
-    """Importar productos desde Open Food Facts España - SIN INPUT INTERACTIVO"""
+async def import_from_openfoodfacts(
+    total_products=500,
+    base_url=BASE_URL,
+    incremental=False,
+    offline=False,
+    state_dir=STATE_DIR,
+    fresh=False,
+    dedup=False,
+    dedup_report=DEDUP_REPORT
+):
+    """
+    Importar productos desde Open Food Facts España - SIN INPUT INTERACTIVO
+    
+    Por defecto reemplaza todos los productos de Open Food Facts. Con
+    `incremental` actualiza por código de barras sin borrar nada: solo se
+    escriben los productos nuevos o modificados y los que ya no aparecen se
+    marcan como `stale` (solo si la descarga recorrió todos los resultados).
+    
+    Las páginas descargadas se guardan en `state_dir` y se revalidan con ETag;
+    con `offline` solo se usan las guardadas. Si una ejecución se interrumpe,
+    la siguiente con los mismos parámetros continúa desde el último punto de
+    control (salvo con `fresh`).
+    
+    Con `dedup` se descartan los casi duplicados (mismo producto con nombre,
+    marca o código ligeramente distintos, ver etl.dedup) y se guarda un
+    informe en `dedup_report`. Está desactivado por defecto: los códigos de
+    barras de los duplicados descartados dejan de encontrarse en la API.
+    """
     
     print("\n" + "="*70)
     print("🚀 IMPORTACIÓN DE ALIMENTOS DESDE OPEN FOOD FACTS (ESPAÑA)")
     print("="*70)
     
-    # Verificar productos existentes
-    existing_off = foods_collection.count_documents({"source": "openfoodfacts"})
-    existing_manual = foods_collection.count_documents({"source": "manual"})
+    # Verificar productos existentes (una sola agregación; después se mantiene en memoria)
+    facets = FacetTable()
+    facets.load_groups(foods_collection.aggregate(FACET_PIPELINE))
+    existing_off = facets.total(source="openfoodfacts")
+    existing_manual = facets.total(source="manual")
     
     print(f"📊 Alimentos actuales:")
     print(f"   • OpenFoodFacts: {existing_off}")
     print(f"   • Manuales: {existing_manual}")
     
-    # ELIMINAR INPUT INTERACTIVO - Siempre reemplazar automáticamente
-    if existing_off > 0:
-        print(f"\n⚠️  Ya tienes {existing_off} productos de OpenFoodFacts.")
-        print("🔄 Reemplazando automáticamente...")
+    checkpoint = ImportCheckpoint(state_dir, {
+        "total_products": total_products,
+        "base_url": base_url,
+        "incremental": incremental
+    })
+    resumed = not fresh and checkpoint.load()
+    if not resumed:
+        checkpoint.reset()
     
-    # Eliminar productos OpenFoodFacts antiguos (mantiene manuales)
-    deleted = foods_collection.delete_many({"source": "openfoodfacts"})
-    print(f"🗑️  Eliminados {deleted.deleted_count} productos antiguos de OpenFoodFacts")
-    print(f"✅ Los {existing_manual} productos manuales se mantienen intactos\n")
+    if incremental:
+        # Sin borrado: la API sigue sirviendo el catálogo completo durante la descarga
+        writer = IncrementalWriter(foods_collection)
+        known = writer.load()
+        print(f"\n🔁 Modo incremental: {known} productos con código de barras ya importados")
+        print(f"✅ Los {existing_manual} productos manuales se mantienen intactos\n")
+    elif resumed:
+        # Los productos antiguos ya se borraron en la ejecución interrumpida
+        print(f"\n↩️  Reanudando: {len(checkpoint.pages)} páginas y "
+              f"{checkpoint.written} productos ya escritos")
+    else:
+        # ELIMINAR INPUT INTERACTIVO - Siempre reemplazar automáticamente
+        if existing_off > 0:
+            print(f"\n⚠️  Ya tienes {existing_off} productos de OpenFoodFacts.")
+            print("🔄 Reemplazando automáticamente...")
+        
+        # Eliminar productos OpenFoodFacts antiguos (mantiene manuales)
+        deleted = foods_collection.delete_many({"source": "openfoodfacts"})
+        facets.remove_matching(source="openfoodfacts")
+        print(f"🗑️  Eliminados {deleted.deleted_count} productos antiguos de OpenFoodFacts")
+        print(f"✅ Los {existing_manual} productos manuales se mantienen intactos\n")
     
-    all_valid_products = []
+    seen_barcodes = set()
+    near_duplicates = NearDuplicateIndex() if dedup else None
     
-    # Usar páginas más pequeñas (50 productos por página en lugar de 100)
-    page_size = 50
-    timeout = aiohttp.ClientTimeout(total=60)
+    def transform(product):
+        transformed = transform_unique(product, seen_barcodes)
+        if transformed and near_duplicates and not near_duplicates.filter([transformed]):
+            return None
+        if transformed:
+            # `_id` fijo desde el principio: reescribir un lote tras reanudar no duplica
+            transformed["_id"] = ObjectId()
+        return transformed
     
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        pages_needed = (total_products // page_size) + 2  # +2 por seguridad
-        
-        print(f"📥 Descargando productos de España...")
-        print(f"   Buscando {total_products} productos válidos...")
-        print(f"   [.=OK T=Timeout E=Error]")
-        print("-" * 70)
-        
-        page = 1
-        attempts = 0
-        max_attempts = pages_needed * 2  # Intentar el doble por si hay timeouts
-        
-        while len(all_valid_products) < total_products and attempts < max_attempts:
-            attempts += 1
-            
-            if attempts % 5 == 1:  # Cada 5 intentos mostrar progreso
-                print(f"\n  Progreso: {len(all_valid_products)}/{total_products} productos | ", end="", flush=True)
-            
-            print(".", end="", flush=True)
-            
-            products = await fetch_products_batch(session, page, page_size)
-            
-            if products:
-                # Filtrar productos válidos
-                for product in products:
-                    if len(all_valid_products) >= total_products:
-                        break
-                    if is_valid_product(product):
-                        transformed = transform_product(product)
-                        if transformed:
-                            all_valid_products.append(transformed)
-                
-                page += 1
-            
-            # Pausa pequeña entre peticiones
-            await asyncio.sleep(0.3)
-        
-        print()  # Nueva línea después del progreso
+    async def write_batch(batch):
+        # pymongo es síncrono: se escribe en un hilo para no frenar las descargas
+        if incremental:
+            written = await asyncio.to_thread(writer.write_batch, batch)
+        else:
+            written, _ = await asyncio.to_thread(insert_idempotent, batch)
+        checkpoint.record_written(len(batch))
+        return written
     
-    # Insertar en MongoDB
-    if all_valid_products:
-        final_products = all_valid_products[:total_products]
-        print(f"\n💾 Insertando {len(final_products)} productos en MongoDB...")
-        result = foods_collection.insert_many(final_products)
-        
-        print("\n" + "="*70)
-        print("✅ IMPORTACIÓN COMPLETADA")
-        print("="*70)
-        print(f"📊 Total productos importados: {len(result.inserted_ids)}")
-        
-        # Estadísticas por categoría
-        categories = foods_collection.distinct('category', {"source": "openfoodfacts"})
-        print(f"\n📁 Categorías disponibles ({len(categories)}):")
-        for cat in sorted(categories):
-            count = foods_collection.count_documents({"category": cat, "source": "openfoodfacts"})
-            print(f"   • {cat}: {count} productos")
-        
-        # Estadísticas por fuente
-        print(f"\n📚 Productos por fuente:")
-        total_off = foods_collection.count_documents({"source": "openfoodfacts"})
-        total_manual = foods_collection.count_documents({"source": "manual"})
-        print(f"   • openfoodfacts: {total_off} productos")
-        print(f"   • manual: {total_manual} productos")
-        print(f"   • TOTAL: {total_off + total_manual} productos")
-        
-        print("\n🎉 Base de datos lista para usar!")
-        print("="*70 + "\n")
-        
-        return len(result.inserted_ids)
+    # Documentos transformados antes de la interrupción que aún no se escribieron
+    pending = []
+    for index, doc in enumerate(checkpoint.documents()):
+        seen_barcodes.add(doc["barcode"])
+        if near_duplicates:
+            # Ya eran canónicos: solo se registran para detectar sus duplicados
+            near_duplicates.filter([doc])
+        if index >= checkpoint.written:
+            pending.append(doc)
+    if pending:
+        print(f"💾 Escribiendo {len(pending)} productos pendientes del punto de control...")
+        await write_batch(pending)
+    
+    # Descargas concurrentes, transformación y escritura por lotes en paralelo
+    pipeline = OFFPipeline(
+        transform,
+        write_batch,
+        base_url=base_url,
+        cache=HTTPCache(os.path.join(state_dir, "http-cache")),
+        offline=offline,
+        on_page=checkpoint.record_page
+    )
+    
+    print(f"📥 Descargando productos de España...")
+    print(f"   Buscando {total_products} productos válidos...")
+    print(f"   [.=OK E=Error tras reintentos]")
+    print("-" * 70)
+    
+    await pipeline.run(total_products, checkpoint.pages, checkpoint.transformed)
+    # Incluye lo escrito antes de una interrupción (en modo reemplazo todo llega a la colección)
+    inserted = checkpoint.written
+    print()  # Nueva línea después del progreso
+    print(pipeline.report())
+    # Ejecución terminada: el siguiente arranque empieza desde cero (la caché HTTP se conserva)
+    checkpoint.reset()
+    
+    if near_duplicates:
+        await asyncio.to_thread(retire_superseded, near_duplicates, writer if incremental else None)
+    
+    if incremental:
+        if pipeline.complete:
+            await asyncio.to_thread(writer.mark_stale)
+        else:
+            print("\nℹ️  Descarga parcial: no se marcan productos desaparecidos")
+        print(f"\n🔁 Resultado incremental:")
+        print(writer.report())
+        inserted = sum(writer.counts[key] for key in ("inserted", "updated", "unchanged"))
+    
+    if near_duplicates:
+        print_dedup(near_duplicates, dedup_report)
+    
+    # Los recuentos por categoría se recalculan con una sola agregación
+    facets.load_groups(foods_collection.aggregate(FACET_PIPELINE))
+    
+    if inserted:
+        print_summary(facets, inserted)
+        return inserted
     else:
         print("\n" + "="*70)
         print("❌ NO SE PUDIERON IMPORTAR PRODUCTOS")
@@ -309,6 +276,158 @@ async def import_from_openfoodfacts(total_products=500):
         print("="*70 + "\n")
         return 0
 
+def import_from_dump(
+    path,
+    incremental=False,
+    country=DEFAULT_COUNTRY,
+    batch_size=1000,
+    workers=None,
+    dedup=False,
+    dedup_report=DEDUP_REPORT
+):
+    """
+    Importar desde un volcado local de Open Food Facts (JSONL o CSV, .gz), sin red
+    
+    El fichero se lee en streaming y se escribe por lotes de `batch_size`, así
+    que la memoria no crece con el tamaño del volcado. `country` filtra por
+    `countries_tags` (None para no filtrar). La lectura de JSON y la
+    transformación se reparten en bloques entre `workers` procesos (por
+    defecto, uno por CPU); el deduplicado y la escritura siguen aquí, en orden.
+    Con `dedup` también se descartan los casi duplicados (ver etl.dedup;
+    desactivado por defecto, sus códigos de barras dejan de encontrarse).
+    """
+    workers = workers or os.cpu_count() or 1
+    print("\n" + "="*70)
+    print(f"📦 IMPORTACIÓN DESDE VOLCADO: {path}")
+    print("="*70)
+    
+    facets = FacetTable()
+    if incremental:
+        writer = IncrementalWriter(foods_collection)
+        print(f"🔁 Modo incremental: {writer.load()} productos con código de barras ya importados")
+    else:
+        deleted = foods_collection.delete_many({"source": "openfoodfacts"})
+        print(f"🗑️  Eliminados {deleted.deleted_count} productos antiguos de OpenFoodFacts")
+    
+    seen_barcodes = set()
+    near_duplicates = NearDuplicateIndex() if dedup else None
+    counts = {"rows": 0, "valid": 0, "written": 0, "conflicts": 0}
+    started = time.perf_counter()
+    
+    def chunks():
+        # Una sola fecha de importación por bloque
+        for records in batched(iter_dump_records(path), TRANSFORM_CHUNK_SIZE):
+            counts["rows"] += len(records)
+            if counts["rows"] % 100_000 < len(records):
+                rate = counts["rows"] / (time.perf_counter() - started)
+                print(f"   {counts['rows']:>10} filas | {counts['valid']:>8} válidas | "
+                      f"{rate:,.0f} filas/s", flush=True)
+            yield records, country, datetime.now()
+    
+    def products():
+        for docs in map_chunks(transform_records, chunks(), workers):
+            docs = [doc for doc in docs if first_barcode(doc, seen_barcodes)]
+            if near_duplicates:
+                # Firmas MinHash de todo el bloque a la vez
+                docs = near_duplicates.filter(docs)
+            counts["valid"] += len(docs)
+            yield from docs
+    
+    for batch in batched(products(), batch_size):
+        if incremental:
+            counts["written"] += writer.write_batch(batch)
+        else:
+            # Un código que ya tiene otro producto no detiene la importación
+            inserted, conflicts = insert_idempotent(batch)
+            counts["written"] += inserted
+            counts["conflicts"] += conflicts
+    
+    elapsed = time.perf_counter() - started
+    print(f"\n⏱️  {counts['rows']} filas en {elapsed:.2f}s ({counts['rows'] / elapsed:,.0f} filas/s)")
+    print(f"   • válidas: {counts['valid']}")
+    print(f"   • escritas: {counts['written']}")
+    if counts["conflicts"]:
+        print(f"   • descartadas (código de barras de un producto existente): {counts['conflicts']}")
+    
+    if near_duplicates:
+        retire_superseded(near_duplicates, writer if incremental else None)
+    
+    if incremental:
+        # Un volcado es completo: lo que no aparece ya no existe en origen
+        writer.mark_stale()
+        print(f"\n🔁 Resultado incremental:")
+        print(writer.report())
+    
+    if near_duplicates:
+        print_dedup(near_duplicates, dedup_report)
+    
+    # Recuentos finales con una sola agregación (no se guarda nada por documento)
+    facets.load_groups(foods_collection.aggregate(FACET_PIPELINE))
+    print_summary(facets, counts["valid"])
+    return counts["valid"]
+
 if __name__ == "__main__":
-    # Importar 500 productos de España
-    asyncio.run(import_from_openfoodfacts(500))
+    parser = argparse.ArgumentParser(description="Importar alimentos desde Open Food Facts España")
+    parser.add_argument("--total", type=int, default=500, help="Productos válidos a importar")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Actualizar por código de barras en lugar de borrar y volver a insertar"
+    )
+    parser.add_argument(
+        "--dump",
+        help="Volcado local de Open Food Facts (.jsonl, .csv, opcionalmente .gz) en lugar de la API"
+    )
+    parser.add_argument(
+        "--country",
+        default=DEFAULT_COUNTRY,
+        help="Filtrar el volcado por countries_tags ('' para no filtrar)"
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Usar solo las páginas guardadas en la caché HTTP (sin red)"
+    )
+    parser.add_argument(
+        "--fresh",
+        action="store_true",
+        help="Ignorar el punto de control de una ejecución interrumpida"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Procesos para transformar el volcado (por defecto, uno por CPU)"
+    )
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="Descartar productos casi duplicados (sus códigos de barras dejan de encontrarse)"
+    )
+    parser.add_argument(
+        "--dedup-report",
+        default=DEDUP_REPORT,
+        help="Fichero JSON del informe de casi duplicados"
+    )
+    args = parser.parse_args()
+    try:
+        if args.dump:
+            import_from_dump(
+                args.dump,
+                incremental=args.incremental,
+                country=args.country or None,
+                workers=args.workers,
+                dedup=args.dedup,
+                dedup_report=args.dedup_report
+            )
+        else:
+            # Importar 500 productos de España (por defecto)
+            asyncio.run(import_from_openfoodfacts(
+                args.total,
+                incremental=args.incremental,
+                offline=args.offline,
+                fresh=args.fresh,
+                dedup=args.dedup,
+                dedup_report=args.dedup_report
+            ))
+    finally:
+        close_clients()
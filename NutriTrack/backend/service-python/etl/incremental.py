@@ -0,0 +1,137 @@
+"""Importación incremental: upsert por código de barras sin borrar el catálogo"""
+from typing import Dict, List, Optional, Set, Tuple
+from datetime import datetime
+import hashlib
+import json
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+# Campos que forman el contenido del producto; si no cambian, no se reescribe
+PAYLOAD_FIELDS = (
+    "name", "brand", "category", "nutritional_info_per_100g", "portions", "nutriscore"
+)
+
+# Códigos por consulta al marcar productos desaparecidos
+STALE_CHUNK_SIZE = 1000
+
+
+def payload_hash(doc: dict) -> str:
+    """Huella estable del contenido de un producto"""
+    payload = {field: doc.get(field) for field in PAYLOAD_FIELDS}
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+
+class IncrementalWriter:
+    """
+    Escritor por lotes que actualiza por `barcode` en lugar de reemplazar todo
+
+    Al empezar carga la huella (`payload_hash`) de los productos existentes de
+    la fuente. Cada lote se envía como un `bulk_write` desordenado de upserts
+    y se omiten los productos cuya huella no ha cambiado. Los productos que
+    ya no aparecen se marcan con `stale: true` en lugar de borrarse.
+    """
+
+    def __init__(self, collection, source: str = "openfoodfacts"):
+        self.collection = collection
+        self.source = source
+        self.counts = {
+            "inserted": 0, "updated": 0, "unchanged": 0, "stale": 0,
+            "without_barcode": 0, "conflicts": 0
+        }
+        # barcode -> (huella, marcado como desaparecido)
+        self._known: Dict[str, Tuple[Optional[str], bool]] = {}
+        self._seen: Set[str] = set()
+
+    def load(self) -> int:
+        """Cargar las huellas de los productos existentes de la fuente"""
+        cursor = self.collection.find(
+            {"source": self.source, "barcode": {"$gt": ""}},
+            {"barcode": 1, "payload_hash": 1, "stale": 1}
+        )
+        self._known = {
+            doc["barcode"]: (doc.get("payload_hash"), bool(doc.get("stale")))
+            for doc in cursor
+        }
+        return len(self._known)
+
+    def write_batch(self, batch: List[dict]) -> int:
+        """Escribir un lote; devuelve cuántos documentos se insertaron o actualizaron"""
+        now = datetime.now()
+        operations = []
+        for doc in batch:
+            barcode = doc.get("barcode")
+            if not barcode:
+                # Sin código no hay forma de reconocer el producto en la siguiente importación
+                self.counts["without_barcode"] += 1
+                continue
+            self._seen.add(barcode)
+            digest = payload_hash(doc)
+            known = self._known.get(barcode)
+            if known is not None and known == (digest, False):
+                self.counts["unchanged"] += 1
+                continue
+
+            fields = {key: value for key, value in doc.items() if key not in ("_id", "created_at")}
+            fields["payload_hash"] = digest
+            fields["updated_at"] = now
+            operations.append(UpdateOne(
+                {"barcode": barcode, "source": self.source},
+                {
+                    "$set": fields,
+                    "$setOnInsert": {"created_at": doc.get("created_at") or now},
+                    "$unset": {"stale": ""}
+                },
+                upsert=True
+            ))
+            self._known[barcode] = (digest, False)
+
+        if not operations:
+            return 0
+        try:
+            result = self.collection.bulk_write(operations, ordered=False).bulk_api_result
+        except BulkWriteError as error:
+            # Un producto manual con el mismo código tiene prioridad: esa operación se descarta
+            result = error.details
+            self.counts["conflicts"] += len(result.get("writeErrors", []))
+        self.counts["inserted"] += result.get("nUpserted", 0)
+        self.counts["updated"] += result.get("nMatched", 0)
+        return result.get("nUpserted", 0) + result.get("nMatched", 0)
+
+    def _mark(self, barcodes: List[str]) -> None:
+        now = datetime.now()
+        for start in range(0, len(barcodes), STALE_CHUNK_SIZE):
+            result = self.collection.update_many(
+                {"source": self.source, "barcode": {"$in": barcodes[start:start + STALE_CHUNK_SIZE]}},
+                {"$set": {"stale": True, "updated_at": now}}
+            )
+            self.counts["stale"] += result.modified_count
+        for barcode in barcodes:
+            self._known[barcode] = (self._known.get(barcode, (None, False))[0], True)
+
+    def mark_stale(self) -> int:
+        """Marcar los productos de la fuente que no han aparecido en esta importación"""
+        self._mark([
+            barcode for barcode, (_, stale) in self._known.items()
+            if barcode not in self._seen and not stale
+        ])
+        return self.counts["stale"]
+
+    def retire(self, barcodes: List[str]) -> int:
+        """Marcar como desaparecidos productos ya escritos que otro ha sustituido (deduplicado)"""
+        self._seen.difference_update(barcodes)
+        self._mark(list(barcodes))
+        return self.counts["stale"]
+
+    def report(self) -> str:
+        """Resumen de la importación incremental"""
+        labels = {
+            "inserted": "nuevos",
+            "updated": "actualizados",
+            "unchanged": "sin cambios",
+            "stale": "marcados como desaparecidos",
+            "without_barcode": "omitidos sin código de barras",
+            "conflicts": "omitidos por coincidir con un producto manual"
+        }
+        return "\n".join(f"   • {labels[key]}: {value}" for key, value in self.counts.items())
@@ -0,0 +1,304 @@
+"""Descarga en paralelo de Open Food Facts: páginas -> transformación -> escritura por lotes"""
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+from collections import defaultdict
+from urllib.parse import urlsplit
+import asyncio
+import os
+import random
+import time
+
+import aiohttp
+
+from etl.state import HTTPCache
+
+# Se puede apuntar a un servidor local para pruebas (OFF_BASE_URL=http://localhost:8080)
+BASE_URL = os.getenv("OFF_BASE_URL", "https://es.openfoodfacts.org")
+
+# Estados HTTP que merecen reintento (límite de peticiones y errores del servidor)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Fin de cola
+_DONE = object()
+
+
+def search_params(page: int, page_size: int) -> Dict[str, str]:
+    """Parámetros de búsqueda de productos vendidos en España"""
+    return {
+        "search_simple": "1",
+        "action": "process",
+        "json": "1",
+        "page": str(page),
+        "page_size": str(page_size),
+        "sort_by": "unique_scans_n",
+        "tagtype_0": "countries",
+        "tag_contains_0": "contains",
+        "tag_0": "españa"
+    }
+
+
+class HostRateLimiter:
+    """Separación mínima entre peticiones al mismo host (cortesía con la API)"""
+
+    def __init__(self, requests_per_second: float):
+        self.interval = 1 / requests_per_second if requests_per_second > 0 else 0
+        self._next: Dict[str, float] = {}
+        self._locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    async def wait(self, url: str) -> None:
+        host = urlsplit(url).netloc
+        loop = asyncio.get_running_loop()
+        # Se reserva el turno con el candado y se espera fuera de él
+        async with self._locks[host]:
+            now = loop.time()
+            start = max(now, self._next.get(host, now))
+            self._next[host] = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class StageStats:
+    """Elementos procesados y tiempo activo de una etapa"""
+
+    def __init__(self, name: str, unit: str):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.errors = 0
+        self.busy = 0.0
+
+    def summary(self, elapsed: float) -> str:
+        rate = self.items / elapsed if elapsed else 0.0
+        text = f"{self.name:<12} {self.items:>7} {self.unit:<10} {rate:>9.1f}/s"
+        text += f"   ocupado {self.busy:6.2f}s"
+        if self.errors:
+            text += f"   errores {self.errors}"
+        return text
+
+
+class OFFPipeline:
+    """
+    Importador en etapas conectadas por colas asyncio acotadas
+
+    - N descargadores de páginas, con un semáforo de peticiones simultáneas,
+      separación mínima por host y reintentos con espera exponencial.
+    - Una etapa de transformación (validación, formato y deduplicado).
+    - Un escritor que agrupa los documentos en lotes.
+
+    Las colas acotadas frenan a las etapas rápidas si una lenta se atasca. En
+    cuanto se alcanza `total_products` se dejan de pedir páginas nuevas.
+
+    Con `cache` las páginas se guardan en disco y se revalidan con ETag; con
+    `offline` solo se usan las páginas ya guardadas, sin red. `on_page` recibe
+    los documentos de cada página transformada (para puntos de control).
+    """
+
+    def __init__(
+        self,
+        transform: Callable[[dict], Optional[dict]],
+        write_batch: Callable[[List[dict]], Awaitable[int]],
+        base_url: str = BASE_URL,
+        fetchers: int = 4,
+        max_concurrency: int = 4,
+        requests_per_second: float = 3.0,
+        page_size: int = 50,
+        batch_size: int = 200,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        queue_size: int = 8,
+        cache: Optional[HTTPCache] = None,
+        offline: bool = False,
+        on_page: Optional[Callable[[int, List[dict]], None]] = None
+    ):
+        self.transform = transform
+        self.write_batch = write_batch
+        self.base_url = base_url.rstrip("/")
+        self.fetchers = fetchers
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.queue_size = queue_size
+        self.cache = cache
+        self.offline = offline
+        self.on_page = on_page
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._rate_limiter = HostRateLimiter(requests_per_second)
+        self.stats = {
+            "fetch": StageStats("descarga", "páginas"),
+            "transform": StageStats("transformar", "productos"),
+            "write": StageStats("escritura", "docs")
+        }
+        # True si se recorrieron todos los resultados sin errores ni corte por `total_products`
+        self.complete = False
+
+    async def fetch_page(self, session: aiohttp.ClientSession, page: int) -> Optional[List[dict]]:
+        """Productos de una página (None si falla tras todos los reintentos)"""
+        url = f"{self.base_url}/cgi/search.pl"
+        params = search_params(page, self.page_size)
+        cached = self.cache.get(url, params) if self.cache else None
+        if self.offline:
+            # Sin red: una página que no está en la caché se trata como el final
+            if cached is None:
+                return []
+            self.cache.hits += 1
+            return cached["body"].get("products", [])
+
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                await self._rate_limiter.wait(url)
+                async with self._semaphore:
+                    headers = HTTPCache.validators(cached)
+                    async with session.get(url, params=params, headers=headers) as response:
+                        if response.status == 304 and cached is not None:
+                            self.cache.hits += 1
+                            return cached["body"].get("products", [])
+                        if response.status == 200:
+                            data = await response.json(content_type=None)
+                            if self.cache:
+                                self.cache.misses += 1
+                                self.cache.put(url, params, data, response.headers)
+                            return data.get("products", [])
+                        if response.status not in RETRY_STATUSES:
+                            return None
+                        retry_after = response.headers.get("Retry-After")
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                pass
+
+            if attempt < self.max_retries:
+                delay = self.backoff_base * 2 ** attempt * (1 + random.random())
+                if retry_after and retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+                await asyncio.sleep(delay)
+        return None
+
+    async def run(
+        self,
+        total_products: int,
+        skip_pages: Iterable[int] = (),
+        accepted: int = 0
+    ) -> int:
+        """
+        Ejecutar la importación; devuelve el número de documentos escritos
+
+        Al reanudar, `skip_pages` son las páginas ya procesadas y `accepted` los
+        productos válidos que ya se obtuvieron de ellas.
+        """
+        skip_pages = set(skip_pages)
+        pages: asyncio.Queue = asyncio.Queue(self.queue_size)
+        raw: asyncio.Queue = asyncio.Queue(self.queue_size)
+        docs: asyncio.Queue = asyncio.Queue(self.batch_size * 2)
+        enough = asyncio.Event()
+        exhausted = asyncio.Event()
+        # Páginas de sobra por si algunas fallan o traen productos no válidos
+        max_pages = (total_products // self.page_size + 2) * 2
+        last_page = max_pages
+
+        async def produce_pages():
+            for page in range(1, max_pages + 1):
+                if enough.is_set() or page > last_page:
+                    break
+                if page not in skip_pages:
+                    await pages.put(page)
+            for _ in range(self.fetchers):
+                await pages.put(_DONE)
+
+        async def fetch(session):
+            nonlocal last_page
+            stats = self.stats["fetch"]
+            while (page := await pages.get()) is not _DONE:
+                if enough.is_set() or page > last_page:
+                    continue
+                started = time.perf_counter()
+                products = await self.fetch_page(session, page)
+                stats.busy += time.perf_counter() - started
+                if products is None:
+                    stats.errors += 1
+                    print("E", end="", flush=True)
+                    continue
+                stats.items += 1
+                print(".", end="", flush=True)
+                if not products:
+                    # Página vacía: no hay más resultados a partir de aquí
+                    last_page = min(last_page, page - 1)
+                    exhausted.set()
+                    continue
+                await raw.put((page, products))
+
+        async def transform():
+            nonlocal accepted
+            stats = self.stats["transform"]
+            if accepted >= total_products:
+                enough.set()
+            while (item := await raw.get()) is not _DONE:
+                if enough.is_set():
+                    continue
+                page, products = item
+                started = time.perf_counter()
+                ready = []
+                for product in products:
+                    stats.items += 1
+                    doc = self.transform(product)
+                    if doc is not None:
+                        ready.append(doc)
+                        accepted += 1
+                        if accepted >= total_products:
+                            enough.set()
+                            break
+                if self.on_page:
+                    self.on_page(page, ready)
+                stats.busy += time.perf_counter() - started
+                for doc in ready:
+                    await docs.put(doc)
+            await docs.put(_DONE)
+
+        async def write():
+            stats = self.stats["write"]
+            batch = []
+            while True:
+                doc = await docs.get()
+                if doc is not _DONE:
+                    batch.append(doc)
+                if batch and (doc is _DONE or len(batch) >= self.batch_size):
+                    started = time.perf_counter()
+                    stats.items += await self.write_batch(batch)
+                    stats.busy += time.perf_counter() - started
+                    batch = []
+                if doc is _DONE:
+                    return
+
+        started = time.perf_counter()
+        timeout = aiohttp.ClientTimeout(total=30)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            fetchers = [asyncio.create_task(fetch(session)) for _ in range(self.fetchers)]
+
+            async def coordinate():
+                await produce_pages()
+                await asyncio.gather(*fetchers)
+                await raw.put(_DONE)
+
+            tasks = fetchers + [
+                asyncio.create_task(transform()),
+                asyncio.create_task(write()),
+                asyncio.create_task(coordinate())
+            ]
+            # Si una etapa falla se cancelan las demás en lugar de quedar bloqueadas en las colas
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in pending:
+                task.cancel()
+            for task in done:
+                task.result()
+        self.elapsed = time.perf_counter() - started
+        self.complete = (
+            exhausted.is_set() and not enough.is_set() and not self.stats["fetch"].errors
+            and not self.offline and not skip_pages
+        )
+        return self.stats["write"].items
+
+    def report(self) -> str:
+        """Resumen de rendimiento por etapa"""
+        lines = [f"⏱️  {self.elapsed:.2f}s en total"]
+        lines += [f"   {stage.summary(self.elapsed)}" for stage in self.stats.values()]
+        if self.cache:
+            lines.append(f"   caché HTTP   {self.cache.hits} reutilizadas, {self.cache.misses} descargadas")
+        return "\n".join(lines)
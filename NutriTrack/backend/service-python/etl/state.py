@@ -0,0 +1,151 @@
+"""Estado en disco del importador: caché HTTP con revalidación y puntos de control"""
+from typing import Dict, Iterator, List, Optional, Set
+from urllib.parse import urlencode
+import hashlib
+import json
+import os
+
+from bson import json_util
+
+# Directorio de estado (caché de páginas y punto de control de la última ejecución)
+STATE_DIR = os.getenv("ETL_STATE_DIR", os.path.join(os.path.dirname(__file__), ".state"))
+
+
+def _write_atomic(path: str, content: str) -> None:
+    """Escribir un fichero completo o nada (rename atómico)"""
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as handle:
+        handle.write(content)
+    os.replace(temporary, path)
+
+
+class HTTPCache:
+    """
+    Respuestas de la API guardadas en disco, indexadas por URL y parámetros
+
+    Junto al cuerpo se guardan `ETag` y `Last-Modified` para revalidar con
+    `If-None-Match` / `If-Modified-Since`: si el servidor responde 304 se
+    reutiliza la copia local sin volver a descargarla.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url: str, params: Dict[str, str]) -> str:
+        key = hashlib.sha1(f"{url}?{urlencode(sorted(params.items()))}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, url: str, params: Dict[str, str]) -> Optional[dict]:
+        """Entrada guardada ({"etag", "last_modified", "body"}) o None"""
+        try:
+            with open(self._path(url, params), encoding="utf-8") as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, url: str, params: Dict[str, str], body: dict, headers) -> None:
+        entry = {
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "body": body
+        }
+        _write_atomic(self._path(url, params), json.dumps(entry, ensure_ascii=False))
+
+    @staticmethod
+    def validators(entry: Optional[dict]) -> Dict[str, str]:
+        """Cabeceras de petición condicional para una entrada guardada"""
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+
+class ImportCheckpoint:
+    """
+    Punto de control de una importación desde la API
+
+    Guarda en `checkpoint.json` los parámetros de la ejecución, las páginas
+    ya transformadas y cuántos documentos se han escrito, y en
+    `transformed.jsonl` los documentos transformados en el orden en que se
+    entregan al escritor. Si la ejecución se interrumpe, la siguiente con los
+    mismos parámetros retoma desde ahí.
+    """
+
+    def __init__(self, directory: str, params: dict):
+        self.directory = directory
+        self.params = params
+        self.pages: Set[int] = set()
+        self.transformed = 0
+        self.written = 0
+        os.makedirs(directory, exist_ok=True)
+        self._state_path = os.path.join(directory, "checkpoint.json")
+        self._docs_path = os.path.join(directory, "transformed.jsonl")
+
+    def load(self) -> bool:
+        """Cargar el punto de control si corresponde a los mismos parámetros"""
+        try:
+            with open(self._state_path, encoding="utf-8") as handle:
+                state = json.load(handle)
+        except (OSError, ValueError):
+            return False
+        if state.get("params") != self.params:
+            return False
+        self.pages = set(state["pages"])
+        self.transformed = state["transformed"]
+        self.written = state["written"]
+        self._truncate_documents()
+        return True
+
+    def _truncate_documents(self) -> None:
+        """Descartar documentos añadidos tras el último guardado (interrupción a medias)"""
+        if not os.path.exists(self._docs_path):
+            return
+        with open(self._docs_path, "rb+") as handle:
+            for _ in range(self.transformed):
+                if not handle.readline():
+                    break
+            handle.truncate(handle.tell())
+
+    def reset(self) -> None:
+        """Empezar desde cero"""
+        self.pages, self.transformed, self.written = set(), 0, 0
+        for path in (self._state_path, self._docs_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def save(self) -> None:
+        state = {
+            "params": self.params,
+            "pages": sorted(self.pages),
+            "transformed": self.transformed,
+            "written": self.written
+        }
+        _write_atomic(self._state_path, json.dumps(state))
+
+    def record_page(self, page: int, docs: List[dict]) -> None:
+        """Añadir los documentos de una página transformada y marcarla como hecha"""
+        with open(self._docs_path, "a", encoding="utf-8") as handle:
+            for doc in docs:
+                handle.write(json_util.dumps(doc) + "\n")
+        self.pages.add(page)
+        self.transformed += len(docs)
+        self.save()
+
+    def record_written(self, count: int) -> None:
+        self.written += count
+        self.save()
+
+    def documents(self) -> Iterator[dict]:
+        """Documentos transformados en ejecuciones anteriores, en orden"""
+        if not os.path.exists(self._docs_path):
+            return
+        with open(self._docs_path, encoding="utf-8") as handle:
+            for index, line in enumerate(handle):
+                if index >= self.transformed:
+                    return
+                yield json_util.loads(line)
@@ -0,0 +1,285 @@
+"""Transformación de productos de Open Food Facts: validación, categoría y porciones"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar
+import re
+
+from app.services.barcode import clean_barcode
+from etl.dump import DEFAULT_COUNTRY, product_from_record
+
+T = TypeVar("T")
+
+# Mapeo mejorado de categorías en español
+CATEGORY_MAPPING = {
+    'carne': 'Carnes y Embutidos', 'carnes': 'Carnes y Embutidos', 'pollo': 'Carnes y Embutidos',
+    'aves': 'Carnes y Embutidos', 'cerdo': 'Carnes y Embutidos', 'ternera': 'Carnes y Embutidos',
+    'embutido': 'Carnes y Embutidos', 'jamón': 'Carnes y Embutidos', 'chorizo': 'Carnes y Embutidos',
+    'pescado': 'Pescados y Mariscos', 'marisco': 'Pescados y Mariscos', 'salmón': 'Pescados y Mariscos',
+    'atún': 'Pescados y Mariscos', 'merluza': 'Pescados y Mariscos',
+    'lácteo': 'Lácteos', 'leche': 'Lácteos', 'queso': 'Lácteos', 'yogur': 'Lácteos',
+    'yogurt': 'Lácteos', 'nata': 'Lácteos', 'mantequilla': 'Lácteos',
+    'fruta': 'Frutas', 'manzana': 'Frutas', 'plátano': 'Frutas', 'naranja': 'Frutas',
+    'verdura': 'Verduras y Hortalizas', 'hortaliza': 'Verduras y Hortalizas',
+    'ensalada': 'Verduras y Hortalizas', 'tomate': 'Verduras y Hortalizas',
+    'legumbre': 'Legumbres', 'lenteja': 'Legumbres', 'garbanzo': 'Legumbres',
+    'cereal': 'Cereales y Granos', 'pan': 'Panadería', 'pasta': 'Cereales y Granos',
+    'arroz': 'Cereales y Granos', 'grano': 'Cereales y Granos',
+    'bebida': 'Bebidas', 'zumo': 'Bebidas', 'agua': 'Bebidas', 'café': 'Bebidas', 'té': 'Bebidas',
+    'refresco': 'Bebidas', 'snack': 'Snacks y Aperitivos', 'aperitivo': 'Snacks y Aperitivos',
+    'patata': 'Snacks y Aperitivos', 'galleta': 'Dulces y Repostería',
+    'chocolate': 'Dulces y Repostería', 'dulce': 'Dulces y Repostería', 'postre': 'Dulces y Repostería',
+    'fruto seco': 'Frutos Secos', 'nuez': 'Frutos Secos', 'almendra': 'Frutos Secos',
+    'huevo': 'Huevos', 'aceite': 'Aceites y Grasas', 'grasa': 'Aceites y Grasas',
+    'salsa': 'Salsas y Condimentos', 'condimento': 'Salsas y Condimentos',
+    'plato preparado': 'Platos Preparados', 'pizza': 'Platos Preparados',
+    # Inglés también por si acaso
+    'meat': 'Carnes y Embutidos', 'fish': 'Pescados y Mariscos', 'dairy': 'Lácteos',
+    'fruit': 'Frutas', 'vegetable': 'Verduras y Hortalizas', 'bread': 'Panadería',
+    'beverage': 'Bebidas', 'snack': 'Snacks y Aperitivos', 'dessert': 'Dulces y Repostería',
+}
+
+# Cadenas de categorías distintas que se recuerdan (se repiten mucho entre productos)
+CATEGORY_CACHE_SIZE = 65536
+
+# Registros del volcado que procesa cada tarea del pool de procesos
+TRANSFORM_CHUNK_SIZE = 2000
+
+# Porción base de todos los productos
+BASE_PORTION = {"name": "100g", "weight_grams": 100, "multiplier": 1}
+
+# Porciones extra según palabras del nombre; gana la primera regla que coincide
+PORTION_RULES = (
+    (
+        ("leche", "zumo", "bebida", "agua", "refresco"),
+        (
+            {"name": "vaso (250ml)", "weight_grams": 250, "multiplier": 2.5},
+            {"name": "taza (200ml)", "weight_grams": 200, "multiplier": 2}
+        )
+    ),
+    (
+        ("yogur", "yoghurt"),
+        ({"name": "unidad (125g)", "weight_grams": 125, "multiplier": 1.25},)
+    ),
+    (
+        ("pan", "galleta", "biscuit"),
+        (
+            {"name": "rebanada (30g)", "weight_grams": 30, "multiplier": 0.3},
+            {"name": "porción (50g)", "weight_grams": 50, "multiplier": 0.5}
+        )
+    ),
+    (
+        ("queso",),
+        (
+            {"name": "loncha (25g)", "weight_grams": 25, "multiplier": 0.25},
+            {"name": "porción (50g)", "weight_grams": 50, "multiplier": 0.5}
+        )
+    ),
+    (
+        ("pasta", "arroz", "macarrones", "espagueti"),
+        (
+            {"name": "plato (150g)", "weight_grams": 150, "multiplier": 1.5},
+            {"name": "porción (200g)", "weight_grams": 200, "multiplier": 2}
+        )
+    ),
+    (
+        ("carne", "pollo", "pescado", "ternera", "cerdo", "pechuga", "filete"),
+        (
+            {"name": "filete (150g)", "weight_grams": 150, "multiplier": 1.5},
+            {"name": "porción (200g)", "weight_grams": 200, "multiplier": 2}
+        )
+    ),
+    (
+        ("frutos secos", "almendra", "nuez", "avellana", "pistacho"),
+        ({"name": "puñado (30g)", "weight_grams": 30, "multiplier": 0.3},)
+    )
+)
+
+# Porciones extra si ninguna regla coincide
+DEFAULT_PORTIONS = (
+    {"name": "porción (150g)", "weight_grams": 150, "multiplier": 1.5},
+    {"name": "porción (200g)", "weight_grams": 200, "multiplier": 2}
+)
+
+
+class KeywordMatcher:
+    """
+    Varias palabras clave buscadas en una sola pasada con una expresión regular
+
+    Equivale a comprobar `palabra in texto` para cada palabra en orden y
+    quedarse con la primera que aparece, pero el texto se recorre en C. Las
+    alternativas van de más larga a más corta, así que en cada posición se
+    obtiene la palabra más larga; las palabras que son prefijo suyo también
+    aparecen ahí, y por eso cada una hereda la mejor prioridad de sus prefijos.
+    """
+
+    def __init__(self, keywords: Dict[str, T]):
+        words = list(keywords)
+        self.values = [keywords[word] for word in words]
+        self._priority = {
+            word: min(index for index, prefix in enumerate(words) if word.startswith(prefix))
+            for word in words
+        }
+        alternatives = sorted(words, key=len, reverse=True)
+        self._pattern = re.compile("|".join(re.escape(word) for word in alternatives))
+
+    def first(self, text: str) -> Optional[T]:
+        """Valor de la primera palabra (en orden de prioridad) contenida en `text`"""
+        best = None
+        position = 0
+        search = self._pattern.search
+        while (match := search(text, position)) is not None:
+            priority = self._priority[match.group()]
+            if best is None or priority < best:
+                best = priority
+                if best == 0:
+                    break
+            # Siguiente posición, no el final: puede haber palabras solapadas
+            position = match.start() + 1
+        return None if best is None else self.values[best]
+
+
+def _category_rules(mapping: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    """Pares (clave, categoría) en orden, sin las claves que contienen otra anterior (nunca ganarían)"""
+    rules: List[Tuple[str, str]] = []
+    for key, category in mapping.items():
+        if not any(previous in key for previous, _ in rules):
+            rules.append((key, category))
+    return tuple(rules)
+
+
+_CATEGORY_RULES = _category_rules(CATEGORY_MAPPING)
+
+_PORTION_MATCHER = KeywordMatcher({
+    word: extra for words, extra in PORTION_RULES for word in words
+})
+
+
+@lru_cache(maxsize=CATEGORY_CACHE_SIZE)
+def _category_of(categories_lower: str) -> str:
+    # La búsqueda de subcadenas de CPython es más rápida aquí que una regex combinada
+    # (cadenas largas con muchas coincidencias); la caché evita repetirla
+    for key, spanish_cat in _CATEGORY_RULES:
+        if key in categories_lower:
+            return spanish_cat
+    return "Otros"
+
+
+def determine_category(categories_str):
+    """Determinar categoría en español"""
+    if not categories_str:
+        return "Otros"
+    return _category_of(categories_str.lower())
+
+
+def create_smart_portions(product_name):
+    """Crear porciones inteligentes según el tipo de alimento"""
+    extra = _PORTION_MATCHER.first(product_name.lower())
+    return [dict(BASE_PORTION)] + [dict(portion) for portion in extra or DEFAULT_PORTIONS]
+
+
+def is_valid_product(product):
+    """Validar que el producto tenga datos de calidad"""
+    product_name = product.get("product_name", "").strip()
+    if not product_name or len(product_name) < 3:
+        return False
+    
+    nutriments = product.get("nutriments", {})
+    has_energy = (
+        nutriments.get("energy-kcal_100g") is not None or
+        nutriments.get("energy_100g") is not None
+    )
+    if not has_energy:
+        return False
+    
+    has_macros = (
+        nutriments.get("proteins_100g") is not None or
+        nutriments.get("carbohydrates_100g") is not None or
+        nutriments.get("fat_100g") is not None
+    )
+    if not has_macros:
+        return False
+    
+    return True
+
+def transform_product(product, now=None):
+    """Transformar producto de Open Food Facts a nuestro formato (`now`: fecha de importación)"""
+    try:
+        nutriments = product.get("nutriments", {})
+        product_name = product.get("product_name", "").strip()
+        
+        if not product_name:
+            return None
+        
+        calories = nutriments.get("energy-kcal_100g")
+        if calories is None:
+            energy_kj = nutriments.get("energy_100g")
+            if energy_kj:
+                calories = energy_kj / 4.184
+            else:
+                calories = 0
+        
+        categories_str = product.get("categories", "")
+        category = determine_category(categories_str)
+        portions = create_smart_portions(product_name)
+        now = now or datetime.now()
+        
+        return {
+            "name": product_name,
+            "brand": product.get("brands", "").strip() or None,
+            "category": category,
+            "nutritional_info_per_100g": {
+                "calories": round(calories, 1) if calories else 0,
+                "protein": round(nutriments.get("proteins_100g", 0), 1),
+                "carbohydrates": round(nutriments.get("carbohydrates_100g", 0), 1),
+                "fat": round(nutriments.get("fat_100g", 0), 1),
+                "fiber": round(nutriments.get("fiber_100g", 0), 1),
+                "sugar": round(nutriments.get("sugars_100g", 0), 1),
+                "sodium": round(nutriments.get("sodium_100g", 0) * 1000, 1) if nutriments.get("sodium_100g") else 0
+            },
+            "portions": portions,
+            "barcode": clean_barcode(product.get("code")),
+            "nutriscore": product.get("nutriscore_grade", "").upper() if product.get("nutriscore_grade") else None,
+            "source": "openfoodfacts",
+            "created_at": now,
+            "updated_at": now
+        }
+    except Exception:
+        return None
+
+
+def transform_records(records: Sequence, country: Optional[str] = DEFAULT_COUNTRY, now=None) -> List[dict]:
+    """Leer, filtrar, validar y transformar un bloque de registros del volcado (tarea del pool)"""
+    now = now or datetime.now()
+    docs = []
+    for record in records:
+        product = product_from_record(record, country)
+        if product is None or not is_valid_product(product):
+            continue
+        transformed = transform_product(product, now)
+        if transformed:
+            docs.append(transformed)
+    return docs
+
+
+def map_chunks(function: Callable[..., T], chunks: Iterable[tuple], workers: int) -> Iterator[T]:
+    """
+    Aplicar `function` a cada bloque de argumentos en `workers` procesos
+
+    Los resultados salen en el mismo orden que los bloques y como mucho hay
+    2 × `workers` bloques en vuelo, así que la memoria no depende del tamaño
+    de la entrada. Con un solo proceso se ejecuta aquí mismo, sin pool.
+    """
+    if workers <= 1:
+        for chunk in chunks:
+            yield function(*chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(function, *chunk))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -1,12 +1,38 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from app.routes import foods
+from contextlib import asynccontextmanager
+from pymongo.errors import PyMongoError
+from app.config.database import (
+    async_pool_monitor, close_clients, get_async_database, get_async_foods_collection
+)
+from app.config.indexes import INDEX_PLAN_CHECK, check_query_plans, ensure_indexes
+from app.routes import debug, foods
+from app.services.catalog_sync import catalog_sync
+from app.services.search_index import search_index
+import asyncio
 import os
+import time
 from dotenv import load_dotenv
 import uvicorn
 
 load_dotenv()
 
+# Tiempo máximo (segundos) del ping a MongoDB en /health/ready
+READINESS_TIMEOUT = float(os.getenv("READINESS_TIMEOUT", "2"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # El cliente de MongoDB se crea aquí, dentro del bucle de eventos de la aplicación
+    await ensure_indexes(get_async_foods_collection())
+    # Avisar (o no arrancar, con INDEX_PLAN_CHECK=strict) si alguna consulta no usa índices
+    if INDEX_PLAN_CHECK != "off":
+        await check_query_plans(get_async_foods_collection(), strict=INDEX_PLAN_CHECK == "strict")
+    # Cargar el índice de búsqueda en memoria y mantenerlo sincronizado
+    await catalog_sync.start()
+    yield
+    await catalog_sync.stop()
+    close_clients()
+
 # Crear aplicación FastAPI con documentación completa
 app = FastAPI(
     title="NutriTrack Food Service API",
@@ -26,6 +52,7 @@ app = FastAPI(
     * MongoDB para almacenamiento de datos
     * FastAPI para la API REST
     * Datos importados desde Open Food Facts
+    * Índice de búsqueda invertido en memoria (sin acentos, por prefijo)
     
     ### Base de datos:
     * **MongoDB** - Almacenamiento de catálogo de alimentos
@@ -49,8 +76,13 @@ app = FastAPI(
         {
             "name": "health",
             "description": "Endpoints de monitoreo y estado del servicio"
+        },
+        {
+            "name": "debug",
+            "description": "Métricas internas para diagnóstico de rendimiento"
         }
-    ]
+    ],
+    lifespan=lifespan
 )
 
 # Configurar CORS
@@ -61,6 +93,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cabeceras informativas que el frontend necesita poder leer
+    expose_headers=["X-Next-Cursor", "X-Fuzzy-Expanded-Terms", "X-Query-Plan"],
 )
 
 # Health check
@@ -88,8 +122,95 @@ async def health():
         "version": "1.0.0"
     }
 
+@app.get(
+    "/health/ready",
+    tags=["health"],
+    summary="Verificar si el servicio puede atender peticiones",
+    description="Ping real a MongoDB con su latencia, ocupación del pool de conexiones y estado del catálogo en memoria",
+    response_description="Estado de las dependencias del servicio",
+    responses={
+        200: {
+            "description": "Servicio listo",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "status": "ready",
+                        "service": "food-service",
+                        "version": "1.0.0",
+                        "database": {
+                            "ping_ms": 0.84,
+                            "pool": {
+                                "min_pool_size": 0,
+                                "max_pool_size": 100,
+                                "open": 3,
+                                "in_use": 1,
+                                "idle": 2,
+                                "waiting": 0,
+                                "wait_queue_timeouts": 0,
+                                "utilization": 0.01
+                            }
+                        },
+                        "catalog": {"loaded": True}
+                    }
+                }
+            }
+        },
+        503: {
+            "description": "MongoDB no responde o el catálogo aún no se ha cargado",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "status": "unavailable",
+                        "service": "food-service",
+                        "version": "1.0.0",
+                        "database": {"error": "No servers found yet", "pool": {"open": 0, "in_use": 0}},
+                        "catalog": {"loaded": False}
+                    }
+                }
+            }
+        }
+    }
+)
+async def readiness(response: Response):
+    """
+    ## Readiness Check
+    
+    A diferencia de `/health`, comprueba las dependencias: hace un `ping` a
+    MongoDB (con un límite de `READINESS_TIMEOUT` segundos) y mira si el
+    catálogo en memoria ya está cargado. Responde 503 si algo falla, para
+    que el orquestador no envíe tráfico a esta instancia.
+    
+    ### Respuesta:
+    - **status**: `ready` o `unavailable`
+    - **database.ping_ms**: Latencia del ping en milisegundos
+    - **database.pool**: Conexiones abiertas, en uso, libres y peticiones esperando una conexión
+      (`MONGO_MIN_POOL_SIZE`, `MONGO_MAX_POOL_SIZE`, `MONGO_WAIT_QUEUE_TIMEOUT_MS`)
+    - **database.error**: Motivo del fallo, si lo hay
+    - **catalog.loaded**: Índice de búsqueda en memoria cargado
+    """
+    database = {}
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(get_async_database().command("ping"), READINESS_TIMEOUT)
+        database["ping_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    except (PyMongoError, asyncio.TimeoutError) as error:
+        database["error"] = str(error) or "Tiempo de espera agotado"
+    database["pool"] = async_pool_monitor.stats()
+    
+    ready = "error" not in database and search_index.ready
+    if not ready:
+        response.status_code = 503
+    return {
+        "status": "ready" if ready else "unavailable",
+        "service": "food-service",
+        "version": "1.0.0",
+        "database": database,
+        "catalog": {"loaded": search_index.ready}
+    }
+
 # Incluir rutas
 app.include_router(foods.router)
+app.include_router(debug.router)
 
 # Documentación personalizada
 @app.get(